@@ -0,0 +1,195 @@
+# agregacoes.py
+
+import json
+import os
+from dataclasses import dataclass
+from datetime import datetime
+import pandas as pd
+import config
+import ingestao
+import regioes
+
+# --- MOTOR DE AGREGAÇÃO ---
+# Todas as métricas da rodada saem de um único agrupamento do DataFrame por
+# (loja, categoria, tratativa, comprador). As visões por loja, categoria, tratativa e
+# comprador são somas desse "cubo", que tem poucas linhas. O PDF gerencial e os e-mails
+# de gerentes e compradores são montados a partir daqui, sem reprocessar as linhas.
+#
+# Os agregados de cada execução são gravados em JSON (PASTA_AGREGADOS) para que o PDF
+# gerencial mostre a evolução das últimas execuções sem reler a planilha. Com várias regiões,
+# cada uma tem a sua subpasta e a raiz guarda os agregados consolidados (ver `combinar`).
+
+PASTA_AGREGADOS = getattr(config, "PASTA_AGREGADOS", os.path.join("Relatorios_Enviados", "agregados"))
+EXECUCOES_TENDENCIA = getattr(config, "EXECUCOES_TENDENCIA", 8)
+METRICAS = ["total", "tratadas", "divergencias", "pedidos"]
+
+
+@dataclass
+class Agregados:
+    total: int
+    por_loja: pd.DataFrame          # loja, total, tratadas, divergencias, pedidos (ordem das lojas)
+    por_categoria: pd.DataFrame     # categoria, total, tratadas, divergencias, pedidos
+    por_tratativa: pd.DataFrame     # tratativa, quantidade (da maior para a menor, sem zeros)
+    por_comprador: pd.DataFrame     # comprador, categoria, pedidos, lojas
+    divergencias_por_loja: dict     # {loja: [(produto, codigo_produto)]} na ordem da planilha
+    periodo: tuple = None           # (data_inicio, data_fim)
+    historico: list = None          # resumos de execuções anteriores (ver carregar_historico)
+
+    def da_loja(self, loja):
+        """Métricas de uma loja ({'total': ..., 'tratadas': ..., ...}); zeros se a loja não tem solicitações."""
+        linha = self.por_loja[self.por_loja["loja"] == loja]
+        if linha.empty:
+            return dict.fromkeys(METRICAS, 0)
+        return {metrica: int(linha[metrica].iloc[0]) for metrica in METRICAS}
+
+    def do_comprador(self, comprador, categoria):
+        """(pedidos, lojas) do comprador na categoria."""
+        linha = self.por_comprador[(self.por_comprador["comprador"] == comprador) & (self.por_comprador["categoria"] == categoria)]
+        if linha.empty:
+            return 0, 0
+        return int(linha["pedidos"].iloc[0]), int(linha["lojas"].iloc[0])
+
+
+def calcular_agregados(df, comprador=None, periodo=None):
+    """
+    Calcula todas as métricas da rodada em um único agrupamento. `comprador` é uma Series
+    alinhada a `df` com o e-mail do comprador de cada linha (None quando não há rota).
+    """
+    df = ingestao.normalizar_rupturas(df)
+    chaves = {"loja": df["loja"], "categoria": df["categoria"], "tratativa": df["tratativa"]}
+    if comprador is not None:
+        chaves["comprador"] = pd.Series(comprador, index=df.index, dtype=object)
+    base = pd.DataFrame({**chaves, "tratadas": df["tratada"], "divergencias": df["divergencia"], "pedidos": df["sera_feito_pedido"]})
+    cubo = (base.groupby(list(chaves), observed=True, dropna=False, sort=False)
+            .agg(total=("tratadas", "size"), tratadas=("tratadas", "sum"), divergencias=("divergencias", "sum"), pedidos=("pedidos", "sum"))
+            .reset_index())
+
+    por_loja = cubo.groupby("loja", observed=True, sort=True)[METRICAS].sum().reset_index()
+    por_categoria = cubo.groupby("categoria", observed=True, sort=True)[METRICAS].sum().reset_index()
+
+    # Mesma ordem de `value_counts`: contagem por categoria da tratativa, da maior para a menor
+    por_tratativa = cubo.groupby("tratativa", observed=False, sort=True)["total"].sum().sort_values(ascending=False)
+    por_tratativa = por_tratativa[por_tratativa > 0].reset_index()
+    por_tratativa.columns = ["tratativa", "quantidade"]
+
+    if "comprador" in cubo.columns:
+        pedidos = cubo[(cubo["pedidos"] > 0) & cubo["comprador"].notna()]
+        por_comprador = (pedidos.groupby(["comprador", "categoria"], observed=True, sort=True)
+                         .agg(pedidos=("pedidos", "sum"), lojas=("loja", "nunique")).reset_index())
+    else:
+        por_comprador = pd.DataFrame(columns=["comprador", "categoria", "pedidos", "lojas"])
+
+    # A lista de divergências é por produto, então vem das próprias linhas (normalmente poucas)
+    divergencias_por_loja = {}
+    for linha in df.loc[df["divergencia"], ["loja", "produto", "codigo_produto"]].itertuples(index=False):
+        divergencias_por_loja.setdefault(linha.loja, []).append((linha.produto, linha.codigo_produto))
+
+    return Agregados(len(df), por_loja, por_categoria, por_tratativa, por_comprador, divergencias_por_loja, periodo)
+
+
+def combinar(lista, periodo=None):
+    """
+    Agregados consolidados de várias regiões, somando as tabelas de cada uma (sem reler as linhas).
+    As lojas e os compradores de regiões diferentes são distintos, então as somas por loja e a
+    contagem de lojas por comprador continuam exatas. Retorna None se nenhuma região tiver dados.
+    """
+    lista = [agregados for agregados in lista if agregados is not None]
+    if not lista:
+        return None
+
+    def concatenar(nome):
+        # Cada região tem as suas próprias categorias (lojas, tratativas): a união é feita sobre os valores
+        tabelas = [getattr(agregados, nome) for agregados in lista]
+        return pd.concat([tabela.astype({coluna: object for coluna in tabela.select_dtypes("category").columns}) for tabela in tabelas],
+                         ignore_index=True)
+
+    por_loja = concatenar("por_loja").groupby("loja", sort=True)[METRICAS].sum().reset_index()
+    por_categoria = concatenar("por_categoria").groupby("categoria", sort=True)[METRICAS].sum().reset_index()
+    por_tratativa = concatenar("por_tratativa").groupby("tratativa", sort=True)["quantidade"].sum().sort_values(ascending=False).reset_index()
+    por_comprador = concatenar("por_comprador")
+    if not por_comprador.empty:
+        por_comprador = por_comprador.groupby(["comprador", "categoria"], sort=True)[["pedidos", "lojas"]].sum().reset_index()
+    divergencias_por_loja = {}
+    for agregados in lista:
+        for loja, itens in agregados.divergencias_por_loja.items():
+            divergencias_por_loja.setdefault(loja, []).extend(itens)
+    return Agregados(sum(agregados.total for agregados in lista), por_loja, por_categoria, por_tratativa, por_comprador,
+                     divergencias_por_loja, periodo or lista[0].periodo)
+
+
+# --- HISTÓRICO DE AGREGADOS ---
+
+def _registros(tabela):
+    return [{chave: (valor.item() if hasattr(valor, "item") else valor) for chave, valor in registro.items()}
+            for registro in tabela.astype(object).where(tabela.notna(), None).to_dict("records")]
+
+
+def para_dict(agregados):
+    inicio, fim = agregados.periodo or (None, None)
+    return {
+        "gerado_em": datetime.now().isoformat(timespec="seconds"),
+        "periodo": [inicio.isoformat(timespec="seconds") if inicio else None, fim.isoformat(timespec="seconds") if fim else None],
+        "total": int(agregados.total),
+        "tratadas": int(agregados.por_loja["tratadas"].sum()),
+        "por_loja": _registros(agregados.por_loja),
+        "por_categoria": _registros(agregados.por_categoria),
+        "por_tratativa": _registros(agregados.por_tratativa),
+        "por_comprador": _registros(agregados.por_comprador),
+    }
+
+
+def salvar(agregados, pasta=None):
+    """Grava os agregados da execução em um JSON próprio e retorna o caminho."""
+    pasta = pasta or regioes.subpasta(PASTA_AGREGADOS)
+    os.makedirs(pasta, exist_ok=True)
+    caminho = os.path.join(pasta, f"agregados_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(caminho, "w", encoding="utf-8") as arquivo:
+        json.dump(para_dict(agregados), arquivo, ensure_ascii=False, indent=2)
+    return caminho
+
+
+def _datas_iso(periodo):
+    """(início, fim) como datas ISO ('AAAA-MM-DD'), a partir de datetimes ou de textos ISO."""
+    return tuple(valor.date().isoformat() if isinstance(valor, datetime) else (valor or "")[:10] for valor in periodo or ())
+
+
+def carregar_historico(pasta=None, limite=None, periodo_atual=None):
+    """
+    Resumos ({'periodo', 'total', 'tratadas', ...}) das execuções gravadas, da mais antiga para a
+    mais recente, sem janelas sobrepostas: execuções do mesmo período (mesmas datas) contam uma
+    vez (vale a última) e, andando do período mais recente para trás, uma janela só entra se
+    terminar até a data de início da seguinte. Janelas que só se tocam nessa data (a execução
+    semanal "últimos 7 dias" começa no dia em que a anterior terminou) são vizinhas, não
+    sobrepostas. Com `periodo_atual`, a contagem começa no início dele, então a própria execução
+    e as janelas que se sobrepõem a ela ficam de fora.
+    """
+    pasta = pasta or regioes.subpasta(PASTA_AGREGADOS)
+    limite = limite or EXECUCOES_TENDENCIA
+    if not os.path.isdir(pasta):
+        return []
+    por_periodo = {}
+    for nome in sorted(os.listdir(pasta)):
+        if not (nome.startswith("agregados_") and nome.endswith(".json")):
+            continue
+        try:
+            with open(os.path.join(pasta, nome), encoding="utf-8") as arquivo:
+                registro = json.load(arquivo)
+        except (OSError, json.JSONDecodeError):
+            continue
+        inicio, fim = _datas_iso(registro.get("periodo"))[:2] or ("", "")
+        if not inicio or not fim:
+            continue
+        anterior = por_periodo.get((inicio, fim))
+        if anterior is None or registro["gerado_em"] >= anterior["gerado_em"]:
+            por_periodo[(inicio, fim)] = registro
+
+    historico = []
+    limite_fim = _datas_iso(periodo_atual)[0] if periodo_atual else None
+    for (inicio, fim), registro in sorted(por_periodo.items(), key=lambda item: item[0][1], reverse=True):
+        if limite_fim is not None and fim > limite_fim:
+            continue
+        historico.append(registro)
+        limite_fim = inicio
+        if len(historico) == limite:
+            break
+    return historico[::-1]
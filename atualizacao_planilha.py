@@ -0,0 +1,75 @@
+# atualizacao_planilha.py
+
+import config
+import regioes
+import ingestao
+
+# Limite de células por chamada de batchUpdate. Lotes menores falham de forma isolada:
+# o que já foi gravado fica registrado no diário e não é reescrito.
+LOTE_MAX_CELULAS = getattr(config, "STATUS_LOTE_MAX_CELULAS", 5000)
+
+
+def agrupar_intervalos(status_por_linha):
+    """Agrupa linhas consecutivas com o mesmo status em blocos (inicio, fim, status)."""
+    blocos = []
+    for linha in sorted(status_por_linha):
+        status = status_por_linha[linha]
+        if blocos and blocos[-1][1] == linha - 1 and blocos[-1][2] == status:
+            blocos[-1][1] = linha
+        else:
+            blocos.append([linha, linha, status])
+    return [tuple(bloco) for bloco in blocos]
+
+
+def dividir_em_lotes(blocos, max_celulas=None):
+    """Divide os blocos em lotes de até `max_celulas` células, quebrando blocos maiores que o limite."""
+    max_celulas = max_celulas or LOTE_MAX_CELULAS
+    lotes, lote, celulas = [], [], 0
+    for inicio, fim, status in blocos:
+        while inicio <= fim:
+            trecho_fim = min(fim, inicio + (max_celulas - celulas) - 1)
+            lote.append((inicio, trecho_fim, status))
+            celulas += trecho_fim - inicio + 1
+            inicio = trecho_fim + 1
+            if celulas >= max_celulas:
+                lotes.append(lote)
+                lote, celulas = [], 0
+    if lote:
+        lotes.append(lote)
+    return lotes
+
+
+def montar_atualizacoes(lote, letra_coluna, aba=None):
+    aba = aba or ingestao.nome_aba()
+    data = []
+    for inicio, fim, status in lote:
+        if inicio == fim:
+            intervalo = ingestao.intervalo(aba, f"{letra_coluna}{inicio}")
+        else:
+            intervalo = ingestao.intervalo(aba, f"{letra_coluna}{inicio}", f"{letra_coluna}{fim}")
+        data.append({'range': intervalo, 'values': [[status]] * (fim - inicio + 1)})
+    return data
+
+
+def escrever_status(service, status_por_linha, letra_coluna, diario=None, max_celulas=None):
+    """
+    Grava {linha: status} na coluna `letra_coluna` em blocos contíguos (ex.: M120:M185),
+    divididos em lotes de tamanho limitado. Cada lote gravado é registrado no diário.
+    Um HttpError interrompe a gravação e é propagado; os lotes restantes continuam pendentes.
+    Retorna o total de células atualizadas.
+    """
+    lotes = dividir_em_lotes(agrupar_intervalos(status_por_linha), max_celulas)
+    total = 0
+    for numero, lote in enumerate(lotes, 1):
+        body = {
+            'valueInputOption': 'USER_ENTERED',
+            'data': montar_atualizacoes(lote, letra_coluna)
+        }
+        result = service.spreadsheets().values().batchUpdate(
+            spreadsheetId=regioes.valor("SPREADSHEET_ID"), body=body).execute()
+        total += result.get('totalUpdatedCells', 0)
+        if diario is not None:
+            diario.registrar_marcadas(linha for inicio, fim, _ in lote for linha in range(inicio, fim + 1))
+        if len(lotes) > 1:
+            print(f"Lote {numero}/{len(lotes)} gravado ({len(body['data'])} intervalos).")
+    return total
@@ -0,0 +1,160 @@
+# benchmarks/bench_pipeline.py
+#
+# Mede as etapas do pipeline com dados sintéticos e serviços do Google falsos.
+# Uso (a partir da raiz do projeto):
+#   python -m benchmarks.bench_pipeline
+#   python -m benchmarks.bench_pipeline --tamanhos 60x20000x10 --repeticoes 3 --comparar benchmarks/resultados/anterior.json
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from benchmarks import dados_sinteticos, falsos
+
+TAMANHOS_PADRAO = ["12x2000x5", "60x20000x10", "60x60000x12"]
+PASTA_RESULTADOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resultados")
+
+
+def _cronometrar(funcao, repeticoes, preparar=None):
+    """Executa `funcao` `repeticoes` vezes (sem imprimir nada) e retorna o menor tempo em segundos."""
+    tempos = []
+    for _ in range(repeticoes):
+        if preparar:
+            preparar()
+        with contextlib.redirect_stdout(io.StringIO()):
+            inicio = time.perf_counter()
+            funcao()
+            tempos.append(time.perf_counter() - inicio)
+    return min(tempos)
+
+
+def medir_tamanho(num_lojas, num_linhas, num_categorias, repeticoes, pasta_base):
+    pasta = os.path.join(pasta_base, f"{num_lojas}x{num_linhas}x{num_categorias}")
+    pasta_gerentes = os.path.join(pasta, "gerentes")
+    pasta_compradores = os.path.join(pasta, "compradores")
+    os.makedirs(pasta_gerentes, exist_ok=True)
+    os.makedirs(pasta_compradores, exist_ok=True)
+
+    dados_sinteticos.instalar_config(num_lojas, num_categorias, os.path.join(pasta_base, "cache"))
+    import main
+    import despacho_email
+    import report_generator
+    import servicos
+    import pandas as pd
+
+    valores = dados_sinteticos.gerar_valores(num_lojas, num_linhas, num_categorias)
+    planilha = falsos.PlanilhaFalsa(valores)
+    gmail = falsos.GmailFalso()
+    servicos.construir_cliente = falsos.build_falso(planilha, gmail)
+    servicos.limpar()
+    despacho_email._transportes_gmail.clear()
+
+    data_fim = datetime.now()
+    data_inicio = data_fim - timedelta(days=7)
+    with contextlib.redirect_stdout(io.StringIO()):
+        df = main.ler_dados_planilha(None, data_inicio, data_fim, apenas_pendentes=True, incremental=False)
+
+    tempos = {}
+    tempos["ler_dados_planilha"] = _cronometrar(
+        lambda: main.ler_dados_planilha(None, data_inicio, data_fim, apenas_pendentes=True, incremental=False), repeticoes)
+    tempos["ler_dados_planilha_incremental"] = _cronometrar(
+        lambda: main.ler_dados_planilha(None, data_inicio, data_fim, apenas_pendentes=True, incremental=True), repeticoes)
+    tempos["gerar_relatorios_gerentes"] = _cronometrar(
+        lambda: report_generator.gerar_relatorios_gerentes(None, df, pasta_gerentes, main.enviar_email), repeticoes)
+    tempos["gerar_relatorios_compradores"] = _cronometrar(
+        lambda: report_generator.gerar_relatorios_compradores(None, df, pasta_compradores, main.enviar_email), repeticoes)
+
+    # formatar_excel é medido sobre a planilha sem formatação da maior loja
+    maior_loja = df["loja"].value_counts().index[0]
+    caminho_sem_formato = os.path.join(pasta, "sem_formatacao.xlsx")
+
+    def escrever_sem_formato():
+        with pd.ExcelWriter(caminho_sem_formato, engine="openpyxl") as writer:
+            df[df["loja"] == maior_loja].drop(columns=["original_index"]).to_excel(writer, sheet_name="Dados", index=False)
+
+    tempos["formatar_excel"] = _cronometrar(lambda: report_generator.formatar_excel(caminho_sem_formato), repeticoes, escrever_sem_formato)
+    tempos["gerar_relatorio_gerencial_pdf"] = _cronometrar(
+        lambda: report_generator.gerar_relatorio_gerencial_pdf(df, pasta, data_inicio, data_fim), repeticoes)
+    tempos["marcar_como_enviado"] = _cronometrar(lambda: main.marcar_como_enviado(None, df), repeticoes)
+
+    return {
+        "lojas": num_lojas,
+        "linhas": num_linhas,
+        "categorias": num_categorias,
+        "linhas_no_periodo": len(df),
+        "emails_enviados": gmail.enviadas,
+        "bytes_enviados": gmail.bytes_enviados,
+        "tempos_s": {nome: round(valor, 4) for nome, valor in tempos.items()},
+    }
+
+
+def comparar(atual, caminho_anterior):
+    with open(caminho_anterior, encoding="utf-8") as arquivo:
+        anterior = json.load(arquivo)
+    por_chave = {(r["lojas"], r["linhas"], r["categorias"]): r for r in anterior["resultados"]}
+    print(f"\nComparação com {caminho_anterior} (atual / anterior):")
+    for resultado in atual["resultados"]:
+        chave = (resultado["lojas"], resultado["linhas"], resultado["categorias"])
+        base = por_chave.get(chave)
+        if not base:
+            continue
+        print(f"  {chave[0]} lojas x {chave[1]} linhas x {chave[2]} categorias")
+        for etapa, tempo in resultado["tempos_s"].items():
+            tempo_anterior = base["tempos_s"].get(etapa)
+            if tempo_anterior:
+                print(f"    {etapa:<32} {tempo:>9.3f}s  {tempo / tempo_anterior:>6.2f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline de rupturas com dados sintéticos.")
+    parser.add_argument("--tamanhos", nargs="+", default=TAMANHOS_PADRAO,
+                        help="Tamanhos no formato LOJASxLINHASxCATEGORIAS (padrão: %(default)s).")
+    parser.add_argument("--repeticoes", type=int, default=1, help="Repetições por etapa; vale o menor tempo.")
+    parser.add_argument("--saida", default=None, help="Arquivo JSON de saída (padrão: benchmarks/resultados/bench_<data>.json).")
+    parser.add_argument("--comparar", default=None, help="JSON de uma execução anterior para comparar.")
+    args = parser.parse_args(argv)
+
+    pasta_base = tempfile.mkdtemp(prefix="bench_rupturas_")
+    resultados = []
+    try:
+        for tamanho in args.tamanhos:
+            num_lojas, num_linhas, num_categorias = (int(parte) for parte in tamanho.lower().split("x"))
+            print(f"Medindo {num_lojas} lojas x {num_linhas} linhas x {num_categorias} categorias...")
+            resultado = medir_tamanho(num_lojas, num_linhas, num_categorias, max(1, args.repeticoes), pasta_base)
+            for etapa, tempo in resultado["tempos_s"].items():
+                print(f"  {etapa:<32} {tempo:>9.3f}s")
+            resultados.append(resultado)
+    finally:
+        shutil.rmtree(pasta_base, ignore_errors=True)
+
+    import numpy
+    import pandas
+    relatorio = {
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pandas.__version__,
+        "numpy": numpy.__version__,
+        "plataforma": platform.platform(),
+        "repeticoes": args.repeticoes,
+        "resultados": resultados,
+    }
+    saida = args.saida or os.path.join(PASTA_RESULTADOS, f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(saida) or ".", exist_ok=True)
+    with open(saida, "w", encoding="utf-8") as arquivo:
+        json.dump(relatorio, arquivo, ensure_ascii=False, indent=2)
+    print(f"\nResultados salvos em {saida}")
+
+    if args.comparar:
+        comparar(relatorio, args.comparar)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
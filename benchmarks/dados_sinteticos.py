@@ -0,0 +1,109 @@
+# benchmarks/dados_sinteticos.py
+
+import random
+import sys
+import types
+from datetime import datetime, timedelta
+
+# Cabeçalho real do formulário (14 colunas; 'Status Relatorio' na coluna M)
+CABECALHO = [
+    "Carimbo de data/hora",
+    "Endereço de e-mail",
+    "Informe seu nome",
+    "Informe a loja da ruptura",
+    "Informe a categoria da ruptura",
+    "Informe o código do produto em ruptura",
+    "Informe o produto em ruptura",
+    "A quanto tempo esse produto está em ruptura?",
+    "Observação",
+    "Foto",
+    "Setor",
+    "Tratativa Comercial",
+    "Status Relatorio",
+    "Observação Comercial",
+]
+
+TRATATIVAS = ["", "", "Será feito pedido", "Verificar Estoque (Divergência)", "Produto fora de linha"]
+TEMPOS = ["Menos de 1 dia", "1 a 3 dias", "Mais de uma semana", ""]
+
+
+def nomes_lojas(num_lojas):
+    return [f"{numero:02d} - Loja {numero}" for numero in range(1, num_lojas + 1)]
+
+
+def nomes_categorias(num_categorias):
+    # 'Bebidas' existe sempre para exercitar a divisão RN1/RN2 dos compradores
+    return ["Bebidas"] + [f"Categoria {indice}" for indice in range(1, num_categorias)]
+
+
+def instalar_config(num_lojas, num_categorias, pasta_cache):
+    """Registra em sys.modules um módulo `config` sintético (nenhum e-mail real é usado)."""
+    lojas = nomes_lojas(num_lojas)
+    categorias = nomes_categorias(num_categorias)
+    numeros = list(range(1, num_lojas + 1))
+    terco = max(1, num_lojas // 3)
+
+    # Os módulos do projeto guardam a referência ao `config` importado, então o módulo
+    # sintético é reaproveitado (e só tem os atributos trocados) entre um tamanho e outro
+    config = sys.modules.get("config")
+    if not getattr(config, "SINTETICO", False):
+        config = types.ModuleType("config")
+        config.SINTETICO = True
+        sys.modules["config"] = config
+    config.SCOPES = []
+    config.SPREADSHEET_ID = "planilha-sintetica"
+    config.RANGE_NAME = "RUPTURAS LOJAS!A:N"
+    config.MEU_EMAIL_REMETENTE = "remetente@exemplo.com"
+    config.MODO_TESTE = False
+    config.EMAIL_TESTE = "teste@exemplo.com"
+    config.GERENTES_EMAILS = {loja: f"gerente.loja{numero}@exemplo.com" for numero, loja in zip(numeros, lojas)}
+    config.GERENCIAL_EMAILS = ["diretoria@exemplo.com", "gerencia@exemplo.com"]
+    config.LOJAS_PB = numeros[:terco]
+    config.LOJAS_RN1 = numeros[terco:2 * terco]
+    config.LOJAS_RN2 = numeros[2 * terco:]
+    config.COMPRADORES_PB_EMAILS = {categoria: f"comprador.pb{indice}@exemplo.com" for indice, categoria in enumerate(categorias)}
+    config.COMPRADORES_RN_EMAILS = {categoria: f"comprador.rn{indice}@exemplo.com" for indice, categoria in enumerate(categorias)}
+    config.COMPRADORES_RN_BEBIDAS = {"RN1": "bebidas.rn1@exemplo.com", "RN2": "bebidas.rn2@exemplo.com"}
+    config.PASTA_CACHE = pasta_cache
+    config.LEITURA_INCREMENTAL = False
+    # O módulo sintético só existe neste processo: os processos de construção precisam herdá-lo por fork
+    # (o benchmark e os testes não abrem outras threads enquanto o pool é criado)
+    config.INICIO_PROCESSOS = "fork"
+    return config
+
+
+def gerar_valores(num_lojas, num_linhas, num_categorias, semente=42, fim=None):
+    """
+    Gera o payload `values` que a API do Sheets devolveria: cabeçalho + `num_linhas`
+    linhas distribuídas nos últimos 7 dias, com células finais vazias omitidas como na API.
+    """
+    aleatorio = random.Random(semente)
+    fim = fim or datetime.now()
+    inicio = fim - timedelta(days=7)
+    passo = (fim - inicio) / max(num_linhas, 1)
+    lojas = nomes_lojas(num_lojas)
+    categorias = nomes_categorias(num_categorias)
+    solicitantes = [f"Colaborador {indice}" for indice in range(1, 4 * num_lojas + 1)]
+
+    valores = [list(CABECALHO)]
+    for indice in range(num_linhas):
+        carimbo = inicio + passo * indice
+        linha = [
+            carimbo.strftime("%d/%m/%Y %H:%M:%S"),
+            "colaborador@exemplo.com",
+            aleatorio.choice(solicitantes),
+            aleatorio.choice(lojas),
+            aleatorio.choice(categorias),
+            str(aleatorio.randint(1000, 7899999999999)),
+            f"Produto {aleatorio.randint(1, 5000)}",
+            aleatorio.choice(TEMPOS),
+            "",
+            "",
+            "",
+            aleatorio.choice(TRATATIVAS),
+            "Enviado em 2024-01-01 08:00" if aleatorio.random() < 0.1 else "",
+        ]
+        while linha and linha[-1] == "":
+            linha.pop()
+        valores.append(linha)
+    return valores
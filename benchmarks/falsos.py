@@ -0,0 +1,99 @@
+# benchmarks/falsos.py
+
+import re
+from openpyxl.utils import column_index_from_string
+
+# --- SERVIÇOS FALSOS DO GOOGLE (EM PROCESSO) ---
+# Imitam apenas as chamadas usadas pelo projeto: spreadsheets().values().get/batchGet/batchUpdate
+# e users().messages().send. Cada chamada fica registrada em `chamadas` para conferência.
+
+
+class _Requisicao:
+    def __init__(self, resposta):
+        self._resposta = resposta
+
+    def execute(self):
+        return self._resposta
+
+
+def _celula(referencia):
+    coluna, linha = re.match(r"([A-Z]*)(\d*)$", referencia).groups()
+    return (column_index_from_string(coluna) if coluna else None), (int(linha) if linha else None)
+
+
+class PlanilhaFalsa:
+    """Planilha em memória: `linhas` é a lista de linhas da aba, a primeira sendo o cabeçalho."""
+
+    def __init__(self, linhas):
+        self.linhas = linhas
+        self.chamadas = []
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def _ler(self, intervalo):
+        referencia = intervalo.split("!", 1)[1] if "!" in intervalo else intervalo
+        inicio, _, fim = referencia.partition(":")
+        coluna_inicio, linha_inicio = _celula(inicio)
+        coluna_fim, linha_fim = _celula(fim or inicio)
+        linhas = self.linhas[(linha_inicio or 1) - 1:linha_fim or len(self.linhas)]
+        valores = []
+        for linha in linhas:
+            trecho = linha[(coluna_inicio or 1) - 1:coluna_fim]
+            while trecho and trecho[-1] == "":
+                trecho = trecho[:-1]
+            valores.append(list(trecho))
+        while valores and not valores[-1]:
+            valores.pop()
+        resposta = {"range": intervalo}
+        if valores:
+            resposta["values"] = valores
+        return resposta
+
+    def get(self, spreadsheetId, range):
+        self.chamadas.append(("get", range))
+        return _Requisicao(self._ler(range))
+
+    def batchGet(self, spreadsheetId, ranges):
+        self.chamadas.append(("batchGet", ranges))
+        return _Requisicao({"valueRanges": [self._ler(intervalo) for intervalo in ranges]})
+
+    def batchUpdate(self, spreadsheetId, body):
+        self.chamadas.append(("batchUpdate", len(body["data"])))
+        celulas = 0
+        for atualizacao in body["data"]:
+            referencia = atualizacao["range"].split("!", 1)[1]
+            coluna, linha = _celula(referencia.split(":")[0])
+            for deslocamento, valores in enumerate(atualizacao["values"]):
+                destino = self.linhas[linha - 1 + deslocamento]
+                destino.extend([""] * (coluna - len(destino)))
+                destino[coluna - 1] = valores[0]
+                celulas += 1
+        return _Requisicao({"totalUpdatedCells": celulas})
+
+
+class GmailFalso:
+    def __init__(self):
+        self.enviadas = 0
+        self.bytes_enviados = 0
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def send(self, userId, body, media_body=None):
+        self.enviadas += 1
+        self.bytes_enviados += media_body.size() if media_body is not None else len(body.get("raw", ""))
+        return _Requisicao({"id": f"falso-{self.enviadas}"})
+
+
+def build_falso(planilha, gmail):
+    """Substituto de servicos.construir_cliente que devolve os serviços falsos."""
+    def build(nome_api, versao, *args, **kwargs):
+        return gmail if nome_api == "gmail" else planilha
+    return build
@@ -0,0 +1,231 @@
+# cache_artefatos.py
+
+import dataclasses
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import Future
+from datetime import date, datetime
+import pandas as pd
+import config
+import report_generator
+
+# --- CACHE DE ARTEFATOS E LIVRO DE ENVIOS ---
+# Cada artefato recebe uma chave (SHA-256) calculada a partir dos seus dados de entrada
+# (as abas da planilha ou os agregados do PDF) e da versão dos modelos. Arquivos já gerados
+# com a mesma chave são reaproveitados em vez de reconstruídos, e o livro de envios guarda
+# (destinatário, assunto, corpo, chave do anexo) de cada e-mail entregue para não reenviar
+# um conteúdo idêntico quando a mesma rodada é repetida. A chave do livro leva as datas do
+# período: só a repetição do mesmo período é suprimida, e o lembrete das pendências de uma loja
+# continua saindo nas execuções seguintes, mesmo que nada tenha mudado.
+#
+# Os arquivos do cache ficam em PASTA_CACHE_ARTEFATOS/<2 primeiros caracteres>/<chave>.<ext>
+# e são removidos por idade e, acima do limite de tamanho, do menos usado para o mais usado.
+
+PASTA_CACHE_ARTEFATOS = getattr(config, "PASTA_CACHE_ARTEFATOS", os.path.join("Relatorios_Enviados", ".artefatos"))
+ARQUIVO_LIVRO = os.path.join(PASTA_CACHE_ARTEFATOS, "envios.jsonl")
+CACHE_MAX_MB = getattr(config, "CACHE_ARTEFATOS_MAX_MB", 500)
+CACHE_MAX_DIAS = getattr(config, "CACHE_ARTEFATOS_MAX_DIAS", 60)
+RETENCAO_RELATORIOS_DIAS = getattr(config, "RETENCAO_RELATORIOS_DIAS", 180)
+
+
+def _atualizar(h, valor):
+    """Alimenta o hash com uma representação estável de `valor`."""
+    if isinstance(valor, pd.DataFrame):
+        h.update(repr([(str(nome), str(tipo)) for nome, tipo in valor.dtypes.items()]).encode())
+        h.update(pd.util.hash_pandas_object(valor, index=False).to_numpy().tobytes())
+    elif dataclasses.is_dataclass(valor):
+        for campo in dataclasses.fields(valor):
+            h.update(campo.name.encode())
+            _atualizar(h, getattr(valor, campo.name))
+    elif isinstance(valor, (list, tuple)):
+        h.update(f"[{len(valor)}".encode())
+        for item in valor:
+            _atualizar(h, item)
+    elif isinstance(valor, dict):
+        h.update(json.dumps(valor, sort_keys=True, default=str, ensure_ascii=False).encode())
+    elif isinstance(valor, (datetime, date)):
+        h.update(valor.isoformat().encode())
+    else:
+        h.update(repr(valor).encode())
+    h.update(b"|")
+
+
+def datas_do_periodo(periodo):
+    """Só as datas de (início, fim): janelas como 'últimos N dias' mudam de hora a cada execução."""
+    if not periodo:
+        return None
+    return tuple(valor.date() if isinstance(valor, datetime) else valor for valor in periodo)
+
+
+def _dados_do_pdf(agregados):
+    """Agregados do PDF sem o que muda entre execuções sem mudar o PDF (hora do período e da gravação)."""
+    historico = [{chave: valor for chave, valor in registro.items() if chave != "gerado_em"}
+                 for registro in agregados.historico or []]
+    return dataclasses.replace(agregados, periodo=datas_do_periodo(agregados.periodo), historico=historico)
+
+
+def chave_artefato(artefato):
+    """Chave do conteúdo do anexo: tipo, versão dos modelos, extensão e dados de entrada."""
+    h = hashlib.sha256()
+    extensao = os.path.splitext(artefato.caminho)[1]
+    _atualizar(h, (artefato.tipo, report_generator.VERSAO_MODELOS, extensao, datas_do_periodo(artefato.periodo)))
+    _atualizar(h, artefato.abas if artefato.abas is not None else _dados_do_pdf(artefato.dados))
+    return h.hexdigest()
+
+
+def _materializar(origem, destino):
+    """Coloca `origem` em `destino` com um hard link (sem copiar os bytes) ou, se não der, uma cópia."""
+    os.makedirs(os.path.dirname(destino) or ".", exist_ok=True)
+    if os.path.exists(destino):
+        if os.path.samefile(origem, destino):
+            return
+        os.remove(destino)
+    try:
+        os.link(origem, destino)
+    except OSError:
+        shutil.copy2(origem, destino)
+
+
+class CacheArtefatos:
+    def __init__(self, pasta=None):
+        self.pasta = pasta or PASTA_CACHE_ARTEFATOS
+
+    def _caminho(self, chave, extensao):
+        return os.path.join(self.pasta, chave[:2], chave + extensao)
+
+    def obter(self, chave, destino):
+        """Se houver um arquivo com esta chave, coloca-o em `destino` e retorna True."""
+        caminho = self._caminho(chave, os.path.splitext(destino)[1])
+        if not os.path.exists(caminho):
+            return False
+        os.utime(caminho)  # a data de modificação marca o último uso (ordem do LRU)
+        _materializar(caminho, destino)
+        return True
+
+    def guardar(self, chave, origem):
+        _materializar(origem, self._caminho(chave, os.path.splitext(origem)[1]))
+
+    def limpar(self, max_mb=None, max_dias=None):
+        """Remove os arquivos sem uso há mais de `max_dias` e, acima de `max_mb`, os menos usados."""
+        max_bytes = (max_mb if max_mb is not None else CACHE_MAX_MB) * 1024 * 1024
+        limite = time.time() - (max_dias if max_dias is not None else CACHE_MAX_DIAS) * 86400
+        arquivos = []
+        for pasta, _, nomes in os.walk(self.pasta):
+            for nome in nomes:
+                caminho = os.path.join(pasta, nome)
+                if caminho == os.path.join(self.pasta, os.path.basename(ARQUIVO_LIVRO)):
+                    continue
+                info = os.stat(caminho)
+                arquivos.append((info.st_mtime, info.st_size, caminho))
+        arquivos.sort()
+        total = sum(tamanho for _, tamanho, _ in arquivos)
+        removidos = 0
+        for modificado, tamanho, caminho in arquivos:
+            if modificado >= limite and total <= max_bytes:
+                break
+            os.remove(caminho)
+            total -= tamanho
+            removidos += 1
+        return removidos
+
+
+class LivroEnvios:
+    """
+    Registro (JSONL) dos e-mails entregues, para suprimir o reenvio de um conteúdo idêntico no
+    mesmo `periodo` (início, fim) da rodada.
+    """
+
+    def __init__(self, caminho=None, suprimir=True, periodo=None):
+        self.caminho = caminho or ARQUIVO_LIVRO
+        self.suprimir = suprimir
+        self.periodo = datas_do_periodo(periodo)
+        self._lock = threading.Lock()
+        self._enviados = set()
+        if os.path.exists(self.caminho):
+            with open(self.caminho, encoding="utf-8") as arquivo:
+                for linha in arquivo:
+                    try:
+                        self._enviados.add(json.loads(linha)["chave"])
+                    except (json.JSONDecodeError, KeyError):
+                        continue
+
+    def chave(self, destinatario, assunto, corpo_html, chave_anexo):
+        h = hashlib.sha256()
+        periodo = "/".join(data.isoformat() for data in self.periodo) if self.periodo else ""
+        for parte in (periodo, destinatario, assunto, corpo_html, chave_anexo or ""):
+            h.update(parte.encode())
+            h.update(b"|")
+        return h.hexdigest()
+
+    def ja_enviado(self, chave):
+        return self.suprimir and chave in self._enviados
+
+    def registrar(self, chave, destinatario, assunto):
+        with self._lock:
+            if chave in self._enviados:
+                return
+            self._enviados.add(chave)
+            os.makedirs(os.path.dirname(self.caminho) or ".", exist_ok=True)
+            with open(self.caminho, "a", encoding="utf-8") as arquivo:
+                registro = {"chave": chave, "destinatario": destinatario, "assunto": assunto,
+                            "enviado_em": datetime.now().isoformat(timespec="seconds")}
+                arquivo.write(json.dumps(registro, ensure_ascii=False) + "\n")
+
+    def registrar_quando_enviado(self, chave, retorno, destinatario, assunto):
+        """Registra o envio assim que `retorno` (Future do despachante ou envio síncrono) tiver sucesso."""
+        if not isinstance(retorno, Future):
+            self.registrar(chave, destinatario, assunto)
+            return
+
+        def concluido(futuro):
+            if futuro.exception() is None and getattr(futuro.result(), "sucesso", True):
+                self.registrar(chave, destinatario, assunto)
+
+        retorno.add_done_callback(concluido)
+
+    def compactar(self, max_dias=None):
+        """Descarta os registros com mais de `max_dias` (o mesmo prazo do cache de arquivos)."""
+        limite = datetime.now().timestamp() - (max_dias if max_dias is not None else CACHE_MAX_DIAS) * 86400
+        with self._lock:
+            if not os.path.exists(self.caminho):
+                return
+            mantidos = []
+            with open(self.caminho, encoding="utf-8") as arquivo:
+                for linha in arquivo:
+                    try:
+                        registro = json.loads(linha)
+                    except json.JSONDecodeError:
+                        continue
+                    if datetime.fromisoformat(registro["enviado_em"]).timestamp() >= limite:
+                        mantidos.append(registro)
+            caminho_temporario = self.caminho + ".tmp"
+            with open(caminho_temporario, "w", encoding="utf-8") as arquivo:
+                for registro in mantidos:
+                    arquivo.write(json.dumps(registro, ensure_ascii=False) + "\n")
+            os.replace(caminho_temporario, self.caminho)
+            self._enviados = {registro["chave"] for registro in mantidos}
+
+
+def limpar_pastas_antigas(pasta_principal="Relatorios_Enviados", dias=None):
+    """Remove as pastas diárias (AAAA-MM-DD) com mais de `dias` dias. Retorna quantas foram removidas."""
+    dias = dias if dias is not None else RETENCAO_RELATORIOS_DIAS
+    if not dias or not os.path.isdir(pasta_principal):
+        return 0
+    hoje = date.today()
+    removidas = 0
+    for nome in os.listdir(pasta_principal):
+        if not re.fullmatch(r"\d{4}-\d{2}-\d{2}", nome):
+            continue
+        try:
+            dia = date.fromisoformat(nome)
+        except ValueError:
+            continue
+        if (hoje - dia).days > dias:
+            shutil.rmtree(os.path.join(pasta_principal, nome), ignore_errors=True)
+            removidas += 1
+    return removidas
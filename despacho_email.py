@@ -0,0 +1,300 @@
+# despacho_email.py
+
+import base64
+import email
+import os
+import random
+import smtplib
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from googleapiclient.errors import HttpError
+import config
+import instrumentacao
+import servicos
+
+# Códigos HTTP da API do Gmail que valem uma nova tentativa (limite de taxa e falhas do servidor)
+STATUS_REPETIVEIS = {429, 500, 502, 503, 504}
+
+
+# --- MENSAGENS EM ARQUIVO ---
+# A mensagem MIME é gravada em um arquivo temporário (em memória até MENSAGEM_EM_MEMORIA_MB)
+# com o anexo codificado em base64 por blocos, direto do disco. Assim o anexo nunca fica
+# inteiro na memória, e o Gmail recebe o arquivo por upload (retomável acima de
+# UPLOAD_RETOMAVEL_MB) em vez de um JSON com a mensagem inteira codificada.
+
+MENSAGEM_EM_MEMORIA_MB = getattr(config, "EMAIL_MENSAGEM_EM_MEMORIA_MB", 1)
+UPLOAD_RETOMAVEL_MB = getattr(config, "EMAIL_UPLOAD_RETOMAVEL_MB", 5)
+UPLOAD_BLOCO_MB = getattr(config, "EMAIL_UPLOAD_BLOCO_MB", 1)
+# Blocos múltiplos de 57 bytes viram linhas inteiras de 76 caracteres em base64
+BLOCO_BASE64 = 57 * 16 * 1024
+
+
+def gravar_mensagem(destino, para, assunto, corpo_html, nome_arquivo_anexo=None):
+    """Grava a mensagem MIME (RFC 822) em `destino`, um arquivo binário, lendo o anexo por blocos."""
+    message = MIMEMultipart()
+    message["to"] = para
+    message["from"] = config.MEU_EMAIL_REMETENTE
+    message["subject"] = assunto
+    message.attach(MIMEText(corpo_html, "html"))
+    if not nome_arquivo_anexo:
+        destino.write(message.as_bytes())
+        return
+
+    # O anexo entra como um marcador, substituído pelo conteúdo codificado na gravação
+    nome = os.path.basename(nome_arquivo_anexo)
+    marcador = f"anexo-{uuid.uuid4().hex}"
+    part = MIMEBase("application", "octet-stream", Name=nome)
+    part["Content-Transfer-Encoding"] = "base64"
+    part["Content-Disposition"] = f'attachment; filename="{nome}"'
+    part.set_payload(marcador)
+    message.attach(part)
+    antes, depois = message.as_bytes().split(marcador.encode(), 1)
+
+    with open(nome_arquivo_anexo, "rb") as attachment:
+        destino.write(antes)
+        for bloco in iter(lambda: attachment.read(BLOCO_BASE64), b""):
+            destino.write(base64.encodebytes(bloco))
+        destino.write(depois)
+
+
+def mensagem_em_arquivo(para, assunto, corpo_html, nome_arquivo_anexo=None):
+    """Retorna um arquivo temporário (posicionado no início) com a mensagem pronta para os transportes."""
+    arquivo = tempfile.SpooledTemporaryFile(max_size=int(MENSAGEM_EM_MEMORIA_MB * 1024 * 1024))
+    try:
+        gravar_mensagem(arquivo, para, assunto, corpo_html, nome_arquivo_anexo)
+    except BaseException:
+        arquivo.close()
+        raise
+    arquivo.seek(0)
+    return arquivo
+
+
+def _tamanho_arquivo(arquivo):
+    arquivo.seek(0, os.SEEK_END)
+    tamanho = arquivo.tell()
+    arquivo.seek(0)
+    return tamanho
+
+
+def erro_repetivel(erro):
+    """Indica se um HttpError é temporário (429/5xx) e pode ser repetido."""
+    if not isinstance(erro, HttpError):
+        return False
+    try:
+        return int(erro.resp.status) in STATUS_REPETIVEIS
+    except (AttributeError, TypeError, ValueError):
+        return False
+
+
+# --- TRANSPORTES ---
+# Um transporte recebe o arquivo com a mensagem MIME pronta (ver `mensagem_em_arquivo`) e
+# devolve o ID da mensagem enviada. O arquivo pode ser enviado de novo em uma nova tentativa.
+
+class TransporteGmail:
+    """Envia pela API do Gmail reaproveitando o cliente autorizado (um por thread, pois o httplib2 não é thread-safe)."""
+
+    def __init__(self, creds):
+        self.creds = creds
+
+    def _servico(self):
+        return servicos.servico("gmail", "v1", self.creds, por_thread=True)
+
+    def enviar(self, arquivo):
+        from googleapiclient.http import MediaIoBaseUpload
+        # Acima do limite do upload simples, o envio é retomável e lido do arquivo em blocos
+        retomavel = _tamanho_arquivo(arquivo) > UPLOAD_RETOMAVEL_MB * 1024 * 1024
+        media = MediaIoBaseUpload(arquivo, mimetype="message/rfc822", resumable=retomavel,
+                                  chunksize=int(UPLOAD_BLOCO_MB * 1024 * 1024))
+        send_message = self._servico().users().messages().send(userId="me", body={}, media_body=media).execute()
+        return send_message["id"]
+
+
+class TransporteSMTP:
+    """Envia por um servidor SMTP (ex.: um servidor local de testes como `python -m aiosmtpd -n`)."""
+
+    def __init__(self, host="localhost", port=1025, usuario=None, senha=None):
+        self.host = host
+        self.port = port
+        self.usuario = usuario
+        self.senha = senha
+
+    def enviar(self, arquivo):
+        arquivo.seek(0)
+        message = email.message_from_binary_file(arquivo)
+        with smtplib.SMTP(self.host, self.port) as smtp:
+            if self.usuario:
+                smtp.login(self.usuario, self.senha)
+            smtp.send_message(message)
+        return message.get("Message-ID", "")
+
+
+class TransporteFalso:
+    """
+    Guarda as mensagens (já interpretadas como email.message.Message) em memória. Útil para testes;
+    `erros` é uma lista de exceções lançadas em ordem antes de aceitar os envios.
+    """
+
+    def __init__(self, erros=None):
+        self.enviadas = []
+        self.erros = list(erros or [])
+        self._lock = threading.Lock()
+
+    def enviar(self, arquivo):
+        with self._lock:
+            if self.erros:
+                raise self.erros.pop(0)
+            arquivo.seek(0)
+            self.enviadas.append(email.message_from_binary_file(arquivo))
+            return f"falso-{len(self.enviadas)}"
+
+
+_transportes_gmail = {}
+
+
+def transporte_gmail(creds):
+    """Retorna o transporte do Gmail associado a estas credenciais, criando-o na primeira chamada."""
+    transporte = _transportes_gmail.get(id(creds))
+    if transporte is None or transporte.creds is not creds:
+        transporte = TransporteGmail(creds)
+        _transportes_gmail[id(creds)] = transporte
+    return transporte
+
+
+# --- DESPACHANTE ---
+
+@dataclass
+class ResultadoEnvio:
+    destinatario: str
+    assunto: str
+    anexo: str = None
+    sucesso: bool = False
+    id_mensagem: str = None
+    tentativas: int = 0
+    erro: str = None
+
+
+class DespachanteEmail:
+    """
+    Envia e-mails em um pool de threads limitado, com novas tentativas e espera exponencial
+    para erros 429/5xx. O método `enviar` tem a mesma assinatura de `main.enviar_email`,
+    então pode ser passado diretamente para os geradores de relatório.
+
+    O Future devolvido por `enviar` recebe o resultado na própria thread do envio, que só termina
+    depois de rodar os callbacks do Future (diário, livro de envios): `aguardar` espera essa thread,
+    então, quando ele retorna, os callbacks também terminaram.
+    """
+
+    def __init__(self, transporte, max_workers=None, max_tentativas=None, espera_base=None):
+        self.transporte = transporte
+        self.max_tentativas = max_tentativas or getattr(config, "EMAIL_MAX_TENTATIVAS", 5)
+        self.espera_base = espera_base if espera_base is not None else getattr(config, "EMAIL_ESPERA_BASE", 1.0)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or getattr(config, "EMAIL_WORKERS", 4),
+            thread_name_prefix="envio-email",
+        )
+        self._lock = threading.Lock()
+        self._tarefas = {}  # Future devolvido por `enviar` -> tarefa do pool que o conclui
+
+    def enviar(self, creds, para, assunto, corpo_html, nome_arquivo_anexo=None):
+        futuro = Future()
+        tarefa = self._executor.submit(self._enviar_e_concluir, futuro, para, assunto, corpo_html, nome_arquivo_anexo)
+        with self._lock:
+            self._tarefas[futuro] = tarefa
+        return futuro
+
+    def _enviar_e_concluir(self, futuro, para, assunto, corpo_html, nome_arquivo_anexo):
+        try:
+            resultado = self._enviar_com_retentativa(para, assunto, corpo_html, nome_arquivo_anexo)
+        except BaseException as e:
+            futuro.set_exception(e)
+        else:
+            futuro.set_result(resultado)  # roda os callbacks do Future nesta thread
+
+    @instrumentacao.medir("enviar_email")
+    def _enviar_com_retentativa(self, para, assunto, corpo_html, nome_arquivo_anexo):
+        resultado = ResultadoEnvio(destinatario=para, assunto=assunto, anexo=nome_arquivo_anexo)
+        try:
+            arquivo = mensagem_em_arquivo(para, assunto, corpo_html, nome_arquivo_anexo)
+        except OSError as e:
+            resultado.erro = f"Não foi possível ler o anexo: {e}"
+            print(f"Ocorreu um erro ao enviar o e-mail para {para}: {resultado.erro}")
+            return resultado
+        if nome_arquivo_anexo:
+            instrumentacao.anotar(bytes_anexos=os.path.getsize(nome_arquivo_anexo))
+
+        with arquivo:
+            while resultado.tentativas < self.max_tentativas:
+                resultado.tentativas += 1
+                try:
+                    arquivo.seek(0)
+                    resultado.id_mensagem = self.transporte.enviar(arquivo)
+                    resultado.sucesso = True
+                    resultado.erro = None
+                    print(f"E-mail enviado com sucesso para {para}. ID: {resultado.id_mensagem}")
+                    return resultado
+                except Exception as e:
+                    resultado.erro = str(e)
+                    if not erro_repetivel(e) or resultado.tentativas >= self.max_tentativas:
+                        break
+                    espera = self.espera_base * (2 ** (resultado.tentativas - 1)) + random.uniform(0, self.espera_base)
+                    print(f"Falha temporária ao enviar para {para} (tentativa {resultado.tentativas}). Nova tentativa em {espera:.1f}s.")
+                    time.sleep(espera)
+
+        print(f"Ocorreu um erro ao enviar o e-mail para {para}: {resultado.erro}")
+        return resultado
+
+    def aguardar(self, futuros=None):
+        """
+        Espera os envios `futuros` (os Futures devolvidos por `enviar`; padrão: todos os pendentes)
+        e os seus callbacks, e retorna os resultados na ordem em que foram solicitados.
+        """
+        with self._lock:
+            futuros = list(self._tarefas) if futuros is None else list(futuros)
+            tarefas = [self._tarefas.pop(futuro, futuro) for futuro in futuros]
+        wait(tarefas)
+        return [futuro.result() for futuro in futuros]
+
+    def encerrar(self):
+        resultados = self.aguardar()
+        self._executor.shutdown(wait=True)
+        return resultados
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._executor.shutdown(wait=True)
+
+
+class LoteEnvios:
+    """
+    Os envios de uma rodada num despachante compartilhado (com várias regiões, um por região):
+    `aguardar` espera e retorna só os e-mails enviados por este lote.
+    """
+
+    def __init__(self, despachante):
+        self.despachante = despachante
+        self.futuros = []
+
+    def enviar(self, creds, para, assunto, corpo_html, nome_arquivo_anexo=None):
+        futuro = self.despachante.enviar(creds, para, assunto, corpo_html, nome_arquivo_anexo)
+        self.futuros.append(futuro)
+        return futuro
+
+    def aguardar(self):
+        futuros, self.futuros = self.futuros, []
+        return self.despachante.aguardar(futuros)
+
+
+def imprimir_resumo(resultados):
+    falhas = [r for r in resultados if not r.sucesso]
+    print(f"\n{len(resultados) - len(falhas)} de {len(resultados)} e-mails enviados com sucesso.")
+    for r in falhas:
+        print(f"  FALHA: {r.destinatario} - '{r.assunto}' após {r.tentativas} tentativa(s): {r.erro}")
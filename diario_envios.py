@@ -0,0 +1,140 @@
+# diario_envios.py
+
+import json
+import os
+import threading
+import ingestao
+import regioes
+
+# --- DIÁRIO DE ENVIOS ---
+# Arquivo JSONL (um evento por linha) com as linhas da planilha cujo relatório já foi
+# enviado por e-mail e as que já receberam o status na planilha. Se uma execução cair
+# entre o envio e a marcação, a próxima marca as linhas pendentes sem reenviar os e-mails.
+#
+#   {"evento": "enviadas", "planilha": ..., "status": "Enviado em ...", "linhas": {"120": "2025-01-06T10:00:00", ...}}
+#   {"evento": "marcadas", "planilha": ..., "linhas": [120, 121, ...]}
+#
+# O modo daemon não marca a planilha: ele registra as linhas cujos alertas já saíram junto com a
+# tratativa da época. A linha só volta a ser enviada se a tratativa mudar (ex.: passou a "Será
+# feito pedido"), inclusive depois de o daemon ser reiniciado. Linhas marcadas saem do registro.
+#
+#   {"evento": "despachadas", "planilha": ..., "tratativa": "Sem Tratativa", "linhas": [120, 121, ...]}
+
+# Com várias regiões, cada uma tem o seu diário (na pasta de cache da região).
+
+
+class DiarioEnvios:
+    def __init__(self, caminho=None, spreadsheet_id=None):
+        self.caminho = caminho or os.path.join(ingestao.pasta_cache(), "diario_envios.jsonl")
+        self.spreadsheet_id = spreadsheet_id or regioes.valor("SPREADSHEET_ID")
+        self._lock = threading.Lock()
+
+    def _registrar(self, evento):
+        evento["planilha"] = self.spreadsheet_id
+        with self._lock:
+            os.makedirs(os.path.dirname(self.caminho) or ".", exist_ok=True)
+            with open(self.caminho, "a", encoding="utf-8") as arquivo:
+                arquivo.write(json.dumps(evento, ensure_ascii=False) + "\n")
+                arquivo.flush()
+                os.fsync(arquivo.fileno())
+
+    def registrar_enviadas(self, timestamps_por_linha, status):
+        """Registra as linhas ({linha: timestamp ISO}) cujo relatório foi enviado e o status que devem receber."""
+        if timestamps_por_linha:
+            self._registrar({"evento": "enviadas", "status": status,
+                             "linhas": {str(linha): ts for linha, ts in timestamps_por_linha.items()}})
+
+    def registrar_marcadas(self, linhas):
+        """Registra as linhas que já receberam o status na planilha (ou que não devem mais ser marcadas)."""
+        linhas = [int(linha) for linha in linhas]
+        if linhas:
+            self._registrar({"evento": "marcadas", "linhas": linhas})
+
+    def registrar_despachadas(self, tratativas_por_linha):
+        """Registra as linhas ({linha: tratativa}) cujos alertas o modo daemon já enviou."""
+        por_tratativa = {}
+        for linha, tratativa in tratativas_por_linha.items():
+            por_tratativa.setdefault(str(tratativa), []).append(int(linha))
+        for tratativa, linhas in por_tratativa.items():
+            self._registrar({"evento": "despachadas", "tratativa": tratativa, "linhas": linhas})
+
+    def _eventos(self):
+        if not os.path.exists(self.caminho):
+            return
+        with open(self.caminho, encoding="utf-8") as arquivo:
+            for linha in arquivo:
+                try:
+                    evento = json.loads(linha)
+                except json.JSONDecodeError:
+                    continue  # última linha truncada por uma queda no meio da escrita
+                if evento.get("planilha") == self.spreadsheet_id:
+                    yield evento
+
+    def pendentes(self):
+        """Linhas enviadas e ainda não marcadas: {linha: {"status": ..., "timestamp": ...}}."""
+        with self._lock:
+            return self._pendentes_sem_lock()
+
+    def _pendentes_sem_lock(self):
+        pendentes = {}
+        for evento in self._eventos():
+            if evento["evento"] == "enviadas":
+                for linha, timestamp in evento["linhas"].items():
+                    pendentes[int(linha)] = {"status": evento["status"], "timestamp": timestamp}
+            elif evento["evento"] == "marcadas":
+                for linha in evento["linhas"]:
+                    pendentes.pop(int(linha), None)
+        return pendentes
+
+    def despachadas(self):
+        """Pares (linha, tratativa) já enviados pelo modo daemon e ainda não marcados na planilha."""
+        with self._lock:
+            return self._despachadas_sem_lock()
+
+    def _despachadas_sem_lock(self):
+        despachadas = {}
+        for evento in self._eventos():
+            if evento["evento"] == "despachadas":
+                for linha in evento["linhas"]:
+                    despachadas.setdefault(int(linha), set()).add(evento["tratativa"])
+            elif evento["evento"] == "marcadas":
+                for linha in evento["linhas"]:
+                    despachadas.pop(int(linha), None)
+        return {(linha, tratativa) for linha, tratativas in despachadas.items() for tratativa in tratativas}
+
+    def compactar(self):
+        """
+        Reescreve o diário mantendo só as linhas ainda pendentes e as despachadas (daemon) ainda não
+        marcadas desta planilha, além dos eventos de outras planilhas.
+        """
+        # Leitura e reescrita sob o mesmo lock: um registro feito entre as duas seria perdido na reescrita
+        with self._lock:
+            if not os.path.exists(self.caminho):
+                return
+            pendentes = self._pendentes_sem_lock()
+            despachadas = self._despachadas_sem_lock()
+            outras = []
+            with open(self.caminho, encoding="utf-8") as arquivo:
+                for linha in arquivo:
+                    try:
+                        evento = json.loads(linha)
+                    except json.JSONDecodeError:
+                        continue
+                    if evento.get("planilha") != self.spreadsheet_id:
+                        outras.append(linha if linha.endswith("\n") else linha + "\n")
+            por_status = {}
+            for linha, info in pendentes.items():
+                por_status.setdefault(info["status"], {})[str(linha)] = info["timestamp"]
+            caminho_temporario = self.caminho + ".tmp"
+            with open(caminho_temporario, "w", encoding="utf-8") as arquivo:
+                arquivo.writelines(outras)
+                for status, linhas in por_status.items():
+                    evento = {"evento": "enviadas", "status": status, "linhas": linhas, "planilha": self.spreadsheet_id}
+                    arquivo.write(json.dumps(evento, ensure_ascii=False) + "\n")
+                por_tratativa = {}
+                for linha, tratativa in sorted(despachadas):
+                    por_tratativa.setdefault(tratativa, []).append(linha)
+                for tratativa, linhas in por_tratativa.items():
+                    evento = {"evento": "despachadas", "tratativa": tratativa, "linhas": linhas, "planilha": self.spreadsheet_id}
+                    arquivo.write(json.dumps(evento, ensure_ascii=False) + "\n")
+            os.replace(caminho_temporario, self.caminho)
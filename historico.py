@@ -0,0 +1,209 @@
+# historico.py
+
+import os
+import sqlite3
+from datetime import datetime, timedelta
+import pandas as pd
+import config
+import ingestao
+import regioes
+import report_generator
+
+# --- HISTÓRICO LOCAL DE RUPTURAS ---
+# Banco SQLite com as solicitações processadas em cada execução, para consultas de
+# recorrência e tempo em aberto sem reler a planilha. Uma linha da planilha é identificada
+# por (planilha, linha, timestamp): se for processada de novo (ex.: recebeu a tratativa
+# depois), o registro é atualizado em vez de duplicado.
+#
+# Os índices cobrem (sem ler a tabela) as consultas por janela de tempo, por loja/produto,
+# por categoria e por tratativa; o nome do produto só é buscado para os itens listados.
+# A tabela `lojas` guarda o número de cada loja para filtrar por "12" em vez do nome completo.
+
+ARQUIVO_HISTORICO = getattr(config, "ARQUIVO_HISTORICO", os.path.join("Relatorios_Enviados", "historico_rupturas.sqlite"))
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS rupturas (
+    planilha        TEXT NOT NULL,
+    linha           INTEGER NOT NULL,
+    timestamp       TEXT NOT NULL,
+    loja            TEXT,
+    categoria       TEXT,
+    codigo_produto  TEXT,
+    produto         TEXT,
+    solicitante     TEXT,
+    tempo_ruptura   TEXT,
+    tratativa       TEXT,
+    processado_em   TEXT NOT NULL,
+    enviado_em      TEXT,
+    PRIMARY KEY (planilha, linha, timestamp)
+);
+CREATE INDEX IF NOT EXISTS idx_rupturas_loja_produto ON rupturas (planilha, loja, codigo_produto, timestamp, categoria);
+CREATE INDEX IF NOT EXISTS idx_rupturas_timestamp ON rupturas (planilha, timestamp, loja, codigo_produto, categoria);
+CREATE INDEX IF NOT EXISTS idx_rupturas_categoria ON rupturas (planilha, categoria, timestamp, loja, codigo_produto);
+CREATE INDEX IF NOT EXISTS idx_rupturas_tratativa ON rupturas (planilha, tratativa, timestamp, loja, enviado_em);
+CREATE TABLE IF NOT EXISTS lojas (
+    loja    TEXT PRIMARY KEY,
+    numero  INTEGER
+);
+"""
+
+INSERIR = """
+INSERT INTO rupturas (planilha, linha, timestamp, loja, categoria, codigo_produto, produto, solicitante,
+                      tempo_ruptura, tratativa, processado_em, enviado_em)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (planilha, linha, timestamp) DO UPDATE SET
+    loja = excluded.loja, categoria = excluded.categoria, codigo_produto = excluded.codigo_produto,
+    produto = excluded.produto, solicitante = excluded.solicitante, tempo_ruptura = excluded.tempo_ruptura,
+    tratativa = excluded.tratativa, processado_em = excluded.processado_em,
+    enviado_em = COALESCE(rupturas.enviado_em, excluded.enviado_em)
+"""
+
+
+def _texto(serie):
+    """Converte uma coluna para lista de str/None (valores ausentes viram NULL)."""
+    return [None if pd.isna(valor) else str(valor) for valor in serie.astype(object).tolist()]
+
+
+class HistoricoRupturas:
+    def __init__(self, caminho=None, spreadsheet_id=None):
+        self.caminho = caminho or ARQUIVO_HISTORICO
+        self.spreadsheet_id = spreadsheet_id or regioes.valor("SPREADSHEET_ID")
+        os.makedirs(os.path.dirname(self.caminho) or ".", exist_ok=True)
+        self.conexao = sqlite3.connect(self.caminho)
+        self.conexao.row_factory = sqlite3.Row
+        self.conexao.executescript(ESQUEMA)
+
+    def fechar(self):
+        # Atualiza as estatísticas usadas pelo SQLite para escolher os índices
+        self.conexao.execute("PRAGMA optimize")
+        self.conexao.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+    # --- gravação ---
+
+    def registrar(self, df, enviadas=None, enviado_em=None):
+        """
+        Grava (ou atualiza) as linhas processadas do DataFrame da rodada. `enviadas` são as linhas
+        da planilha cujo relatório saiu nesta execução; elas recebem `enviado_em` (padrão: agora),
+        que não é sobrescrito em execuções posteriores. Retorna a quantidade de linhas gravadas.
+        """
+        if df is None or df.empty:
+            return 0
+        agora = datetime.now().isoformat(timespec="seconds")
+        enviado_em = enviado_em or agora
+        enviadas = set(enviadas or ())
+        linhas = df["original_index"].tolist()
+        timestamps = df["timestamp"].dt.strftime("%Y-%m-%dT%H:%M:%S").tolist()
+        colunas = [_texto(df[nome]) if nome in df.columns else [None] * len(df)
+                   for nome in ("loja", "categoria", "codigo_produto", "produto", "nome_solicitante", "tempo_ruptura", "tratativa")]
+        registros = [
+            (self.spreadsheet_id, int(linha), timestamp, *valores, agora, enviado_em if linha in enviadas else None)
+            for linha, timestamp, *valores in zip(linhas, timestamps, *colunas)
+            if isinstance(timestamp, str)
+        ]
+        lojas = {loja for loja in colunas[0] if loja}
+        with self.conexao:
+            self.conexao.executemany(INSERIR, registros)
+            self.conexao.executemany("INSERT OR IGNORE INTO lojas (loja, numero) VALUES (?, ?)",
+                                     [(loja, report_generator.get_numero_loja(loja)) for loja in lojas])
+        return len(registros)
+
+    # --- consultas ---
+
+    def _filtros(self, loja=None, categoria=None, tratativa=None, desde=None, ate=None, dias=None):
+        condicoes, parametros = ["planilha = ?"], [self.spreadsheet_id]
+        if dias is not None and desde is None:
+            desde = (ate or datetime.now()) - timedelta(days=dias)
+        if desde is not None:
+            condicoes.append("timestamp >= ?")
+            parametros.append(desde.isoformat(timespec="seconds"))
+        if ate is not None:
+            condicoes.append("timestamp <= ?")
+            parametros.append(ate.isoformat(timespec="seconds"))
+        if loja is not None:
+            # "12" (ou 12) filtra pelo número da loja; qualquer outro texto, pelo nome exato
+            if str(loja).isdigit():
+                condicoes.append("loja IN (SELECT loja FROM lojas WHERE numero = ?)")
+                parametros.append(int(loja))
+            else:
+                condicoes.append("loja = ?")
+                parametros.append(loja)
+        if categoria is not None:
+            condicoes.append("categoria = ?")
+            parametros.append(categoria)
+        if tratativa is not None:
+            condicoes.append("tratativa = ?")
+            parametros.append(tratativa)
+        return " AND ".join(condicoes), parametros
+
+    def recorrencias(self, loja=None, categoria=None, desde=None, ate=None, dias=None, minimo=2, limite=50):
+        """
+        Produtos que entraram em ruptura pelo menos `minimo` vezes na janela, por loja, do mais
+        recorrente para o menos. Cada item: loja, codigo_produto, produto e categoria (da última
+        ocorrência), ocorrencias, primeira, ultima.
+        """
+        onde, parametros = self._filtros(loja, categoria, None, desde, ate, dias)
+        sql = f"""
+            WITH recorrentes AS (
+                SELECT loja, codigo_produto, COUNT(*) AS ocorrencias, MIN(timestamp) AS primeira, MAX(timestamp) AS ultima
+                FROM rupturas
+                WHERE {onde} AND codigo_produto IS NOT NULL
+                GROUP BY loja, codigo_produto
+                HAVING COUNT(*) >= ?
+                ORDER BY ocorrencias DESC, ultima DESC
+                LIMIT ?
+            )
+            SELECT r.loja, r.codigo_produto, u.produto, u.categoria, r.ocorrencias, r.primeira, r.ultima
+            FROM recorrentes r
+            JOIN rupturas u ON u.planilha = ? AND u.loja = r.loja AND u.codigo_produto = r.codigo_produto AND u.timestamp = r.ultima
+            GROUP BY r.loja, r.codigo_produto
+            ORDER BY r.ocorrencias DESC, r.ultima DESC
+        """
+        return [dict(linha) for linha in self.conexao.execute(sql, parametros + [minimo, limite, self.spreadsheet_id])]
+
+    def tempo_em_aberto(self, tratativa=ingestao.TRATATIVA_PEDIDO, loja=None, categoria=None, desde=None, ate=None, dias=None):
+        """
+        Tempo entre a solicitação e o envio do relatório, por loja, para as solicitações com a
+        `tratativa` informada. Cada item: loja, solicitacoes, enviadas, media_horas, maximo_horas,
+        em_aberto (ainda sem envio).
+        """
+        onde, parametros = self._filtros(loja, categoria, tratativa, desde, ate, dias)
+        sql = f"""
+            SELECT loja, COUNT(*) AS solicitacoes, COUNT(enviado_em) AS enviadas,
+                   ROUND(AVG((julianday(enviado_em) - julianday(timestamp)) * 24), 1) AS media_horas,
+                   ROUND(MAX((julianday(enviado_em) - julianday(timestamp)) * 24), 1) AS maximo_horas,
+                   COUNT(*) - COUNT(enviado_em) AS em_aberto
+            FROM rupturas
+            WHERE {onde}
+            GROUP BY loja
+            ORDER BY media_horas DESC
+        """
+        return [dict(linha) for linha in self.conexao.execute(sql, parametros)]
+
+
+# --- LINHA DE COMANDO (main.py recorrencias / em-aberto) ---
+
+def imprimir_recorrencias(itens):
+    if not itens:
+        print("Nenhum produto recorrente na janela informada.")
+        return
+    print(f"{'Loja':<28} {'Código':<14} {'Produto':<32} {'Vezes':>5}  {'Primeira':<10}  {'Última':<10}")
+    for item in itens:
+        print(f"{(item['loja'] or '')[:28]:<28} {item['codigo_produto'][:14]:<14} {(item['produto'] or '')[:32]:<32} "
+              f"{item['ocorrencias']:>5}  {item['primeira'][:10]:<10}  {item['ultima'][:10]:<10}")
+
+
+def imprimir_tempo_em_aberto(itens):
+    if not itens:
+        print("Nenhuma solicitação encontrada na janela informada.")
+        return
+    print(f"{'Loja':<28} {'Solicit.':>8} {'Enviadas':>8} {'Média (h)':>10} {'Máx. (h)':>9} {'Em aberto':>10}")
+    for item in itens:
+        media = "-" if item["media_horas"] is None else f"{item['media_horas']:.1f}"
+        maximo = "-" if item["maximo_horas"] is None else f"{item['maximo_horas']:.1f}"
+        print(f"{(item['loja'] or '')[:28]:<28} {item['solicitacoes']:>8} {item['enviadas']:>8} {media:>10} {maximo:>9} {item['em_aberto']:>10}")
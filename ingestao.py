@@ -0,0 +1,490 @@
+# ingestao.py
+
+import os
+import pickle
+from functools import lru_cache
+from itertools import zip_longest
+import numpy as np
+import pandas as pd
+import config
+import regioes
+
+# --- CACHE LOCAL DE LINHAS DA PLANILHA ---
+# O cache guarda as linhas já lidas em formato de colunas (uma lista por coluna do
+# cabeçalho), junto com a marca d'água da última linha lida. Nas execuções seguintes
+# só a "cauda" nova da planilha é baixada e a coluna 'Status Relatorio' das linhas
+# já conhecidas é atualizada.
+
+VERSAO_CACHE = 1
+PASTA_CACHE = getattr(config, "PASTA_CACHE", ".cache_planilha")
+
+COLUNA_TIMESTAMP = "Carimbo de data/hora"
+COLUNA_TRATATIVA = "Tratativa Comercial"
+COLUNA_STATUS = "Status Relatorio"
+
+# Formato do carimbo de data/hora gravado pelo Google Forms
+FORMATO_TIMESTAMP = "%d/%m/%Y %H:%M:%S"
+
+RENOMEAR_COLUNAS = {
+    'Carimbo de data/hora': 'timestamp',
+    'Informe a loja da ruptura': 'loja',
+    'Tratativa Comercial': 'tratativa',
+    'Informe o código do produto em ruptura': 'codigo_produto',
+    'Informe o produto em ruptura': 'produto',
+    'Informe a categoria da ruptura': 'categoria',
+    'Informe seu nome': 'nome_solicitante',
+    'A quanto tempo esse produto está em ruptura?': 'tempo_ruptura',
+}
+
+# --- ESQUEMA DO DATAFRAME DE RUPTURAS ---
+# Tipos das colunas produzidas por `montar_dataframe`. Células vazias viram valores
+# ausentes (NaN/NaT/<NA>) nas colunas tipadas; as demais colunas da planilha continuam
+# como texto (object) com ''.
+#
+#   timestamp         datetime64[ns]  Carimbo de data/hora do Forms (NaT se vazio/inválido)
+#   loja              category        Loja da ruptura (ex.: '12 - Loja Centro')
+#   categoria         category        Categoria do produto
+#   tratativa         category        Tratativa comercial ('' vira ausente)
+#   tempo_ruptura     category        Há quanto tempo o produto está em ruptura
+#   nome_solicitante  category        Quem abriu a solicitação
+#   codigo_produto    UInt64 | string UInt64 quando todos os códigos são numéricos sem zero à esquerda
+#   produto           object          Descrição do produto
+#   Status Relatorio  object          '' enquanto o relatório não foi enviado
+#   original_index    int64           Linha correspondente na planilha
+#
+# Depois de `normalizar_rupturas`, 'tratativa' não tem mais vazios ("Sem Tratativa") e
+# ganham-se as colunas booleanas 'tratada', 'divergencia' e 'sera_feito_pedido'.
+# Depois de `consolidar_repetidas`, cada linha é um produto em ruptura numa loja e ganham-se
+# 'ultimo_timestamp', 'quantidade_solicitacoes' e 'linhas_origem' (ver abaixo).
+COLUNAS_CATEGORICAS = ["loja", "categoria", "tratativa", "tempo_ruptura", "nome_solicitante"]
+COLUNA_CODIGO = "codigo_produto"
+
+
+def nome_aba(range_name=None):
+    """Extrai o nome da aba de um intervalo A1 (ex.: 'RUPTURAS LOJAS!A:N')."""
+    range_name = range_name or regioes.valor("RANGE_NAME")
+    aba = range_name.split("!")[0] if "!" in range_name else range_name
+    return aba.strip("'")
+
+
+def intervalo(aba, inicio, fim=None):
+    """Monta um intervalo A1 com o nome da aba entre aspas."""
+    if fim is None:
+        return f"'{aba}'!{inicio}"
+    return f"'{aba}'!{inicio}:{fim}"
+
+
+def letra_da_coluna(header, nome_coluna):
+    """Retorna a letra da coluna na planilha a partir do cabeçalho, ou None se não existir."""
+    from openpyxl.utils import get_column_letter
+    if nome_coluna not in header:
+        return None
+    return get_column_letter(header.index(nome_coluna) + 1)
+
+
+def linhas_para_colunas(header, linhas):
+    """Transpõe as linhas da API em colunas, completando células ausentes com ''."""
+    num_cols = len(header)
+    if not linhas:
+        return [[] for _ in range(num_cols)]
+    colunas = [list(coluna) for coluna in zip_longest(*linhas, fillvalue="")][:num_cols]
+    while len(colunas) < num_cols:
+        colunas.append([""] * len(linhas))
+    return colunas
+
+
+def _colunas_editaveis(header):
+    """
+    Índices (início, fim) do bloco de colunas preenchidas depois do envio do formulário: da
+    'Tratativa Comercial' até o 'Status Relatorio'. None se nenhuma das duas estiver no cabeçalho.
+    """
+    indices = [header.index(nome) for nome in (COLUNA_TRATATIVA, COLUNA_STATUS) if nome in header]
+    if not indices:
+        return None
+    return min(indices), max(indices)
+
+
+def _valores_bloco(value_range, num_colunas, tamanho):
+    """Converte um intervalo de várias colunas em colunas de `tamanho` linhas, preservando as células vazias."""
+    colunas = linhas_para_colunas([None] * num_colunas, value_range.get("values", []))
+    return [(coluna + [""] * (tamanho - len(coluna)))[:tamanho] for coluna in colunas]
+
+
+def _valores_coluna(value_range, tamanho):
+    """Converte um intervalo de uma única coluna em lista, preservando as células vazias."""
+    valores = [linha[0] if linha else "" for linha in value_range.get("values", [])]
+    valores.extend([""] * (tamanho - len(valores)))
+    return valores[:tamanho]
+
+
+def pasta_cache():
+    """Pasta do cache local da planilha (e do diário de envios) da região ativa."""
+    return regioes.subpasta(PASTA_CACHE)
+
+
+def arquivo_cache():
+    return os.path.join(pasta_cache(), "linhas_planilha.pkl")
+
+
+def carregar_cache():
+    if not os.path.exists(arquivo_cache()):
+        return None
+    try:
+        with open(arquivo_cache(), "rb") as arquivo:
+            estado = pickle.load(arquivo)
+    except Exception as e:
+        print(f"Cache da planilha ilegível ({e}). Será feita a leitura completa.")
+        return None
+    if (estado.get("versao") != VERSAO_CACHE
+            or estado.get("spreadsheet_id") != regioes.valor("SPREADSHEET_ID")
+            or estado.get("range_name") != regioes.valor("RANGE_NAME")):
+        return None
+    return estado
+
+
+def salvar_cache(header, colunas):
+    os.makedirs(pasta_cache(), exist_ok=True)
+    num_linhas = len(colunas[0]) if colunas else 0
+    ultimo_timestamp = ""
+    if num_linhas and COLUNA_TIMESTAMP in header:
+        ultimo_timestamp = colunas[header.index(COLUNA_TIMESTAMP)][-1]
+    estado = {
+        "versao": VERSAO_CACHE,
+        "spreadsheet_id": regioes.valor("SPREADSHEET_ID"),
+        "range_name": regioes.valor("RANGE_NAME"),
+        "header": header,
+        "colunas": colunas,
+        "ultima_linha": num_linhas + 1,  # +1 por causa do cabeçalho
+        "ultimo_timestamp": ultimo_timestamp,
+    }
+    caminho = arquivo_cache()
+    caminho_temporario = caminho + ".tmp"
+    with open(caminho_temporario, "wb") as arquivo:
+        pickle.dump(estado, arquivo, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(caminho_temporario, caminho)
+
+
+def ler_completo(sheet):
+    """Lê todo o RANGE_NAME da região. Retorna (header, colunas) ou (None, None) se não houver dados."""
+    result = sheet.values().get(spreadsheetId=regioes.valor("SPREADSHEET_ID"), range=regioes.valor("RANGE_NAME")).execute()
+    values = result.get("values", [])
+    if not values or len(values) < 2:
+        return None, None
+    header = values[0]
+    colunas = linhas_para_colunas(header, values[1:])
+    salvar_cache(header, colunas)
+    return header, colunas
+
+
+def ler_incremental(sheet):
+    """
+    Lê apenas as linhas novas desde a última execução e relê, das já conhecidas, as colunas
+    preenchidas depois do envio (tratativa até status): uma solicitação tratada depois da última
+    leitura precisa chegar com a tratativa nova. Cai para a leitura completa se não houver cache
+    válido ou se a planilha mudou de forma.
+    """
+    from openpyxl.utils import get_column_letter
+    estado = carregar_cache()
+    if estado is None:
+        print("Cache local da planilha não encontrado. Fazendo leitura completa...")
+        return ler_completo(sheet)
+
+    aba = nome_aba()
+    header = estado["header"]
+    colunas = estado["colunas"]
+    ultima_linha = estado["ultima_linha"]
+    num_linhas = ultima_linha - 1
+    letra_final = get_column_letter(len(header))
+    editaveis = _colunas_editaveis(header)
+    letra_timestamp = letra_da_coluna(header, COLUNA_TIMESTAMP)
+
+    # Tudo em uma única chamada: cabeçalho, linha da marca d'água, cauda nova e bloco tratativa..status
+    ranges = [
+        intervalo(aba, "1", "1"),
+        intervalo(aba, f"{letra_timestamp or 'A'}{ultima_linha}"),
+        intervalo(aba, f"A{ultima_linha + 1}", letra_final),
+    ]
+    if editaveis:
+        primeira, ultima = editaveis
+        ranges.append(intervalo(aba, f"{get_column_letter(primeira + 1)}2", f"{get_column_letter(ultima + 1)}{ultima_linha}"))
+
+    result = sheet.values().batchGet(spreadsheetId=regioes.valor("SPREADSHEET_ID"), ranges=ranges).execute()
+    value_ranges = result.get("valueRanges", [])
+
+    header_atual = (value_ranges[0].get("values") or [[]])[0]
+    marca_dagua = _valores_coluna(value_ranges[1], 1)[0]
+    if header_atual != header or (letra_timestamp and marca_dagua != estado["ultimo_timestamp"]):
+        print("A estrutura da planilha mudou desde a última leitura. Fazendo leitura completa...")
+        return ler_completo(sheet)
+
+    if editaveis:
+        primeira, ultima = editaveis
+        colunas[primeira:ultima + 1] = _valores_bloco(value_ranges[3], ultima - primeira + 1, num_linhas)
+
+    linhas_novas = value_ranges[2].get("values", [])
+    if linhas_novas:
+        for coluna, novos_valores in zip(colunas, linhas_para_colunas(header, linhas_novas)):
+            coluna.extend(novos_valores)
+
+    print(f"Leitura incremental: {num_linhas} registros em cache, {len(linhas_novas)} novos.")
+    salvar_cache(header, colunas)
+    if not colunas or not colunas[0]:
+        return None, None
+    return header, colunas
+
+
+# --- CONVERSÃO E FILTROS NA INGESTÃO ---
+
+@lru_cache(maxsize=4096)
+def _interpretar_timestamp(texto):
+    """Interpretação lenta, só para as células que fogem do formato padrão (ex.: sem segundos)."""
+    try:
+        return pd.to_datetime(texto, dayfirst=True)
+    except (ValueError, OverflowError):
+        return pd.NaT
+
+
+def _para_iso(textos):
+    """
+    Reordena textos 'dd/mm/aaaa HH:MM:SS' para 'aaaa-mm-ddTHH:MM:SS' de forma vetorizada,
+    tratando cada texto como uma linha de 19 caracteres. Textos fora desse formato viram ''.
+    """
+    comprimentos = np.fromiter(map(len, textos), dtype=np.int64, count=len(textos))
+    caracteres = textos.astype("U19").view("U1").reshape(-1, 19) if len(textos) else np.empty((0, 19), dtype="U1")
+    no_formato = ((comprimentos == 19) & (caracteres[:, 2] == "/") & (caracteres[:, 5] == "/") & (caracteres[:, 10] == " "))
+    iso = caracteres[:, [6, 7, 8, 9, 2, 3, 4, 5, 0, 1, 10, 11, 12, 13, 14, 15, 16, 17, 18]].copy()
+    iso[:, [4, 7]] = "-"
+    iso[:, 10] = "T"
+    iso = iso.view("U19").ravel()
+    iso[~no_formato] = ""
+    return iso
+
+
+def converter_timestamps(textos):
+    """
+    Converte os textos no formato fixo do Google Forms (FORMATO_TIMESTAMP) e recorre à
+    interpretação genérica (em cache) apenas para as células fora do padrão.
+    Retorna (Series datetime64, quantidade de células preenchidas que não puderam ser lidas).
+    """
+    textos = np.asarray(textos, dtype=object)
+    datas = pd.Series(pd.to_datetime(_para_iso(textos), format="ISO8601", errors="coerce"))
+    preenchidos = pd.Series(textos != "")
+    fora_do_padrao = datas.isna() & preenchidos
+    if fora_do_padrao.any():
+        datas[fora_do_padrao] = pd.to_datetime([_interpretar_timestamp(t) for t in textos[fora_do_padrao.to_numpy()]])
+    invalidos = int((datas.isna() & preenchidos).sum())
+    return datas, invalidos
+
+
+def selecionar_linhas(header, colunas, data_inicio=None, data_fim=None, apenas_pendentes=False):
+    """
+    Aplica os filtros de status e período direto nas colunas cruas da API, antes de existir
+    um DataFrame. Retorna (posições selecionadas, timestamps dessas posições).
+    """
+    num_linhas = len(colunas[0]) if colunas else 0
+    posicoes = np.arange(num_linhas)
+
+    if apenas_pendentes and COLUNA_STATUS in header:
+        status = np.asarray(colunas[header.index(COLUNA_STATUS)], dtype=object)
+        posicoes = np.flatnonzero(status == "")
+
+    if COLUNA_TIMESTAMP not in header:
+        return posicoes, None
+
+    textos = np.asarray(colunas[header.index(COLUNA_TIMESTAMP)], dtype=object)[posicoes]
+    datas, invalidos = converter_timestamps(textos)
+    if invalidos:
+        print(f"Atenção: {invalidos} registros com data/hora inválida não puderam ser interpretados.")
+
+    if data_inicio is not None or data_fim is not None:
+        dentro = datas.notna()
+        if data_inicio is not None:
+            dentro &= datas >= data_inicio
+        if data_fim is not None:
+            dentro &= datas <= data_fim
+        dentro = dentro.to_numpy()
+        posicoes = posicoes[dentro]
+        datas = datas[dentro]
+    return posicoes, datas.reset_index(drop=True)
+
+
+def _coluna_categorica(valores):
+    categorica = pd.Categorical(valores)
+    if "" in categorica.categories:
+        categorica = categorica.remove_categories([""])
+    return categorica
+
+
+def _coluna_codigo(valores):
+    """Códigos só com dígitos (sem zero à esquerda) viram UInt64; qualquer outro caso fica como string."""
+    preenchidos = valores != ""
+    if preenchidos.any() and pd.Series(valores[preenchidos]).str.fullmatch(r"[1-9]\d{0,18}").all():
+        numeros = np.zeros(len(valores), dtype=np.uint64)
+        numeros[preenchidos] = valores[preenchidos].astype(np.uint64)
+        return pd.arrays.IntegerArray(numeros, ~preenchidos)
+    return pd.array(np.where(preenchidos, valores, None), dtype="string")
+
+
+def montar_dataframe(header, colunas, data_inicio=None, data_fim=None, apenas_pendentes=False):
+    """
+    Monta o DataFrame de rupturas a partir das colunas cruas. Só as linhas que passam
+    pelos filtros viram linhas do DataFrame; 'original_index' guarda a linha na planilha.
+    """
+    posicoes, datas = selecionar_linhas(header, colunas, data_inicio, data_fim, apenas_pendentes)
+    dados = {}
+    for indice, nome in enumerate(header):
+        valores = np.asarray(colunas[indice], dtype=object)[posicoes]
+        nome = RENOMEAR_COLUNAS.get(nome, nome)
+        if nome in COLUNAS_CATEGORICAS:
+            valores = _coluna_categorica(valores)
+        elif nome == COLUNA_CODIGO:
+            valores = _coluna_codigo(valores)
+        dados[indice] = valores
+    df = pd.DataFrame(dados)
+    df.columns = [RENOMEAR_COLUNAS.get(nome, nome) for nome in header]
+    if datas is not None:
+        df['timestamp'] = datas.to_numpy()
+
+    # Garante que a coluna 'Status Relatorio' exista
+    if COLUNA_STATUS not in df.columns:
+        df[COLUNA_STATUS] = ""
+
+    # Guarda o índice original para usar na hora de atualizar a planilha
+    df['original_index'] = posicoes + 2  # +2 porque a planilha começa em 1 e tem cabeçalho
+    # Cabeçalho original da planilha, usado para achar a letra da coluna de status na escrita
+    df.attrs['colunas_planilha'] = list(header)
+    return df
+
+
+# --- NORMALIZAÇÃO DAS TRATATIVAS ---
+# Executada uma única vez logo após a ingestão. Os geradores de relatório, a escrita de
+# status e o PDF gerencial leem as colunas abaixo em vez de repetir a limpeza.
+
+SEM_TRATATIVA = "Sem Tratativa"
+TRATATIVA_DIVERGENCIA = "Verificar Estoque (Divergência)"
+TRATATIVA_PEDIDO = "Será feito pedido"
+COLUNAS_NORMALIZADAS = ["tratada", "divergencia", "sera_feito_pedido"]
+
+
+def _preencher_tratativa(tratativa):
+    """Tratativas vazias viram SEM_TRATATIVA (aceita a coluna como texto ou categórica)."""
+    if isinstance(tratativa.dtype, pd.CategoricalDtype):
+        if "" in tratativa.cat.categories:
+            tratativa = tratativa.cat.remove_categories([""])
+        if SEM_TRATATIVA not in tratativa.cat.categories:
+            tratativa = tratativa.cat.add_categories([SEM_TRATATIVA])
+        return tratativa.fillna(SEM_TRATATIVA)
+    return tratativa.replace("", pd.NA).fillna(SEM_TRATATIVA)
+
+
+def normalizar_rupturas(df):
+    """
+    Retorna um novo DataFrame com 'tratativa' preenchida e as colunas booleanas
+    'tratada', 'divergencia' e 'sera_feito_pedido'. O DataFrame de entrada não é
+    alterado e o retornado deve ser tratado como somente leitura. Chamar de novo
+    sobre um DataFrame já normalizado não faz nada.
+    """
+    if df.attrs.get("normalizado") and all(coluna in df.columns for coluna in COLUNAS_NORMALIZADAS):
+        return df
+    tratativa = _preencher_tratativa(df["tratativa"])
+    df = df.assign(
+        tratativa=tratativa,
+        tratada=(tratativa != SEM_TRATATIVA).to_numpy(),
+        divergencia=(tratativa == TRATATIVA_DIVERGENCIA).to_numpy(),
+        sera_feito_pedido=(tratativa == TRATATIVA_PEDIDO).to_numpy(),
+    )
+    df.attrs["normalizado"] = True
+    return df
+
+
+# --- CONSOLIDAÇÃO DAS SOLICITAÇÕES REPETIDAS ---
+# Vários funcionários costumam informar o mesmo produto na mesma loja no mesmo período. Antes
+# dos relatórios, as solicitações com a mesma chave normalizada (loja, código do produto,
+# categoria) viram uma linha só. As linhas da planilha de todas elas ficam em 'linhas_origem',
+# para que a marcação de status continue carimbando cada solicitação.
+
+CONSOLIDAR_REPETIDAS = getattr(config, "CONSOLIDAR_REPETIDAS", True)
+
+
+def _texto_normalizado(serie):
+    return serie.astype("string").str.strip().str.casefold()
+
+
+def _grupos_repetidas(df):
+    """Número do grupo de cada linha, na ordem da primeira aparição, pelo hash da chave normalizada."""
+    codigo = _texto_normalizado(df[COLUNA_CODIGO]).str.replace(r"^0+(?=\d)", "", regex=True)
+    chaves = pd.DataFrame({"loja": _texto_normalizado(df["loja"]), "codigo": codigo,
+                           "categoria": _texto_normalizado(df["categoria"])})
+    grupos, _ = pd.factorize(pd.util.hash_pandas_object(chaves, index=False).to_numpy())
+    # Sem loja ou sem código não há como saber se é o mesmo produto: a linha fica sozinha
+    incompletas = (chaves["loja"].isna() | chaves["codigo"].isna() | (chaves["codigo"] == "")).to_numpy()
+    if incompletas.any():
+        grupos[incompletas] = grupos.max() + 1 + np.arange(incompletas.sum())
+        # Renumera pela primeira aparição, mantendo a ordem da planilha
+        grupos, _ = pd.factorize(grupos)
+    return grupos
+
+
+def linhas_de_origem(df, posicoes=None):
+    """Linhas da planilha das `posicoes` de `df` (todas, se None), incluindo as de cada linha consolidada."""
+    if "linhas_origem" not in df.columns:
+        linhas = df["original_index"].to_numpy()
+        return (linhas if posicoes is None else linhas[posicoes]).tolist()
+    grupos = df["linhas_origem"].to_numpy()
+    return [linha for grupo in (grupos if posicoes is None else grupos[posicoes]) for linha in grupo]
+
+
+def consolidar_repetidas(df):
+    """
+    Retorna um novo DataFrame com uma linha por (loja, código do produto, categoria):
+      - 'timestamp' e 'ultimo_timestamp': primeira e última solicitação;
+      - 'quantidade_solicitacoes': quantas solicitações foram consolidadas;
+      - 'nome_solicitante': os solicitantes, sem repetição, na ordem das solicitações;
+      - 'tratativa': a tratativa preenchida mais recente;
+      - 'linhas_origem': as linhas da planilha de todas as solicitações ('original_index' fica
+        com a da primeira).
+    As demais colunas vêm da solicitação mais recente. Sem repetições, o DataFrame volta como está.
+    """
+    if df.empty or COLUNA_CODIGO not in df.columns:
+        return df
+    grupos = _grupos_repetidas(df)
+    if grupos.max() + 1 == len(df):
+        return df
+
+    # Ordena por grupo e, dentro do grupo, por data: cada grupo vira uma faixa contígua [inicio, fim]
+    ordem = np.lexsort((df["timestamp"].to_numpy(), grupos))
+    ordenado = df.iloc[ordem]
+    grupos = grupos[ordem]
+    inicio = np.flatnonzero(np.r_[True, grupos[1:] != grupos[:-1]])
+    fim = np.r_[inicio[1:], len(grupos)] - 1
+    quantidade = fim - inicio + 1
+
+    # Tratativa preenchida mais recente de cada grupo (ou a da última solicitação, se nenhuma tiver)
+    tratativa = ordenado["tratativa"]
+    preenchida = (tratativa.notna() & ~tratativa.isin(["", SEM_TRATATIVA])).to_numpy()
+    ultima_preenchida = np.maximum.reduceat(np.where(preenchida, np.arange(len(ordenado)), -1), inicio)
+    posicao_tratativa = np.where(ultima_preenchida >= 0, ultima_preenchida, fim)
+
+    nomes = ordenado["nome_solicitante"].astype(object).to_numpy()
+    solicitantes = nomes[fim].copy()
+    for indice in np.flatnonzero(quantidade > 1):
+        faixa = nomes[inicio[indice]:fim[indice] + 1]
+        solicitantes[indice] = ", ".join(dict.fromkeys(nome for nome in faixa if isinstance(nome, str) and nome)) or None
+
+    linhas = ordenado["original_index"].to_numpy()
+    mais_recentes = ordenado.iloc[fim]
+    consolidado = mais_recentes.assign(
+        timestamp=ordenado["timestamp"].to_numpy()[inicio],
+        ultimo_timestamp=ordenado["timestamp"].to_numpy()[fim],
+        quantidade_solicitacoes=quantidade,
+        nome_solicitante=pd.Categorical(solicitantes),
+        tratativa=tratativa.iloc[posicao_tratativa].set_axis(mais_recentes.index),
+        original_index=linhas[inicio],
+        linhas_origem=[grupo.tolist() for grupo in np.split(linhas, inicio[1:])],
+    )
+    # Os grupos são numerados pela primeira aparição: a ordem da planilha é mantida
+    consolidado = consolidado.reset_index(drop=True)
+    consolidado.attrs = dict(df.attrs)
+    if consolidado.attrs.pop("normalizado", False):
+        consolidado = normalizar_rupturas(consolidado.drop(columns=COLUNAS_NORMALIZADAS))
+    return consolidado
@@ -0,0 +1,286 @@
+# instrumentacao.py
+
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# --- INSTRUMENTAÇÃO DA EXECUÇÃO ---
+# Enquanto houver uma execução ativa (`iniciar`), as funções decoradas com `@medir` registram
+# tempo, memória, linhas processadas e bytes de anexos por etapa, e toda chamada às APIs do
+# Google (HttpRequest.execute) tem quantidade e latência contadas por método. Sem execução
+# ativa, os decoradores não fazem nada além de chamar a função.
+
+_execucao = None
+_local = threading.local()
+
+
+def _rss_maximo_mb():
+    """Pico de memória residente do processo até agora, em MB (None onde não há `resource`)."""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KB; macOS, em bytes
+    return round(pico / (1024 * 1024 if pico > 1 << 32 else 1024), 1)
+
+
+def _tamanho(objeto):
+    """Quantidade de itens produzidos por uma etapa: len() de coleções, 1 para qualquer outro resultado."""
+    if objeto is None:
+        return 0
+    if isinstance(objeto, (str, bytes, os.PathLike)):
+        return 1
+    try:
+        return len(objeto)
+    except TypeError:
+        return 1
+
+
+class Execucao:
+    def __init__(self, perfil=False, memoria_detalhada=False):
+        self.inicio = datetime.now()
+        self.etapas = {}
+        self.api = {}
+        self.perfil = perfil
+        self.memoria_detalhada = memoria_detalhada
+        self._perfis = {}
+        self._perfil_ativo = False
+        self._lock = threading.Lock()
+        self._execute_original = None
+
+    # --- etapas ---
+
+    def _registro(self, nome):
+        registro = self.etapas.get(nome)
+        if registro is None:
+            registro = self.etapas[nome] = {
+                "chamadas": 0, "tempo_total_s": 0.0, "tempo_max_s": 0.0,
+                "linhas_entrada": 0, "itens_saida": 0, "bytes_anexos": 0,
+                "pico_memoria_python_mb": None, "rss_maximo_mb": None,
+            }
+        return registro
+
+    def registrar(self, nome, segundos, linhas_entrada=None, itens_saida=None, bytes_anexos=None, pico_memoria_mb=None):
+        with self._lock:
+            registro = self._registro(nome)
+            registro["chamadas"] += 1
+            registro["tempo_total_s"] += segundos
+            registro["tempo_max_s"] = max(registro["tempo_max_s"], segundos)
+            registro["linhas_entrada"] += linhas_entrada or 0
+            registro["itens_saida"] += itens_saida or 0
+            registro["bytes_anexos"] += bytes_anexos or 0
+            if pico_memoria_mb is not None:
+                registro["pico_memoria_python_mb"] = max(registro["pico_memoria_python_mb"] or 0, pico_memoria_mb)
+            registro["rss_maximo_mb"] = _rss_maximo_mb()
+
+    @contextmanager
+    def etapa(self, nome):
+        pilha = getattr(_local, "pilha", None)
+        if pilha is None:
+            pilha = _local.pilha = []
+        anotacoes = {"pico": 0, "linhas_entrada": None, "itens_saida": None, "bytes_anexos": None}
+
+        if self.memoria_detalhada and tracemalloc.is_tracing():
+            # O pico é global: o da etapa externa é preservado antes de zerar para a interna
+            if pilha:
+                pilha[-1]["pico"] = max(pilha[-1]["pico"], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+
+        perfil = None
+        if self.perfil and not self._perfil_ativo and threading.current_thread() is threading.main_thread():
+            perfil = self._perfis.setdefault(nome, cProfile.Profile())
+            self._perfil_ativo = True
+            perfil.enable()
+
+        pilha.append(anotacoes)
+        inicio = time.perf_counter()
+        try:
+            yield anotacoes
+        finally:
+            segundos = time.perf_counter() - inicio
+            pilha.pop()
+            if perfil is not None:
+                perfil.disable()
+                self._perfil_ativo = False
+            pico_mb = None
+            if self.memoria_detalhada and tracemalloc.is_tracing():
+                pico = max(anotacoes["pico"], tracemalloc.get_traced_memory()[1])
+                pico_mb = round(pico / (1024 * 1024), 1)
+                if pilha:
+                    pilha[-1]["pico"] = max(pilha[-1]["pico"], pico)
+            self.registrar(nome, segundos, anotacoes["linhas_entrada"], anotacoes["itens_saida"], anotacoes["bytes_anexos"], pico_mb)
+
+    # --- chamadas às APIs do Google ---
+
+    def registrar_api(self, metodo, segundos, erro=False):
+        with self._lock:
+            registro = self.api.setdefault(metodo, {"chamadas": 0, "erros": 0, "latencia_total_s": 0.0, "latencia_max_s": 0.0})
+            registro["chamadas"] += 1
+            registro["erros"] += int(erro)
+            registro["latencia_total_s"] += segundos
+            registro["latencia_max_s"] = max(registro["latencia_max_s"], segundos)
+
+    def instrumentar_api(self):
+        from googleapiclient.http import HttpRequest
+        if self._execute_original is not None:
+            return
+        execute_original = self._execute_original = HttpRequest.execute
+        execucao = self
+
+        @functools.wraps(execute_original)
+        def execute(request, *args, **kwargs):
+            inicio = time.perf_counter()
+            erro = True
+            try:
+                resposta = execute_original(request, *args, **kwargs)
+                erro = False
+                return resposta
+            finally:
+                execucao.registrar_api(getattr(request, "methodId", None) or "desconhecido", time.perf_counter() - inicio, erro)
+
+        HttpRequest.execute = execute
+
+    def remover_instrumentacao_api(self):
+        if self._execute_original is not None:
+            from googleapiclient.http import HttpRequest
+            HttpRequest.execute = self._execute_original
+            self._execute_original = None
+
+    # --- relatório ---
+
+    def relatorio(self):
+        etapas = {}
+        for nome, registro in self.etapas.items():
+            etapas[nome] = dict(registro, tempo_total_s=round(registro["tempo_total_s"], 4), tempo_max_s=round(registro["tempo_max_s"], 4))
+        api = {}
+        for metodo, registro in self.api.items():
+            api[metodo] = dict(registro, latencia_total_s=round(registro["latencia_total_s"], 4),
+                               latencia_max_s=round(registro["latencia_max_s"], 4),
+                               latencia_media_s=round(registro["latencia_total_s"] / registro["chamadas"], 4))
+        return {
+            "inicio": self.inicio.isoformat(timespec="seconds"),
+            "duracao_s": round((datetime.now() - self.inicio).total_seconds(), 3),
+            "rss_maximo_mb": _rss_maximo_mb(),
+            "etapas": etapas,
+            "api_google": api,
+        }
+
+    def salvar(self, pasta, prometheus=False):
+        """Grava o relatório JSON (e opcionalmente o textfile do Prometheus e os perfis) em `pasta`."""
+        os.makedirs(pasta, exist_ok=True)
+        sufixo = self.inicio.strftime("%H%M%S")
+        relatorio = self.relatorio()
+        caminho = os.path.join(pasta, f"relatorio_execucao_{sufixo}.json")
+        with open(caminho, "w", encoding="utf-8") as arquivo:
+            json.dump(relatorio, arquivo, ensure_ascii=False, indent=2)
+        if prometheus:
+            with open(os.path.join(pasta, "rupturas.prom"), "w", encoding="utf-8") as arquivo:
+                arquivo.write(formatar_prometheus(relatorio))
+        if self._perfis:
+            pasta_perfis = os.path.join(pasta, f"perfis_{sufixo}")
+            os.makedirs(pasta_perfis, exist_ok=True)
+            for nome, perfil in self._perfis.items():
+                perfil.dump_stats(os.path.join(pasta_perfis, f"{nome}.prof"))
+        return caminho
+
+
+def formatar_prometheus(relatorio):
+    linhas = [
+        "# HELP rupturas_etapa_segundos Tempo total gasto em cada etapa da execução.",
+        "# TYPE rupturas_etapa_segundos gauge",
+    ]
+    for nome, registro in relatorio["etapas"].items():
+        linhas.append(f'rupturas_etapa_segundos{{etapa="{nome}"}} {registro["tempo_total_s"]}')
+    linhas += ["# HELP rupturas_etapa_chamadas Quantidade de execuções de cada etapa.", "# TYPE rupturas_etapa_chamadas gauge"]
+    for nome, registro in relatorio["etapas"].items():
+        linhas.append(f'rupturas_etapa_chamadas{{etapa="{nome}"}} {registro["chamadas"]}')
+    linhas += ["# HELP rupturas_anexos_bytes Bytes de anexos produzidos por etapa.", "# TYPE rupturas_anexos_bytes gauge"]
+    for nome, registro in relatorio["etapas"].items():
+        linhas.append(f'rupturas_anexos_bytes{{etapa="{nome}"}} {registro["bytes_anexos"]}')
+    linhas += ["# HELP rupturas_api_chamadas Chamadas às APIs do Google por método.", "# TYPE rupturas_api_chamadas gauge"]
+    for metodo, registro in relatorio["api_google"].items():
+        linhas.append(f'rupturas_api_chamadas{{metodo="{metodo}"}} {registro["chamadas"]}')
+    linhas += ["# HELP rupturas_api_latencia_segundos Latência total das chamadas às APIs do Google.", "# TYPE rupturas_api_latencia_segundos gauge"]
+    for metodo, registro in relatorio["api_google"].items():
+        linhas.append(f'rupturas_api_latencia_segundos{{metodo="{metodo}"}} {registro["latencia_total_s"]}')
+    linhas += ["# HELP rupturas_duracao_segundos Duração total da execução.", "# TYPE rupturas_duracao_segundos gauge",
+               f'rupturas_duracao_segundos {relatorio["duracao_s"]}']
+    return "\n".join(linhas) + "\n"
+
+
+# --- API DO MÓDULO ---
+
+def iniciar(perfil=False, memoria_detalhada=False):
+    """Começa a instrumentar a execução. `perfil` liga o cProfile por etapa; `memoria_detalhada` liga o tracemalloc."""
+    global _execucao
+    _execucao = Execucao(perfil=perfil, memoria_detalhada=memoria_detalhada)
+    if memoria_detalhada and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _execucao.instrumentar_api()
+    return _execucao
+
+
+def finalizar(pasta=None, prometheus=False):
+    """Encerra a execução ativa, grava o relatório em `pasta` (se informada) e retorna o caminho."""
+    global _execucao
+    execucao, _execucao = _execucao, None
+    if execucao is None:
+        return None
+    execucao.remover_instrumentacao_api()
+    if execucao.memoria_detalhada and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    if pasta:
+        caminho = execucao.salvar(pasta, prometheus)
+        print(f"Relatório de execução salvo em '{caminho}'.")
+        return caminho
+    return None
+
+
+def execucao_atual():
+    return _execucao
+
+
+def registrar(nome, segundos, **valores):
+    """Registra uma medição feita fora de um `@medir` (ex.: etapas executadas em outro processo)."""
+    if _execucao is not None:
+        _execucao.registrar(nome, segundos, **valores)
+
+
+def anotar(**valores):
+    """Soma valores (linhas_entrada, itens_saida, bytes_anexos) à etapa em andamento nesta thread."""
+    pilha = getattr(_local, "pilha", None)
+    if _execucao is None or not pilha:
+        return
+    for chave, valor in valores.items():
+        pilha[-1][chave] = (pilha[-1].get(chave) or 0) + (valor or 0)
+
+
+def medir(nome):
+    """Decorador: mede a função como a etapa `nome` quando houver uma execução ativa."""
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def envoltorio(*args, **kwargs):
+            execucao = _execucao
+            if execucao is None:
+                return funcao(*args, **kwargs)
+            with execucao.etapa(nome) as anotacoes:
+                # Linhas de entrada: tamanho do primeiro DataFrame recebido
+                for argumento in list(args) + list(kwargs.values()):
+                    if hasattr(argumento, "columns") and hasattr(argumento, "index"):
+                        anotacoes["linhas_entrada"] = (anotacoes["linhas_entrada"] or 0) + len(argumento)
+                        break
+                resultado = funcao(*args, **kwargs)
+                anotacoes["itens_saida"] = (anotacoes["itens_saida"] or 0) + _tamanho(resultado)
+            return resultado
+        return envoltorio
+    return decorador
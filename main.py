@@ -1,23 +1,49 @@
 # main.py
 
 import os.path
-import pandas as pd
-import base64
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.application import MIMEApplication
 import sys
+import signal
+import argparse
+import importlib.util
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime
 import config
-import report_generator
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+import instrumentacao
+import regioes
+import servicos
 from googleapiclient.errors import HttpError
 from datetime import timedelta
 
+def _importar_tardio(nome):
+    """Registra o módulo `nome` para ser carregado só no primeiro acesso a um de seus atributos."""
+    if nome in sys.modules:
+        return sys.modules[nome]
+    spec = importlib.util.find_spec(nome)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    modulo = importlib.util.module_from_spec(spec)
+    sys.modules[nome] = modulo
+    spec.loader.exec_module(modulo)
+    return modulo
+
+# Os módulos abaixo carregam pandas, openpyxl, fpdf e o googleapiclient. Eles só são importados
+# na etapa que os usa, então `--help`, os erros de argumentos e a confirmação saem na hora.
+report_generator = _importar_tardio("report_generator")
+ingestao = _importar_tardio("ingestao")
+despacho_email = _importar_tardio("despacho_email")
+pipeline = _importar_tardio("pipeline")
+atualizacao_planilha = _importar_tardio("atualizacao_planilha")
+diario_envios = _importar_tardio("diario_envios")
+agregacoes = _importar_tardio("agregacoes")
+historico = _importar_tardio("historico")
+cache_artefatos = _importar_tardio("cache_artefatos")
+
+@instrumentacao.medir("autenticar")
 def autenticar():
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
     creds = None
     if os.path.exists("token.json"):
         creds = Credentials.from_authorized_user_file("token.json", config.SCOPES)
@@ -36,71 +62,48 @@ def autenticar():
             token.write(creds.to_json())
     return creds
 
+def servico_sheets(creds):
+    """Retorna o cliente da API do Sheets para estas credenciais, criando-o na primeira chamada."""
+    # Um cliente por thread: as regiões são processadas em paralelo com as mesmas credenciais
+    return servicos.servico("sheets", "v4", creds, por_thread=True)
+
+def renovar_credenciais(creds):
+    """Renova o token expirado entre as rodadas do modo daemon, mantendo o mesmo objeto de credenciais."""
+    if creds is not None and getattr(creds, "expired", False) and getattr(creds, "refresh_token", None):
+        from google.auth.transport.requests import Request
+        creds.refresh(Request())
+        with open("token.json", "w") as token:
+            token.write(creds.to_json())
+
+@instrumentacao.medir("enviar_email")
 def enviar_email(creds, para, assunto, corpo_html, nome_arquivo_anexo=None):
     try:
-        service = build("gmail", "v1", credentials=creds)
-        message = MIMEMultipart()
-        message["to"] = para
-        message["from"] = config.MEU_EMAIL_REMETENTE
-        message["subject"] = assunto
-        message.attach(MIMEText(corpo_html, "html"))
-        if nome_arquivo_anexo:
-            with open(nome_arquivo_anexo, "rb") as attachment:
-                part = MIMEApplication(attachment.read(), Name=os.path.basename(nome_arquivo_anexo))
-            part['Content-Disposition'] = f'attachment; filename="{os.path.basename(nome_arquivo_anexo)}"'
-            message.attach(part)
-        encoded_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
-        create_message = {"raw": encoded_message}
-        send_message = (service.users().messages().send(userId="me", body=create_message).execute())
-        print(f"E-mail enviado com sucesso para {para}. ID: {send_message['id']}")
+        with despacho_email.mensagem_em_arquivo(para, assunto, corpo_html, nome_arquivo_anexo) as arquivo:
+            if nome_arquivo_anexo:
+                instrumentacao.anotar(bytes_anexos=os.path.getsize(nome_arquivo_anexo))
+            id_mensagem = despacho_email.transporte_gmail(creds).enviar(arquivo)
+        print(f"E-mail enviado com sucesso para {para}. ID: {id_mensagem}")
     except HttpError as error:
         print(f"Ocorreu um erro ao enviar o e-mail: {error}")
 
-def ler_dados_planilha(creds):
+@instrumentacao.medir("ler_dados_planilha")
+def ler_dados_planilha(creds, data_inicio=None, data_fim=None, apenas_pendentes=False, incremental=None):
+    if incremental is None:
+        incremental = getattr(config, "LEITURA_INCREMENTAL", True)
     try:
-        service = build("sheets", "v4", credentials=creds)
-        sheet = service.spreadsheets()
-        result = (sheet.values().get(spreadsheetId=config.SPREADSHEET_ID, range=config.RANGE_NAME).execute())
-        values = result.get("values", [])
-        if not values or len(values) < 2:
+        sheet = servico_sheets(creds).spreadsheets()
+        if incremental:
+            header, colunas = ingestao.ler_incremental(sheet)
+        else:
+            header, colunas = ingestao.ler_completo(sheet)
+        if header is None:
             print("Nenhum dado encontrado na planilha.")
             return None
         
-        # *** INÍCIO DA CORREÇÃO ***
-        header = values[0]
-        data = values[1:]
-        
-        # Pega o número de colunas do cabeçalho (deve ser 14)
-        num_cols = len(header)
-        
-        # Garante que todas as linhas de dados tenham o mesmo número de colunas que o cabeçalho
-        # Adiciona células vazias ('') se uma linha for mais curta
-        padded_data = []
-        for row in data:
-            while len(row) < num_cols:
-                row.append('')
-            padded_data.append(row)
-            
-        # Cria o DataFrame com os dados já corrigidos
-        df = pd.DataFrame(padded_data, columns=header)
-        df.rename(columns={
-            'Carimbo de data/hora': 'timestamp',
-            'Informe a loja da ruptura': 'loja',
-            'Tratativa Comercial': 'tratativa',
-            'Informe o código do produto em ruptura': 'codigo_produto',
-            'Informe o produto em ruptura': 'produto',
-            'Informe a categoria da ruptura': 'categoria',
-            'Informe seu nome': 'nome_solicitante',
-            'A quanto tempo esse produto está em ruptura?': 'tempo_ruptura',
-        }, inplace=True)
-        # *** FIM DA CORREÇÃO ***
-        
-        # Garante que a coluna 'Status Relatorio' exista
-        if 'Status Relatorio' not in df.columns:
-            df['Status Relatorio'] = ""
-
-        # Guarda o índice original para usar na hora de atualizar a planilha
-        df['original_index'] = df.index + 2 # +2 porque a planilha começa em 1 e tem cabeçalho
+        # Os filtros de status e período são aplicados antes de montar o DataFrame
+        df = ingestao.montar_dataframe(header, colunas, data_inicio, data_fim, apenas_pendentes)
+        # Normalização das tratativas feita uma única vez; os relatórios só leem o resultado
+        df = ingestao.normalizar_rupturas(df)
         
         print(f"Leitura de {len(df)} registros concluída com sucesso!")
         return df
@@ -108,154 +111,529 @@ def ler_dados_planilha(creds):
         print(f"Ocorreu um erro na API do Sheets: {err}")
         return None
     
-def marcar_como_enviado(creds, df_processado):
+def linhas_tratadas(df):
+    """Linhas da planilha ('original_index') das solicitações que já têm tratativa (todas as de uma linha consolidada)."""
+    df = ingestao.normalizar_rupturas(df)
+    return ingestao.linhas_de_origem(df, df['tratada'].to_numpy())
+
+def timestamps_iso(df):
+    """{linha da planilha: timestamp ISO}, usado pelo diário para conferir se a linha não mudou."""
+    textos = df['timestamp'].dt.strftime('%Y-%m-%dT%H:%M:%S').fillna('')
+    return dict(zip(df['original_index'].tolist(), textos.tolist()))
+
+def letra_coluna_status(df):
+    """Letra da coluna 'Status Relatorio' a partir do cabeçalho lido (M se o cabeçalho não estiver disponível)."""
+    return ingestao.letra_da_coluna(df.attrs.get('colunas_planilha', []), ingestao.COLUNA_STATUS) or 'M'
+
+@instrumentacao.medir("marcar_como_enviado")
+def marcar_como_enviado(creds, df_processado, diario=None):
     print("\n--- ATUALIZANDO STATUS NA PLANILHA GOOGLE ---")
     if df_processado.empty:
         print("Nenhum registro para atualizar.")
         return
 
     try:
-        # --- INÍCIO DA NOVA LÓGICA ---
-        # Cria uma cópia para trabalhar e evitar avisos
-        df_a_marcar = df_processado.copy()
-
-        # Limpa a coluna 'tratativa' para identificar corretamente as não tratadas
-        df_a_marcar['tratativa'] = df_a_marcar['tratativa'].replace('', pd.NA)
-        df_a_marcar['tratativa'] = df_a_marcar['tratativa'].fillna("Sem Tratativa")
+        # Mantém APENAS as solicitações que foram tratadas
+        linhas = linhas_tratadas(df_processado)
 
-        # Agora, filtramos para manter APENAS as solicitações que foram tratadas
-        df_tratadas = df_a_marcar[df_a_marcar['tratativa'] != "Sem Tratativa"]
-        # --- FIM DA NOVA LÓGICA ---
-
-        if df_tratadas.empty:
+        if not linhas:
             print("Nenhuma solicitação tratada para marcar na planilha. As pendências continuarão aparecendo.")
             return
 
-        print(f"Encontradas {len(df_tratadas)} solicitações tratadas para marcar como 'Enviado'.")
-        
-        service = build("sheets", "v4", credentials=creds)
-        data_atualizacao = datetime.now().strftime('%Y-%m-%d %H:%M')
-        status_texto = f"Enviado em {data_atualizacao}"
-        
-        # Prepara os dados para a atualização em lote, usando apenas as linhas tratadas
-        data = []
-        for index in df_tratadas['original_index']:
-            data.append({
-                'range': f'RUPTURAS LOJAS!M{index}', # Coluna M = Status Relatorio
-                'values': [[status_texto]]
-            })
-            
-        body = {
-            'valueInputOption': 'USER_ENTERED',
-            'data': data
-        }
+        if diario is not None:
+            # Com o diário, só são marcadas as linhas cujo relatório teve o envio confirmado
+            pendentes = diario.pendentes()
+            status_por_linha = {linha: pendentes[linha]['status'] for linha in linhas if linha in pendentes}
+            if len(status_por_linha) < len(linhas):
+                print(f"{len(linhas) - len(status_por_linha)} solicitações tratadas não tiveram o envio confirmado e continuarão pendentes.")
+            if not status_por_linha:
+                return
+        else:
+            data_atualizacao = datetime.now().strftime('%Y-%m-%d %H:%M')
+            status_por_linha = dict.fromkeys(linhas, f"Enviado em {data_atualizacao}")
+
+        print(f"Encontradas {len(status_por_linha)} solicitações tratadas para marcar como 'Enviado'.")
         
-        result = service.spreadsheets().values().batchUpdate(
-            spreadsheetId=config.SPREADSHEET_ID, body=body).execute()
+        service = servico_sheets(creds)
+        total = atualizacao_planilha.escrever_status(service, status_por_linha, letra_coluna_status(df_processado), diario)
         
-        print(f"{result.get('totalUpdatedCells')} células atualizadas com sucesso na planilha.")
+        print(f"{total} células atualizadas com sucesso na planilha.")
         
     except HttpError as err:
         print(f"Ocorreu um erro ao atualizar a planilha: {err}")
+        if diario is not None:
+            print("As linhas não marcadas ficaram registradas e serão marcadas na próxima execução, sem reenviar e-mails.")
 
-def main():
-    print("="*60)
-    if config.MODO_TESTE:
-        print(f"ATENÇÃO: SCRIPT EM MODO DE TESTE. E-mails serão enviados para: {config.EMAIL_TESTE}")
-    else:
-        print("ATENÇÃO: SCRIPT EM MODO DE PRODUÇÃO.")
-    print("="*60)
-    
-    # *** NOVO MENU DE ESCOLHA DE PERÍODO ***
+@instrumentacao.medir("retomar_marcacoes_pendentes")
+def retomar_marcacoes_pendentes(creds, diario):
+    """Marca as linhas cujo e-mail saiu numa execução anterior que caiu antes de atualizar a planilha."""
+    pendentes = diario.pendentes()
+    if not pendentes:
+        return
+    print(f"\n--- RETOMANDO {len(pendentes)} MARCAÇÕES PENDENTES DA EXECUÇÃO ANTERIOR ---")
+    df_pendentes = ler_dados_planilha(creds, apenas_pendentes=True)
+    if df_pendentes is None:
+        return
+
+    # Só marca a linha se ela ainda está sem status e é a mesma solicitação (mesmo carimbo de data/hora)
+    timestamps = timestamps_iso(df_pendentes)
+    status_por_linha = {linha: info['status'] for linha, info in pendentes.items() if timestamps.get(linha) == info['timestamp']}
+    diario.registrar_marcadas(linha for linha in pendentes if linha not in status_por_linha)
+    if not status_por_linha:
+        return
+
+    try:
+        service = servico_sheets(creds)
+        total = atualizacao_planilha.escrever_status(service, status_por_linha, letra_coluna_status(df_pendentes), diario)
+        print(f"{total} células atualizadas com sucesso na planilha.")
+    except HttpError as err:
+        print(f"Ocorreu um erro ao atualizar a planilha: {err}")
+
+def ler_data(texto):
+    try:
+        return datetime.strptime(texto, '%d/%m/%Y')
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"data inválida '{texto}'. Use DD/MM/AAAA.")
+
+def ler_argumentos(argv=None):
+    parser = argparse.ArgumentParser(description="Gera e envia os relatórios de rupturas.")
+    periodo = parser.add_mutually_exclusive_group()
+    periodo.add_argument("--ultimos-dias", "--last-days", type=int, default=None, metavar="N",
+                         help="Processa as solicitações dos últimos N dias.")
+    periodo.add_argument("--de", "--from", dest="de", type=ler_data, default=None, metavar="DD/MM/AAAA",
+                         help="Início do período personalizado (use com --ate).")
+    parser.add_argument("--ate", "--to", dest="ate", type=ler_data, default=None, metavar="DD/MM/AAAA",
+                        help="Fim do período personalizado (inclui o dia todo; padrão: hoje).")
+    parser.add_argument("--sim", "--yes", "-y", dest="sim", action="store_true",
+                        help="Não pede confirmação (obrigatório quando não há terminal, ex.: agendador).")
+    parser.add_argument("--simular", "--dry-run", dest="simular", action="store_true",
+                        help="Lê a planilha e lista os relatórios que seriam enviados, sem gerar arquivos, enviar e-mails ou marcar a planilha.")
+    parser.add_argument("--reenviar", action="store_true",
+                        help="Envia de novo mesmo os e-mails idênticos a um já entregue (por padrão são suprimidos).")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Fica em execução consultando a planilha a cada --intervalo segundos e enviando os alertas das novas solicitações.")
+    parser.add_argument("--intervalo", type=int, default=getattr(config, "INTERVALO_DAEMON", 300),
+                        help="Segundos entre as consultas do modo daemon (padrão: %(default)s).")
+    parser.add_argument("--regiao", action="append", default=None, metavar="NOME",
+                        help="Processa só esta região de config.REGIOES (pode ser repetido; padrão: todas).")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Número de processos para gerar os relatórios (padrão: config.WORKERS ou o número de núcleos).")
+    parser.add_argument("--perfil", action="store_true", default=getattr(config, "PERFIL_ETAPAS", False),
+                        help="Grava um perfil do cProfile por etapa junto ao relatório de execução.")
+    parser.add_argument("--medir-memoria", action="store_true", default=getattr(config, "MEDIR_MEMORIA", False),
+                        help="Mede o pico de memória Python de cada etapa com tracemalloc (deixa a execução mais lenta).")
+    parser.add_argument("--prometheus", action="store_true", default=getattr(config, "METRICAS_PROMETHEUS", False),
+                        help="Grava também as métricas da execução no formato textfile do Prometheus.")
+    comandos = parser.add_subparsers(dest="comando", metavar="{recorrencias,em-aberto}",
+                                     help="Consultas ao histórico local (sem acessar a planilha).")
+    for nome, ajuda in (("recorrencias", "Produtos que entraram em ruptura repetidas vezes na mesma loja."),
+                        ("em-aberto", "Tempo entre a solicitação e o envio, por loja, para uma tratativa.")):
+        consulta = comandos.add_parser(nome, help=ajuda, description=ajuda)
+        consulta.add_argument("--loja", default=None, help="Número (ex.: 12) ou nome completo da loja.")
+        consulta.add_argument("--categoria", default=None)
+        consulta.add_argument("--dias", type=int, default=90, help="Janela em dias até hoje (padrão: %(default)s).")
+        # Destino próprio: o padrão do subcomando não pode apagar o --regiao dado antes dele
+        consulta.add_argument("--regiao", dest="regiao_consulta", default=None, metavar="NOME",
+                              help="Região de config.REGIOES consultada (padrão: a do --regiao geral ou a primeira).")
+        if nome == "recorrencias":
+            consulta.add_argument("--minimo", type=int, default=2, help="Ocorrências mínimas (padrão: %(default)s).")
+            consulta.add_argument("--limite", type=int, default=50, help="Máximo de produtos listados (padrão: %(default)s).")
+        else:
+            # Sem padrão aqui para não carregar o pandas só para montar a ajuda
+            consulta.add_argument("--tratativa", default=None, help="Tratativa consultada (padrão: 'Será feito pedido').")
+    args = parser.parse_args(argv)
+    if args.ate is not None and args.de is None:
+        parser.error("--ate exige --de.")
+    if args.daemon and args.de is not None:
+        parser.error("o modo daemon usa uma janela móvel; use --ultimos-dias.")
+    try:
+        consulta = getattr(args, "regiao_consulta", None)
+        args.regioes = regioes.configuradas([consulta] if consulta else args.regiao)
+    except ValueError as erro:
+        parser.error(str(erro))
+    return args
+
+def escolher_periodo_interativo():
     print("Selecione o período para análise das solicitações:")
     print("1 - Últimos 7 dias")
     print("2 - Definir um intervalo de datas personalizado")
     
-    data_inicio, data_fim = None, None
     hoje = datetime.now()
-
     while True:
         escolha = input("Digite sua escolha (1 ou 2): ").strip()
         if escolha == '1':
-            data_fim = hoje
-            data_inicio = hoje - timedelta(days=7)
-            break
+            return hoje - timedelta(days=7), hoje
         elif escolha == '2':
             try:
                 str_inicio = input("Digite a data de início (DD/MM/AAAA): ")
                 data_inicio = datetime.strptime(str_inicio, '%d/%m/%Y')
                 str_fim = input("Digite a data de fim (DD/MM/AAAA): ")
                 data_fim = datetime.strptime(str_fim, '%d/%m/%Y').replace(hour=23, minute=59, second=59) # Inclui o dia todo
-                break
+                return data_inicio, data_fim
             except ValueError:
                 print("Formato de data inválido. Por favor, use DD/MM/AAAA.")
         else:
             print("Escolha inválida. Tente novamente.")
-            
-    print(f"\nProcessando dados de {data_inicio.strftime('%d/%m/%Y')} a {data_fim.strftime('%d/%m/%Y')}")
 
-    confirmacao = input("Deseja continuar? (s/n): ").lower().strip()
-    if confirmacao not in ['s', 'sim']:
-        print("Operação cancelada pelo usuário.")
-        sys.exit()
-    
-    data_hoje_str = datetime.now().strftime('%Y-%m-%d')
-    pasta_principal = "Relatorios_Enviados"
-    pasta_de_hoje = os.path.join(pasta_principal, data_hoje_str)
+def definir_periodo(args):
+    """Período pelos argumentos; sem eles, pelo menu (em um terminal) ou os últimos 7 dias."""
+    hoje = datetime.now()
+    if args.de is not None:
+        data_fim = (args.ate or hoje).replace(hour=23, minute=59, second=59) # Inclui o dia todo
+        return args.de, data_fim
+    if args.ultimos_dias is not None:
+        return hoje - timedelta(days=args.ultimos_dias), hoje
+    if sys.stdin.isatty():
+        return escolher_periodo_interativo()
+    return hoje - timedelta(days=7), hoje
+
+def pasta_do_dia():
+    return os.path.join("Relatorios_Enviados", datetime.now().strftime('%Y-%m-%d'))
+
+@dataclass
+class Rodada:
+    """Resultado de uma rodada: as linhas processadas e o que a consolidação das regiões precisa."""
+    processadas: list = field(default_factory=list)
+    df: object = None               # uma linha por solicitação (histórico)
+    df_relatorios: object = None    # solicitações repetidas consolidadas (relatórios e marcação)
+    diario: object = None
+    agregados: object = None
+    # Tratadas que só aparecem no PDF gerencial, ainda não marcadas quando a rodada não envia o PDF
+    so_no_gerencial: dict = field(default_factory=dict)
+    status_texto: str = None
+
+def executar_rodada(creds, data_inicio, data_fim, pasta_de_hoje, workers=None, despachante=None, diario=None,
+                    simular=False, incluir_gerencial=True, despachadas=None, reenviar=False, cache=None, livro=None,
+                    marcar=True):
+    """
+    Lê as solicitações pendentes do período, gera e envia os relatórios e marca a planilha.
+    `despachante`, `diario`, `cache` e `livro` podem ser reaproveitados entre rodadas (modo daemon)
+    e entre regiões; `despachadas` ({(linha, tratativa)}) exclui as linhas já despachadas em rodadas
+    anteriores com a mesma tratativa. Com `simular`, só lista o que seria enviado. Com `reenviar`, e-mails idênticos a um já entregue
+    saem de novo em vez de serem suprimidos. Sem `marcar`, os envios não são registrados no diário
+    nem carimbados na planilha: as linhas continuam pendentes para a execução que monta o PDF
+    gerencial. Retorna a Rodada com as linhas processadas.
+    """
+    diario = diario or diario_envios.DiarioEnvios()
+    if not simular:
+        retomar_marcacoes_pendentes(creds, diario)
+
+    # Apenas as linhas ainda não enviadas e dentro do período escolhido são carregadas
+    df_periodo = ler_dados_planilha(creds, data_inicio, data_fim, apenas_pendentes=True)
+    if df_periodo is None:
+        return Rodada(diario=diario)
+
+    # Linhas cujo e-mail já saiu, mas que ainda não foram marcadas, não são reenviadas
+    excluir = set(diario.pendentes())
+    if excluir:
+        df_periodo = df_periodo[~df_periodo['original_index'].isin(list(excluir))]
+
+    # Linhas já despachadas pelo daemon só voltam se a tratativa mudou (ex.: passou a "Será feito pedido")
+    if despachadas:
+        chaves = zip(df_periodo['original_index'], df_periodo['tratativa'].astype(str))
+        df_periodo = df_periodo.loc[[chave not in despachadas for chave in chaves]]
+
+    if df_periodo.empty:
+        print("\nNenhuma nova solicitação encontrada para o período selecionado.")
+        return Rodada(diario=diario)
+    print(f"\n{len(df_periodo)} novas solicitações encontradas para processar.")
+
+    # Solicitações repetidas (mesma loja, código e categoria) viram uma linha só nos relatórios e no PDF;
+    # a marcação continua carimbando todas as linhas de origem
+    df_relatorios = df_periodo
+    if ingestao.CONSOLIDAR_REPETIDAS:
+        df_relatorios = ingestao.consolidar_repetidas(df_periodo)
+        if len(df_relatorios) < len(df_periodo):
+            print(f"{len(df_periodo) - len(df_relatorios)} solicitações repetidas consolidadas ({len(df_relatorios)} produtos em ruptura).")
+
     pasta_gerentes = os.path.join(pasta_de_hoje, "gerentes")
     pasta_compradores = os.path.join(pasta_de_hoje, "compradores")
-    
+
+    # Planejamento dos relatórios com o DataFrame já filtrado, particionado uma única vez por loja/categoria
+    # para os relatórios das lojas e agregado uma única vez para os corpos dos e-mails e o PDF gerencial
+    particoes = report_generator.indexar_particoes(df_relatorios)
+    agregados = report_generator.agregar(df_relatorios, data_inicio, data_fim)
+    artefatos = (report_generator.planejar_relatorios_gerentes(df_relatorios, pasta_gerentes, particoes, agregados)
+                 + report_generator.planejar_relatorios_compradores(df_relatorios, pasta_compradores, agregados))
+    if incluir_gerencial:
+        artefatos += report_generator.planejar_relatorio_gerencial(df_relatorios, pasta_de_hoje, data_inicio, data_fim, agregados)
+
+    rodada = Rodada(df_periodo['original_index'].tolist(), df_periodo, df_relatorios, diario, agregados)
+    if simular:
+        pipeline.imprimir_plano(artefatos)
+        return rodada
+
     os.makedirs(pasta_gerentes, exist_ok=True)
     os.makedirs(pasta_compradores, exist_ok=True)
-    
-    print("\nConfirmado. Iniciando processo...")
+
+    # Os e-mails são enviados em paralelo por um único despachante, reaproveitando o cliente do Gmail
+    despachante_proprio = despachante is None
+    if despachante_proprio:
+        despachante = despacho_email.DespachanteEmail(despacho_email.transporte_gmail(creds))
+
+    # Cada relatório de loja entregue registra no diário as linhas tratadas que ele cobre
+    status_texto = rodada.status_texto = f"Enviado em {datetime.now().strftime('%Y-%m-%d %H:%M')}"
+    timestamps = timestamps_iso(df_periodo)
+    linhas_enviadas = set()
+
+    def registrar_envio(artefato):
+        if marcar:
+            diario.registrar_enviadas({linha: timestamps[linha] for linha in artefato.linhas}, status_texto)
+        linhas_enviadas.update(artefato.linhas)
+
+    # Construção em paralelo (processos) e envio à medida que cada arquivo fica pronto; relatórios
+    # com os mesmos dados de uma execução anterior vêm do cache e e-mails idênticos não são reenviados
+    limpeza_propria = cache is None
+    cache = cache or cache_artefatos.CacheArtefatos()
+    livro = livro or cache_artefatos.LivroEnvios(suprimir=not reenviar, periodo=(data_inicio, data_fim))
+    # O despachante pode ser compartilhado entre regiões: a rodada espera só os seus e-mails (e o registro
+    # deles no diário e no livro de envios) antes de marcar a planilha
+    lote = despacho_email.LoteEnvios(despachante)
+    resultados = pipeline.construir_e_enviar(creds, artefatos, lote.enviar, workers, ao_enviar=registrar_envio,
+                                             cache=cache, livro=livro)
+    pipeline.imprimir_resumo(resultados)
+    resultados_envio = lote.aguardar()
+    if despachante_proprio:
+        despachante.encerrar()
+    despacho_email.imprimir_resumo(resultados_envio)
+
+    # Tratadas que não estão em nenhum relatório de loja (ex.: loja sem gerente cadastrado) só entram no PDF
+    # gerencial; sem o PDF nesta rodada, elas ficam na Rodada para quem enviar o PDF (consolidado das regiões)
+    cobertas = {linha for artefato in artefatos if artefato.tipo == "gerente" for linha in (artefato.linhas or [])}
+    so_no_gerencial = {linha: timestamps[linha] for linha in linhas_tratadas(df_relatorios) if linha not in cobertas}
+    if incluir_gerencial:
+        diario.registrar_enviadas(so_no_gerencial, status_texto)
+        linhas_enviadas.update(so_no_gerencial)
+    else:
+        rodada.so_no_gerencial = so_no_gerencial
+
+    # Marca na planilha as linhas com envio confirmado
+    if marcar:
+        marcar_como_enviado(creds, df_relatorios, diario)
+        diario.compactar()
+
+    # Os agregados do período ficam guardados para a evolução do próximo PDF gerencial
+    if incluir_gerencial:
+        agregacoes.salvar(agregados)
+
+    # Todas as linhas processadas vão para o histórico local (consultas de recorrência)
+    with historico.HistoricoRupturas() as banco:
+        banco.registrar(df_periodo, enviadas=linhas_enviadas)
+
+    # Limpeza: cache por idade/tamanho, livro de envios e pastas diárias antigas (por quem os criou)
+    if limpeza_propria:
+        limpar_armazenamento(cache, livro)
+    return rodada
+
+def limpar_armazenamento(cache, livro):
+    cache.limpar()
+    livro.compactar()
+    cache_artefatos.limpar_pastas_antigas()
+
+def _preparar_threads():
+    """
+    Carrega os módulos de importação tardia antes de abrir as threads das regiões: o LazyLoader
+    não é seguro quando duas threads disparam a carga do mesmo módulo ao mesmo tempo.
+    """
+    for modulo in (report_generator, ingestao, despacho_email, pipeline, atualizacao_planilha,
+                   diario_envios, agregacoes, historico, cache_artefatos):
+        getattr(modulo, "__spec__")  # o primeiro acesso a um atributo executa o módulo
+
+@instrumentacao.medir("relatorio_gerencial_consolidado")
+def enviar_gerencial_consolidado(creds, lista_regioes, rodadas, data_inicio, data_fim, pasta_de_hoje, workers,
+                                 despachante, simular=False, cache=None, livro=None):
+    """
+    PDF gerencial de todas as regiões, montado somando os agregados de cada uma (sem reler as
+    planilhas), para a lista gerencial do config. Depois do envio, marca nas regiões sem PDF próprio
+    as tratadas que só aparecem no gerencial.
+    """
+    consolidado = agregacoes.combinar([rodada.agregados for rodada in rodadas], (data_inicio, data_fim))
+    if consolidado is None:
+        return
+    print("\n--- RELATÓRIO GERENCIAL CONSOLIDADO DAS REGIÕES ---")
+    artefatos = report_generator.planejar_relatorio_gerencial(None, pasta_de_hoje, data_inicio, data_fim, consolidado)
+    if simular:
+        pipeline.imprimir_plano(artefatos)
+        return
+    lote = despacho_email.LoteEnvios(despachante)
+    resultados = pipeline.construir_e_enviar(creds, artefatos, lote.enviar, workers, cache=cache, livro=livro)
+    pipeline.imprimir_resumo(resultados)
+    despacho_email.imprimir_resumo(lote.aguardar())
+
+    for regiao, rodada in zip(lista_regioes, rodadas):
+        if regiao.gerencial_proprio or not rodada.so_no_gerencial:
+            continue
+        linhas = list(rodada.so_no_gerencial)
+        with regioes.ativar(regiao):
+            rodada.diario.registrar_enviadas(rodada.so_no_gerencial, rodada.status_texto)
+            # 'original_index' de uma linha consolidada é a sua primeira linha de origem, que também está em `linhas`
+            marcar_como_enviado(creds, rodada.df_relatorios[rodada.df_relatorios['original_index'].isin(linhas)], rodada.diario)
+            rodada.diario.compactar()
+            with historico.HistoricoRupturas() as banco:
+                banco.registrar(rodada.df[rodada.df['original_index'].isin(linhas)], enviadas=rodada.so_no_gerencial)
+
+    # Os agregados consolidados ficam na pasta raiz, para a evolução do próximo PDF consolidado
+    agregacoes.salvar(consolidado)
+
+def executar_regioes(creds, lista_regioes, data_inicio, data_fim, pasta_de_hoje, workers=None, simular=False,
+                     reenviar=False, despachante=None, diarios=None, despachadas=None, incluir_gerencial=True, marcar=True):
+    """
+    Processa as regiões de config.REGIOES ao mesmo tempo, uma thread por região, cada uma com a sua
+    configuração ativa e as suas pastas. Credenciais, clientes das APIs (e o seu orçamento de
+    requisições), despachante de e-mails, cache e livro de envios são compartilhados. Com
+    `incluir_gerencial`, no fim sai o PDF gerencial consolidado. `diarios` e `despachadas`
+    ({nome da região: ...}) permitem reaproveitar o estado entre rodadas (modo daemon); `marcar`
+    é repassado a `executar_rodada`.
+    Retorna {nome da região: Rodada}.
+    """
+    _preparar_threads()
+    diarios = diarios if diarios is not None else {}
+    despachadas = despachadas or {}
+    despachante_proprio = despachante is None
+    if despachante_proprio and not simular:
+        despachante = despacho_email.DespachanteEmail(despacho_email.transporte_gmail(creds))
+    cache = cache_artefatos.CacheArtefatos()
+    livro = cache_artefatos.LivroEnvios(suprimir=not reenviar, periodo=(data_inicio, data_fim))
+    # Os processos de construção são divididos entre as regiões
+    workers_por_regiao = max(1, (workers or pipeline.numero_de_workers()) // len(lista_regioes))
+
+    def processar(regiao):
+        with regioes.ativar(regiao):
+            if regiao.nome:
+                print(f"\n=== REGIÃO {regiao.nome} ===")
+            if regiao.nome not in diarios:
+                diarios[regiao.nome] = diario_envios.DiarioEnvios()
+            return executar_rodada(creds, data_inicio, data_fim, regioes.subpasta(pasta_de_hoje), workers_por_regiao,
+                                   despachante=despachante, diario=diarios[regiao.nome], simular=simular,
+                                   incluir_gerencial=incluir_gerencial and regiao.gerencial_proprio,
+                                   despachadas=despachadas.get(regiao.nome), reenviar=reenviar, cache=cache, livro=livro,
+                                   marcar=marcar)
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(lista_regioes), thread_name_prefix="regiao") as executor:
+            futuros = [executor.submit(processar, regiao) for regiao in lista_regioes]
+        rodadas = []
+        for regiao, futuro in zip(lista_regioes, futuros):
+            try:
+                rodadas.append(futuro.result())
+            except Exception as e:
+                # A falha de uma região não impede as outras nem o consolidado (que sai sem ela)
+                print(f"Falha ao processar a região {regiao.nome}: {e}")
+                rodadas.append(Rodada())
+        if incluir_gerencial:
+            enviar_gerencial_consolidado(creds, lista_regioes, rodadas, data_inicio, data_fim, pasta_de_hoje, workers,
+                                         despachante, simular, cache, livro)
+    finally:
+        # Os envios já foram resumidos por etapa (LoteEnvios.aguardar)
+        if despachante_proprio and despachante is not None:
+            despachante.encerrar()
+    if not simular:
+        limpar_armazenamento(cache, livro)
+    return dict(zip((regiao.nome for regiao in lista_regioes), rodadas))
+
+def executar_daemon(args, workers):
+    """
+    Consulta a planilha a cada `args.intervalo` segundos e envia os alertas de loja e de compradores
+    só das solicitações que ainda não foram despachadas com a tratativa atual: uma linha que passa
+    a "Será feito pedido" depois do primeiro alerta sai de novo, uma vez, para o comprador. As linhas
+    despachadas ficam no diário de envios, então reiniciar o daemon não repete os alertas.
+    Credenciais, clientes das APIs, despachante e diário são criados uma vez e reaproveitados em
+    todas as rodadas. O PDF gerencial fica para a execução periódica normal, que lê só as linhas sem
+    status: por isso o daemon não carimba a planilha e a marcação também fica com a execução normal.
+    Com config.REGIOES, cada rodada consulta as planilhas de todas as regiões.
+    """
+    dias = args.ultimos_dias if args.ultimos_dias is not None else 7
+    parar = threading.Event()
+    for sinal in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sinal, lambda *_: parar.set())
+
     creds = autenticar()
-    df_full = ler_dados_planilha(creds)
+    diarios = {}
+    for regiao in args.regioes:
+        with regioes.ativar(regiao):
+            diarios[regiao.nome] = diario_envios.DiarioEnvios()
+    despachadas = {nome: diario.despachadas() for nome, diario in diarios.items()}
+    print(f"Modo daemon: consultando a planilha a cada {args.intervalo}s (janela de {dias} dias). Ctrl+C para encerrar.")
+    with despacho_email.DespachanteEmail(despacho_email.transporte_gmail(creds)) as despachante:
+        while not parar.is_set():
+            inicio_rodada = datetime.now()
+            pasta_de_hoje = pasta_do_dia()
+            instrumentacao.iniciar(perfil=args.perfil, memoria_detalhada=args.medir_memoria)
+            processadas = []
+            try:
+                renovar_credenciais(creds)
+                rodadas = executar_regioes(creds, args.regioes, inicio_rodada - timedelta(days=dias), inicio_rodada, pasta_de_hoje,
+                                           workers, simular=args.simular, reenviar=args.reenviar, despachante=despachante,
+                                           diarios=diarios, despachadas=despachadas, incluir_gerencial=False, marcar=False)
+                for nome, rodada in rodadas.items():
+                    if not rodada.processadas:
+                        continue
+                    tratativas = dict(zip(rodada.processadas, rodada.df['tratativa'].astype(str)))
+                    despachadas[nome].update(tratativas.items())
+                    if not args.simular:
+                        diarios[nome].registrar_despachadas(tratativas)
+                    processadas += rodada.processadas
+            except Exception as e:
+                # Uma falha (rede, API) não derruba o daemon; a rodada é tentada de novo no próximo ciclo
+                print(f"Falha na rodada de {inicio_rodada.strftime('%H:%M:%S')}: {e}")
+            finally:
+                instrumentacao.finalizar(pasta_de_hoje if processadas and not args.simular else None, prometheus=args.prometheus)
+            parar.wait(args.intervalo)
+    print("\nModo daemon encerrado.")
 
-    if df_full is not None:
-        # *** NOVA LÓGICA DE FILTRAGEM ***
-        # 1. Filtra apenas as linhas que ainda não foram enviadas
-        df_para_processar = df_full[df_full['Status Relatorio'] == ''].copy()
+def consultar_historico(args):
+    # O histórico é separado por planilha: a consulta é a da região escolhida (padrão: a primeira)
+    with regioes.ativar(args.regioes[0]), historico.HistoricoRupturas() as banco:
+        if args.comando == "recorrencias":
+            historico.imprimir_recorrencias(banco.recorrencias(args.loja, args.categoria, dias=args.dias, minimo=args.minimo, limite=args.limite))
+        else:
+            tratativa = args.tratativa or ingestao.TRATATIVA_PEDIDO
+            historico.imprimir_tempo_em_aberto(banco.tempo_em_aberto(tratativa, args.loja, args.categoria, dias=args.dias))
 
-        # 2. Converte a coluna de data e filtra pelo período escolhido
-        df_para_processar['timestamp'] = pd.to_datetime(df_para_processar['timestamp'], dayfirst=True)
-        df_periodo = df_para_processar[(df_para_processar['timestamp'] >= data_inicio) & (df_para_processar['timestamp'] <= data_fim)].copy()
+def main(argv=None):
+    args = ler_argumentos(argv)
+    if args.comando:
+        consultar_historico(args)
+        return
+    workers = pipeline.numero_de_workers(args.workers)
+    print("="*60)
+    if config.MODO_TESTE:
+        print(f"ATENÇÃO: SCRIPT EM MODO DE TESTE. E-mails serão enviados para: {config.EMAIL_TESTE}")
+    else:
+        print("ATENÇÃO: SCRIPT EM MODO DE PRODUÇÃO.")
+    if args.simular:
+        print("SIMULAÇÃO: nenhum arquivo será gerado, nenhum e-mail enviado e a planilha não será alterada.")
+    print("="*60)
 
+    if args.daemon:
+        executar_daemon(args, workers)
+        return
+
+    data_inicio, data_fim = definir_periodo(args)
+    print(f"\nProcessando dados de {data_inicio.strftime('%d/%m/%Y')} a {data_fim.strftime('%d/%m/%Y')}")
 
-        if df_periodo.empty:
-            print("\nNenhuma nova solicitação encontrada para o período selecionado.")
+    if not (args.sim or args.simular):
+        if not sys.stdin.isatty():
+            print("Execução sem terminal: use --sim para confirmar o envio. Operação cancelada.")
+            sys.exit(1)
+        confirmacao = input("Deseja continuar? (s/n): ").lower().strip()
+        if confirmacao not in ['s', 'sim']:
+            print("Operação cancelada pelo usuário.")
+            sys.exit()
+
+    pasta_de_hoje = pasta_do_dia()
+    print("\nConfirmado. Iniciando processo...")
+    instrumentacao.iniciar(perfil=args.perfil, memoria_detalhada=args.medir_memoria)
+    try:
+        creds = autenticar()
+        if len(args.regioes) == 1 and not args.regioes[0].nome:
+            executar_rodada(creds, data_inicio, data_fim, pasta_de_hoje, workers, simular=args.simular, reenviar=args.reenviar)
         else:
-            print(f"\n{len(df_periodo)} novas solicitações encontradas para processar.")
-            
-            # Geração dos relatórios com o DataFrame já filtrado
-            report_generator.gerar_relatorios_gerentes(creds, df_periodo, pasta_gerentes, enviar_email)
-            report_generator.gerar_relatorios_compradores(creds, df_periodo, pasta_compradores, enviar_email)
-            caminho_pdf_gerencial = report_generator.gerar_relatorio_gerencial_pdf(df_periodo, pasta_de_hoje, data_inicio, data_fim)
-            
-
-            if caminho_pdf_gerencial:
-                print("\n--- ENVIANDO RELATÓRIO GERENCIAL POR E-MAIL ---")
-                assunto = f"Relatório Gerencial de Rupturas - {data_inicio.strftime('%d/%m')} a {data_fim.strftime('%d/%m')}"
-                corpo_html = f"""
-                <html>
-                    <body>
-                        <p>Prezado(a),</p>
-                        <p>Segue em anexo o relatório gerencial consolidado de rupturas, referente ao período de {data_inicio.strftime('%d/%m/%Y')} a {data_fim.strftime('%d/%m/%Y')}.</p>
-                        <br>
-                        <p>Atenciosamente,<br>Equipe Comercial</p>
-                    </body>
-                </html>
-                """
-                
-                destinatarios = [config.EMAIL_TESTE] if config.MODO_TESTE else config.GERENCIAL_EMAILS
-                
-                for destinatario in destinatarios:
-                    enviar_email(creds, destinatario, assunto, corpo_html, caminho_pdf_gerencial)
-
-            # Marca as linhas processadas como enviadas na planilha
-            marcar_como_enviado(creds, df_periodo)
-            
-        print("\nProcesso concluído!")
+            executar_regioes(creds, args.regioes, data_inicio, data_fim, pasta_de_hoje, workers,
+                             simular=args.simular, reenviar=args.reenviar)
+    finally:
+        instrumentacao.finalizar(None if args.simular else pasta_de_hoje, prometheus=args.prometheus)
+    print("\nProcesso concluído!")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
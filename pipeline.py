@@ -0,0 +1,148 @@
+# pipeline.py
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+import config
+import instrumentacao
+import report_generator
+import cache_artefatos
+
+
+def numero_de_workers(workers=None):
+    """Resolve o paralelismo do estágio de construção: argumento > config.WORKERS > número de núcleos."""
+    if workers is None:
+        workers = getattr(config, "WORKERS", None) or os.cpu_count() or 1
+    return max(1, int(workers))
+
+
+def contexto_processos():
+    """
+    Contexto do pool de construção. Os processos saem de um servidor (forkserver) e não de um fork
+    do processo principal: com as regiões, o pool é criado dentro de uma thread enquanto outras
+    threads (regiões, envio de e-mails) escrevem na saída, e o filho de um fork nesse momento pode
+    travar num lock copiado já ocupado (ex.: o do stdout). config.INICIO_PROCESSOS troca o método.
+    """
+    metodo = getattr(config, "INICIO_PROCESSOS", "forkserver")
+    if metodo not in multiprocessing.get_all_start_methods():
+        metodo = None  # ex.: forkserver no Windows, que só tem spawn
+    return multiprocessing.get_context(metodo)
+
+
+def construir_e_enviar(creds, artefatos, enviar_email_func, workers=None, ao_enviar=None, cache=None, livro=None):
+    """
+    Executa a rodada em dois estágios:
+      1. Construção: gera planilhas e PDF em paralelo num pool de processos.
+      2. Envio: consome os artefatos à medida que ficam prontos e os entrega ao `enviar_email_func`
+         (normalmente `DespachanteEmail.enviar`, que também é assíncrono).
+
+    `ao_enviar(artefato)` é chamado quando todos os e-mails de um artefato com `linhas`
+    forem entregues com sucesso (usado para registrar as linhas no diário de envios).
+
+    Com `cache` (CacheArtefatos), artefatos cujos dados não mudaram são reaproveitados sem
+    passar pelo pool; com `livro` (LivroEnvios), e-mails idênticos a um já entregue não saem de novo.
+
+    Retorna [(artefato, erro)] na ordem dos artefatos recebidos, independente da ordem em
+    que terminaram; `erro` é None quando o artefato foi gerado.
+    """
+    workers = numero_de_workers(workers)
+    erros = {}
+
+    a_construir = []
+    for indice, artefato in enumerate(artefatos):
+        if cache is not None:
+            artefato.hash = cache_artefatos.chave_artefato(artefato)
+            if cache.obter(artefato.hash, artefato.caminho):
+                print(f"Relatório '{artefato.chave}' sem alterações: reaproveitado do cache.")
+                reaproveitado = lambda caminho=artefato.caminho: (caminho, 0.0, os.path.getsize(caminho))
+                erros[indice] = _entregar(creds, artefato, enviar_email_func, reaproveitado, ao_enviar, livro=livro,
+                                          etapa=f"reaproveitar_{artefato.tipo}")
+                continue
+        a_construir.append(indice)
+
+    if workers == 1 or len(a_construir) <= 1:
+        for indice in a_construir:
+            artefato = artefatos[indice]
+            erros[indice] = _entregar(creds, artefato, enviar_email_func, lambda: _construir_medindo(artefato), ao_enviar, cache, livro)
+        return [(artefato, erros[indice]) for indice, artefato in enumerate(artefatos)]
+
+    print(f"\nConstruindo {len(a_construir)} relatórios com {workers} processos...")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=contexto_processos()) as executor:
+        futuros = {executor.submit(_construir_medindo, artefatos[indice]): indice for indice in a_construir}
+        for futuro in as_completed(futuros):
+            indice = futuros[futuro]
+            erros[indice] = _entregar(creds, artefatos[indice], enviar_email_func, futuro.result, ao_enviar, cache, livro)
+
+    return [(artefato, erros[indice]) for indice, artefato in enumerate(artefatos)]
+
+
+def _construir_medindo(artefato):
+    """Constrói o artefato e retorna (caminho, segundos, bytes); roda no processo de trabalho."""
+    inicio = time.perf_counter()
+    caminho = report_generator.construir_artefato(artefato)
+    tamanho = os.path.getsize(caminho) if caminho and os.path.exists(caminho) else 0
+    return caminho, time.perf_counter() - inicio, tamanho
+
+
+def _entregar(creds, artefato, enviar_email_func, obter_caminho, ao_enviar=None, cache=None, livro=None, etapa=None):
+    try:
+        caminho, segundos, tamanho = obter_caminho()
+    except Exception as e:
+        print(f"Falha ao gerar o relatório '{artefato.chave}': {e}")
+        return str(e)
+    # Os processos de trabalho não têm a instrumentação ativa: a medição volta com o resultado
+    instrumentacao.registrar(etapa or f"construir_{artefato.tipo}", segundos, itens_saida=1 if caminho else 0, bytes_anexos=tamanho)
+    if caminho:
+        if cache is not None and artefato.hash:
+            cache.guardar(artefato.hash, caminho)
+        # Relatórios acima do limite do e-mail são compactados ou divididos (usa as abas)
+        artefato.anexos = report_generator.preparar_anexos(artefato)
+    # Os dados de entrada não são mais necessários depois que os arquivos existem
+    artefato.abas = None
+    artefato.dados = None
+    if not caminho:
+        return "Nenhum arquivo gerado."
+    retornos = report_generator.enviar_artefato(creds, artefato, enviar_email_func, livro)
+    if ao_enviar is not None and artefato.linhas:
+        _ao_concluir_envios(artefato, retornos, ao_enviar)
+    return None
+
+
+def _ao_concluir_envios(artefato, retornos, ao_enviar):
+    """Chama `ao_enviar(artefato)` quando todos os envios do artefato terminarem com sucesso."""
+    futuros = [retorno for retorno in retornos if isinstance(retorno, Future)]
+    if not futuros:
+        # Envio síncrono (ex.: main.enviar_email): chegando aqui, os e-mails já saíram
+        ao_enviar(artefato)
+        return
+    restantes = [len(futuros)]
+    lock = threading.Lock()
+
+    def concluido(futuro):
+        if futuro.exception() is not None or not getattr(futuro.result(), "sucesso", True):
+            return
+        with lock:
+            restantes[0] -= 1
+            completo = restantes[0] == 0
+        if completo:
+            ao_enviar(artefato)
+
+    for futuro in futuros:
+        futuro.add_done_callback(concluido)
+
+
+def imprimir_plano(artefatos):
+    """Lista os relatórios planejados (usado em --simular), sem gerar arquivos nem enviar e-mails."""
+    print(f"\n{len(artefatos)} relatórios seriam gerados e enviados:")
+    for artefato in artefatos:
+        linhas = f", {len(artefato.linhas)} linhas a marcar" if artefato.linhas else ""
+        print(f"  {artefato.tipo} '{artefato.chave}' -> {', '.join(artefato.destinatarios)}{linhas}")
+
+
+def imprimir_resumo(resultados):
+    falhas = [(artefato, erro) for artefato, erro in resultados if erro]
+    print(f"\n{len(resultados) - len(falhas)} de {len(resultados)} relatórios gerados.")
+    for artefato, erro in falhas:
+        print(f"  FALHA: {artefato.tipo} '{artefato.chave}': {erro}")
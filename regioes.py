@@ -0,0 +1,96 @@
+# regioes.py
+
+import contextvars
+import os
+import re
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+import config
+
+# --- REGIÕES (VÁRIAS PLANILHAS NA MESMA EXECUÇÃO) ---
+# config.REGIOES lista as regiões, cada uma com a sua planilha de formulário, lojas e compradores.
+# Qualquer configuração não informada na região vem do próprio config:
+#
+#   REGIOES = [
+#       {"nome": "PB-RN", "SPREADSHEET_ID": "...", "RANGE_NAME": "RUPTURAS LOJAS!A:N"},
+#       {"nome": "CE", "SPREADSHEET_ID": "...", "GERENTES_EMAILS": {...}, "LOJAS_PB": [...],
+#        "LOJAS_RN1": [], "LOJAS_RN2": [], "COMPRADORES_PB_EMAILS": {...}, "GERENCIAL_EMAILS": [...]},
+#   ]
+#
+# Sem REGIOES, há uma única região, sem nome, que usa o config como está (e as pastas de sempre).
+# Cada região é processada com a sua configuração ativa (`ativar`, por contextvars, então várias
+# regiões podem rodar ao mesmo tempo em threads diferentes) e com as suas próprias pastas de saída,
+# cache da planilha, diário de envios e histórico de agregados (`subpasta`).
+
+_ativa = contextvars.ContextVar("regiao", default=None)
+_SEM_PADRAO = object()
+
+
+@dataclass
+class Regiao:
+    nome: str = None
+    configuracoes: dict = field(default_factory=dict)
+
+    @property
+    def pasta(self):
+        """Nome da subpasta da região ('' para a região única sem nome)."""
+        return re.sub(r"[^\w\-]+", "_", self.nome).strip("_") if self.nome else ""
+
+    @property
+    def gerencial_proprio(self):
+        """Se a região tem a sua própria lista gerencial (e, portanto, o seu próprio PDF)."""
+        return "GERENCIAL_EMAILS" in self.configuracoes
+
+
+def configuradas(nomes=None):
+    """Regiões do config.REGIOES, na ordem do config, opcionalmente só as de `nomes`."""
+    definicoes = getattr(config, "REGIOES", None)
+    if not definicoes:
+        if nomes:
+            raise ValueError("config.REGIOES não está definido.")
+        return [Regiao()]
+    regioes = []
+    for definicao in definicoes:
+        definicao = dict(definicao)
+        nome = definicao.pop("nome", None)
+        if not nome or "SPREADSHEET_ID" not in definicao:
+            raise ValueError(f"Cada região de config.REGIOES precisa de 'nome' e 'SPREADSHEET_ID' (região: {nome!r}).")
+        regioes.append(Regiao(nome, definicao))
+    if nomes:
+        desconhecidas = set(nomes) - {regiao.nome for regiao in regioes}
+        if desconhecidas:
+            raise ValueError(f"Região não configurada: {', '.join(sorted(desconhecidas))}.")
+        regioes = [regiao for regiao in regioes if regiao.nome in nomes]
+    return regioes
+
+
+@contextmanager
+def ativar(regiao):
+    """Torna `regiao` a região ativa no contexto atual (thread) até o fim do bloco."""
+    token = _ativa.set(regiao)
+    try:
+        yield regiao
+    finally:
+        _ativa.reset(token)
+
+
+def atual():
+    return _ativa.get()
+
+
+def valor(nome, padrao=_SEM_PADRAO):
+    """Configuração `nome` da região ativa, ou do config se a região não a define."""
+    regiao = _ativa.get()
+    if regiao is not None and nome in regiao.configuracoes:
+        return regiao.configuracoes[nome]
+    if padrao is _SEM_PADRAO:
+        return getattr(config, nome)
+    return getattr(config, nome, padrao)
+
+
+def subpasta(pasta):
+    """`pasta` da região ativa: `pasta/<região>` quando a região tem nome, senão a própria `pasta`."""
+    regiao = _ativa.get()
+    if regiao is None or not regiao.nome:
+        return pasta
+    return os.path.join(pasta, regiao.pasta)
@@ -1,14 +1,20 @@
 # report_generator.py
 
 import pandas as pd
+import numpy as np
 import os
 import unicodedata
 import re
-from openpyxl import load_workbook
-from openpyxl.styles import PatternFill, Font
-from openpyxl.utils import get_column_letter
+import zipfile
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache, partial
+from types import SimpleNamespace
 import config
-from fpdf import FPDF
+import ingestao
+import instrumentacao
+import agregacoes
+import regioes
 
 # --- FUNÇÕES AUXILIARES E DE FORMATAÇÃO (sem alterações) ---
 
@@ -40,24 +46,49 @@ def get_numero_loja(nome_loja):
     match = re.match(r"^\d+", nome_loja)
     return int(match.group(0)) if match else None
 
+# Versão dos modelos (layout das planilhas, do PDF e dos e-mails). Incrementar ao mudar o
+# layout: os arquivos guardados no cache de artefatos com a versão anterior deixam de valer.
+VERSAO_MODELOS = 1
+
+FORMATO_DATA_HORA = "YYYY-MM-DD HH:MM:SS"
+
+# O openpyxl e o fpdf só são importados quando um arquivo é gravado: a simulação (--dry-run)
+# e o planejamento dos relatórios não pagam o custo de carregá-los.
+
+@lru_cache(maxsize=None)
+def estilos_excel():
+    """
+    Estilos dos relatórios em Excel. O cabeçalho reproduz o estilo que o pandas aplica
+    (negrito, bordas finas, centralizado) com as cores da empresa por cima.
+    """
+    from openpyxl.styles import PatternFill, Font, Border, Side, Alignment
+    return SimpleNamespace(
+        HEADER_FILL=PatternFill(start_color="e60d25", end_color="e60d25", fill_type="solid"),
+        HEADER_FONT=Font(color="FFFFFF", bold=True),
+        HEADER_BORDER=Border(left=Side(style="thin"), right=Side(style="thin"), top=Side(style="thin"), bottom=Side(style="thin")),
+        HEADER_ALIGNMENT=Alignment(horizontal="center", vertical="top"),
+        EVEN_ROW_FILL=PatternFill(start_color="F2F2F2", end_color="F2F2F2", fill_type="solid"),
+    )
+
+@instrumentacao.medir("formatar_excel")
 def formatar_excel(caminho_arquivo):
+    from openpyxl import load_workbook
+    from openpyxl.utils import get_column_letter
     print(f"Formatando arquivo: {caminho_arquivo}...")
+    estilos = estilos_excel()
     try:
         workbook = load_workbook(caminho_arquivo)
-        header_fill = PatternFill(start_color="e60d25", end_color="e60d25", fill_type="solid")
-        header_font = Font(color="FFFFFF", bold=True)
-        even_row_fill = PatternFill(start_color="F2F2F2", end_color="F2F2F2", fill_type="solid")
 
         for sheet_name in workbook.sheetnames:
             sheet = workbook[sheet_name]
             for row_index, row in enumerate(sheet.iter_rows(), 1):
                 if row_index == 1:
                     for cell in row:
-                        cell.fill = header_fill
-                        cell.font = header_font
+                        cell.fill = estilos.HEADER_FILL
+                        cell.font = estilos.HEADER_FONT
                 elif row_index % 2 == 0:
                     for cell in row:
-                        cell.fill = even_row_fill
+                        cell.fill = estilos.EVEN_ROW_FILL
             
             for column_cells in sheet.columns:
                 max_length = 0
@@ -72,24 +103,321 @@ def formatar_excel(caminho_arquivo):
                 sheet.column_dimensions[column_letter].width = adjusted_width
         
         workbook.save(caminho_arquivo)
+        instrumentacao.anotar(bytes_anexos=os.path.getsize(caminho_arquivo))
         print("Formatação e ajuste de colunas aplicados com sucesso.")
     except Exception as e:
         print(f"Não foi possível formatar o Excel. Erro: {e}")
 
+def _larguras_colunas(df):
+    """Largura de cada coluna (maior texto + 2), calculada de forma vetorizada sobre o DataFrame."""
+    larguras = []
+    for nome_coluna in df.columns:
+        serie = df[nome_coluna]
+        preenchida = serie.notna() & (serie.astype(str) != "")
+        max_length = len(str(nome_coluna))
+        if preenchida.any():
+            max_length = max(max_length, int(serie[preenchida].astype(str).str.len().max()))
+        if not preenchida.all():
+            # Células vazias eram lidas como None pelo ajuste antigo e contavam como 'None'
+            max_length = max(max_length, len("None"))
+        larguras.append(max_length + 2)
+    return larguras
+
+def _celula(nova_celula, valor, fill=None, formato=None):
+    cell = nova_celula(value=valor)
+    if fill is not None:
+        cell.fill = fill
+    if formato is not None:
+        cell.number_format = formato
+    return cell
+
+@instrumentacao.medir("escrever_excel_formatado")
+def escrever_excel_formatado(caminho_arquivo, abas):
+    """
+    Grava as abas (lista de (nome_aba, DataFrame)) já formatadas, em uma única passada e em
+    modo write-only. O resultado é o mesmo de `to_excel` seguido de `formatar_excel`.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.utils import get_column_letter
+    estilos = estilos_excel()
+    workbook = Workbook(write_only=True)
+    for nome_aba, df in abas:
+        sheet = workbook.create_sheet(title=nome_aba)
+        nova_celula = partial(WriteOnlyCell, sheet)
+        for indice, largura in enumerate(_larguras_colunas(df), 1):
+            sheet.column_dimensions[get_column_letter(indice)].width = largura
+
+        cabecalho = []
+        for nome_coluna in df.columns:
+            cell = _celula(nova_celula, str(nome_coluna), estilos.HEADER_FILL)
+            cell.font = estilos.HEADER_FONT
+            cell.border = estilos.HEADER_BORDER
+            cell.alignment = estilos.HEADER_ALIGNMENT
+            cabecalho.append(cell)
+        sheet.append(cabecalho)
+
+        formatos = [FORMATO_DATA_HORA if pd.api.types.is_datetime64_any_dtype(df[c]) else None for c in df.columns]
+        tem_data = any(formatos)
+        valores = df.astype(object).where(df.notna(), None)
+        for row_index, linha in enumerate(valores.itertuples(index=False, name=None), 2):
+            if row_index % 2 == 0:
+                sheet.append([_celula(nova_celula, valor, estilos.EVEN_ROW_FILL, formato) for valor, formato in zip(linha, formatos)])
+            elif tem_data:
+                sheet.append([_celula(nova_celula, valor, formato=formato) if formato else valor for valor, formato in zip(linha, formatos)])
+            else:
+                sheet.append(linha)
+    workbook.save(caminho_arquivo)
+    instrumentacao.anotar(bytes_anexos=os.path.getsize(caminho_arquivo))
+
+# --- ÍNDICE DE PARTIÇÕES (LOJA x CATEGORIA) ---
+
+def indexar_particoes(df):
+    """
+    Agrupa o DataFrame uma única vez por (loja, categoria) e retorna
+    {loja: {categoria: array de posições}}, com as posições em ordem crescente.
+    Os geradores usam essas posições com `iloc`, sem varrer o DataFrame por loja.
+    """
+    grupos = df.groupby(["loja", "categoria"], sort=False, dropna=False, observed=True).indices
+    particoes = {}
+    for (loja, categoria), posicoes in grupos.items():
+        particoes.setdefault(loja, {})[categoria] = posicoes
+    return particoes
+
+def _posicoes_da_loja(categorias_loja):
+    return np.sort(np.concatenate(list(categorias_loja.values())))
+
+def _categorias_validas(categorias_loja):
+    """Categorias preenchidas da loja, na ordem em que aparecem na planilha."""
+    categorias = [cat for cat in categorias_loja if isinstance(cat, str) and cat]
+    return sorted(categorias, key=lambda cat: categorias_loja[cat][0])
+
+# --- TABELA DE ROTEAMENTO DOS COMPRADORES ---
+# Montada a partir do config: número da loja -> região -> comprador da categoria na região.
+# O roteamento é feito linha a linha, então uma categoria com pedidos em PB e em RN gera
+# um relatório para o comprador de cada região.
+
+REGIAO_PB, REGIAO_RN1, REGIAO_RN2 = "PB", "RN1", "RN2"
+CATEGORIA_BEBIDAS = "Bebidas"
+
+def regioes_por_numero_loja():
+    """{número da loja: região}. Uma loja listada em mais de uma região fica na primeira (PB, RN1, RN2)."""
+    por_numero = {}
+    for regiao, lojas in ((REGIAO_PB, regioes.valor("LOJAS_PB")), (REGIAO_RN1, regioes.valor("LOJAS_RN1")), (REGIAO_RN2, regioes.valor("LOJAS_RN2"))):
+        for numero in lojas:
+            por_numero.setdefault(int(numero), regiao)
+    return por_numero
+
+def compradores_por_regiao():
+    """{(região, categoria): e-mail do comprador}. Bebidas no RN é dividida entre RN1 e RN2."""
+    tabela = {(REGIAO_PB, categoria): email for categoria, email in regioes.valor("COMPRADORES_PB_EMAILS").items()}
+    for regiao in (REGIAO_RN1, REGIAO_RN2):
+        tabela.update({(regiao, categoria): email for categoria, email in regioes.valor("COMPRADORES_RN_EMAILS").items() if categoria != CATEGORIA_BEBIDAS})
+        tabela[(regiao, CATEGORIA_BEBIDAS)] = regioes.valor("COMPRADORES_RN_BEBIDAS").get(regiao)
+    return {chave: email for chave, email in tabela.items() if email}
+
+def rotear_compradores(df):
+    """
+    Retorna um DataFrame alinhado a `df` com as colunas 'regiao' e 'comprador' (None quando a
+    linha não tem para quem ir). O número e a região são resolvidos uma vez por loja distinta.
+    """
+    lojas = df["loja"].astype("category")
+    por_numero = regioes_por_numero_loja()
+    regiao_da_loja = {loja: por_numero.get(get_numero_loja(str(loja))) for loja in lojas.cat.categories}
+    regiao = lojas.map(regiao_da_loja).astype(object).where(lojas.notna(), None)
+
+    tabela = compradores_por_regiao()
+    chaves = pd.MultiIndex.from_arrays([regiao.to_numpy(), df["categoria"].astype(object).to_numpy()])
+    comprador = pd.Series(tabela, dtype=object).reindex(chaves).to_numpy() if tabela else np.full(len(df), None)
+    return pd.DataFrame({"regiao": regiao.to_numpy(), "comprador": comprador}, index=df.index).replace({np.nan: None})
+
+def relatorio_sem_comprador(df, rotas):
+    """Resumo (loja, categoria, quantidade, motivo) das linhas sem comprador em `rotas`."""
+    sem_rota = rotas["comprador"].isna()
+    if not sem_rota.any():
+        return pd.DataFrame(columns=["loja", "categoria", "quantidade", "motivo"])
+    regiao_das_linhas = rotas.loc[sem_rota, "regiao"]
+    linhas = []
+    grupos = pd.DataFrame({"loja": df.loc[sem_rota, "loja"].astype(object), "categoria": df.loc[sem_rota, "categoria"].astype(object),
+                           "regiao": regiao_das_linhas}).groupby(["loja", "categoria", "regiao"], dropna=False, sort=True).size()
+    for (loja, categoria, regiao), quantidade in grupos.items():
+        if pd.isna(loja):
+            motivo = "solicitação sem loja"
+        elif pd.isna(regiao):
+            motivo = "loja sem número" if get_numero_loja(str(loja)) is None else "loja fora das regiões PB/RN1/RN2"
+        elif pd.isna(categoria):
+            motivo = "solicitação sem categoria"
+        else:
+            motivo = f"nenhum comprador de '{categoria}' em {regiao}"
+        linhas.append((loja, categoria, int(quantidade), motivo))
+    return pd.DataFrame(linhas, columns=["loja", "categoria", "quantidade", "motivo"])
+
+def agregar(df, data_inicio=None, data_fim=None):
+    """Agregados da rodada (ver `agregacoes`), com o comprador de cada linha resolvido pela tabela de roteamento."""
+    df = ingestao.normalizar_rupturas(df)
+    periodo = (data_inicio, data_fim) if data_inicio is not None else None
+    return agregacoes.calcular_agregados(df, rotear_compradores(df)["comprador"], periodo)
+
+# --- ARTEFATOS (PLANEJAMENTO x CONSTRUÇÃO x ENVIO) ---
+# Cada relatório é planejado no processo principal (fatia dos dados, destinatários e
+# corpo do e-mail) e construído depois, possivelmente em outro processo. Por isso o
+# Artefato carrega só dados serializáveis.
+
+@dataclass
+class Artefato:
+    tipo: str               # 'gerente', 'comprador' ou 'gerencial'
+    chave: str              # loja, categoria ou período do relatório
+    caminho: str
+    destinatarios: list
+    assunto: str
+    corpo_html: str
+    abas: list = None       # [(nome_aba, DataFrame)] das planilhas
+    dados: object = None    # Agregados usados pelo PDF gerencial
+    periodo: tuple = None   # (data_inicio, data_fim) do PDF gerencial
+    linhas: list = None     # linhas da planilha a marcar como enviadas quando o e-mail sair
+    hash: str = None        # chave do conteúdo no cache de artefatos (ver cache_artefatos)
+    anexos: list = None     # arquivos efetivamente enviados, quando o relatório passa do limite (ver preparar_anexos)
+
+def construir_artefato(artefato):
+    """Gera o arquivo do artefato e retorna o caminho (ou None se nada foi gerado)."""
+    if artefato.tipo == "gerencial":
+        data_inicio, data_fim = artefato.periodo
+        return gerar_relatorio_gerencial_pdf(None, os.path.dirname(artefato.caminho), data_inicio, data_fim, agregados=artefato.dados)
+    escrever_excel_formatado(artefato.caminho, artefato.abas)
+    print(f"Arquivo Excel '{artefato.caminho}' gerado.")
+    return artefato.caminho
+
+# --- ANEXOS ACIMA DO LIMITE DO E-MAIL ---
+# O Gmail limita a mensagem a 25 MB já com o anexo em base64 (+33%). Uma planilha maior que
+# ANEXO_MAX_MB é dividida em várias, agrupando abas (categorias ou lojas) até o limite, e cada
+# parte vai em um e-mail. O .xlsx já é um zip comprimido, então não é compactado de novo; os
+# demais anexos (o PDF) são compactados em .zip.
+
+ANEXO_MAX_MB = getattr(config, "EMAIL_ANEXO_MAX_MB", 18)
+
+def compactar_anexo(caminho):
+    """Compacta o arquivo em `<caminho>.zip` (lido e gravado por blocos) e retorna o novo caminho."""
+    caminho_zip = caminho + ".zip"
+    with zipfile.ZipFile(caminho_zip, "w", compression=zipfile.ZIP_DEFLATED) as arquivo_zip:
+        arquivo_zip.write(caminho, arcname=os.path.basename(caminho))
+    return caminho_zip
+
+def _agrupar_abas(abas, tamanho_total, limite_bytes):
+    """Agrupa abas consecutivas cujo tamanho estimado (proporcional às linhas) caiba no limite."""
+    bytes_por_linha = tamanho_total / max(sum(len(df) for _, df in abas), 1)
+    grupos, grupo, estimado = [], [], 0
+    for nome_aba, df in abas:
+        tamanho_aba = len(df) * bytes_por_linha
+        if grupo and estimado + tamanho_aba > limite_bytes * 0.9:
+            grupos.append(grupo)
+            grupo, estimado = [], 0
+        grupo.append((nome_aba, df))
+        estimado += tamanho_aba
+    if grupo:
+        grupos.append(grupo)
+    return grupos
+
+@instrumentacao.medir("preparar_anexos")
+def preparar_anexos(artefato, limite_bytes=None):
+    """
+    Arquivos a enviar para o artefato já construído: o próprio arquivo se couber no limite, senão,
+    para planilhas com várias abas, uma planilha por grupo de abas e, para os demais anexos, a
+    versão compactada.
+    """
+    limite_bytes = limite_bytes or ANEXO_MAX_MB * 1024 * 1024
+    tamanho = os.path.getsize(artefato.caminho)
+    if tamanho <= limite_bytes:
+        return [artefato.caminho]
+
+    base, extensao = os.path.splitext(artefato.caminho)
+    if extensao.lower() != ".xlsx":
+        compactado = compactar_anexo(artefato.caminho)
+        if os.path.getsize(compactado) > limite_bytes:
+            print(f"ATENÇÃO: relatório '{artefato.chave}' continua acima do limite mesmo compactado; o envio pode ser recusado.")
+        else:
+            print(f"Relatório '{artefato.chave}' acima de {limite_bytes / (1024 * 1024):.0f} MB: enviado compactado.")
+        return [compactado]
+    if not artefato.abas or len(artefato.abas) < 2:
+        print(f"ATENÇÃO: relatório '{artefato.chave}' acima do limite e com uma única aba; o envio pode ser recusado.")
+        return [artefato.caminho]
+
+    partes = []
+    for numero, grupo in enumerate(_agrupar_abas(artefato.abas, tamanho, limite_bytes), 1):
+        caminho = f"{base}_parte{numero}{extensao}"
+        escrever_excel_formatado(caminho, grupo)
+        if os.path.getsize(caminho) > limite_bytes:
+            print(f"ATENÇÃO: a parte {numero} do relatório '{artefato.chave}' continua acima do limite; o envio pode ser recusado.")
+        partes.append(caminho)
+    print(f"Relatório '{artefato.chave}' acima de {limite_bytes / (1024 * 1024):.0f} MB: dividido em {len(partes)} partes.")
+    return partes
+
+def enviar_artefato(creds, artefato, enviar_email_func, livro=None):
+    """
+    Envia o artefato a cada destinatário e retorna o que `enviar_email_func` devolveu para cada envio.
+    Se o relatório foi dividido (`artefato.anexos`), cada parte vai em um e-mail "(parte i/n)".
+    Com um livro de envios, e-mails idênticos a um já entregue são suprimidos (retorno None).
+    """
+    anexos = artefato.anexos or [artefato.caminho]
+    retornos = []
+    for destinatario in artefato.destinatarios:
+        for numero, anexo in enumerate(anexos, 1):
+            assunto = artefato.assunto if len(anexos) == 1 else f"{artefato.assunto} (parte {numero}/{len(anexos)})"
+            chave = livro.chave(destinatario, assunto, artefato.corpo_html, artefato.hash) if livro and artefato.hash else None
+            if chave and livro.ja_enviado(chave):
+                print(f"E-mail idêntico já enviado para {destinatario} ('{assunto}'). Envio suprimido.")
+                retornos.append(None)
+                continue
+            retorno = enviar_email_func(creds, destinatario, assunto, artefato.corpo_html, anexo)
+            if chave:
+                livro.registrar_quando_enviado(chave, retorno, destinatario, assunto)
+            retornos.append(retorno)
+    return retornos
+
+def _construir_e_enviar(creds, artefatos, enviar_email_func):
+    for artefato in artefatos:
+        if construir_artefato(artefato):
+            enviar_artefato(creds, artefato, enviar_email_func)
+
 # --- FUNÇÃO DE RELATÓRIO DOS GERENTES (COM SAUDAÇÃO PERSONALIZADA) ---
 
-def gerar_relatorios_gerentes(creds, df, pasta_destino, enviar_email_func):
+def _com_colunas_consolidacao(df, colunas_relatorio, colunas_rename):
+    """Com as solicitações repetidas consolidadas, as planilhas mostram também a quantidade e a última data."""
+    if "quantidade_solicitacoes" not in df.columns:
+        return colunas_relatorio, colunas_rename
+    return (colunas_relatorio + ["quantidade_solicitacoes", "ultimo_timestamp"],
+            {**colunas_rename, "quantidade_solicitacoes": "Solicitações", "ultimo_timestamp": "Última Solicitação"})
+
+@instrumentacao.medir("gerar_relatorios_gerentes")
+def gerar_relatorios_gerentes(creds, df, pasta_destino, enviar_email_func, particoes=None):
+    _construir_e_enviar(creds, planejar_relatorios_gerentes(df, pasta_destino, particoes), enviar_email_func)
+
+@instrumentacao.medir("planejar_relatorios_gerentes")
+def planejar_relatorios_gerentes(df, pasta_destino, particoes=None, agregados=None):
     print("\n--- INICIANDO GERAÇÃO DE RELATÓRIOS POR LOJA ---")
+    artefatos = []
+    if particoes is None:
+        particoes = indexar_particoes(df)
+
+    df = ingestao.normalizar_rupturas(df)
+    if agregados is None:
+        agregados = agregar(df)
+    tratada = df["tratada"].to_numpy()
+    tem_linhas = "original_index" in df.columns
 
-    for loja, email_gerente in config.GERENTES_EMAILS.items():
+    colunas_relatorio = ["timestamp", "nome_solicitante", "categoria", "produto", "tempo_ruptura", "tratativa"]
+    colunas_rename = {"timestamp": "Data Solicitação", "nome_solicitante": "Solicitante", "categoria": "Categoria", "produto": "Produto", "tempo_ruptura": "Tempo de Ruptura", "tratativa": "Tratativa"}
+    colunas_relatorio, colunas_rename = _com_colunas_consolidacao(df, colunas_relatorio, colunas_rename)
+    df_relatorio = df[colunas_relatorio].rename(columns=colunas_rename)
+
+    for loja, email_gerente in regioes.valor("GERENTES_EMAILS").items():
         print(f"\nProcessando loja: {loja}...")
-        df_loja = df[df["loja"] == loja].copy()
+        categorias_loja = particoes.get(loja)
         
-        if df_loja.empty:
+        if not categorias_loja:
             print(f"Nenhum dado encontrado para a loja {loja}. Pulando.")
             continue
 
-        categorias_validas = [cat for cat in df_loja["categoria"].unique() if cat and not pd.isna(cat)]
+        categorias_validas = _categorias_validas(categorias_loja)
 
         if not categorias_validas:
             print(f"Nenhuma categoria válida encontrada para os registros da loja {loja}. Pulando.")
@@ -98,122 +426,160 @@ def gerar_relatorios_gerentes(creds, df, pasta_destino, enviar_email_func):
         destinatario = config.EMAIL_TESTE if config.MODO_TESTE else email_gerente
         nome_gerente = formatar_nome_de_email(email_gerente, apenas_primeiro_nome=True)
         
-        total_rupturas = len(df_loja)
-        
-        # --- INÍCIO DA CORREÇÃO ---
-        # Converte strings vazias para nulo, depois preenche.
-        df_loja['tratativa'] = df_loja['tratativa'].replace('', pd.NA)
-        df_loja["tratativa"] = df_loja["tratativa"].fillna("Sem Tratativa")
-        # --- FIM DA CORREÇÃO ---
-        
-        rupturas_tratadas = len(df_loja[df_loja["tratativa"] != "Sem Tratativa"])
-        divergencias = df_loja[df_loja["tratativa"] == "Verificar Estoque (Divergência)"]
+        posicoes_loja = _posicoes_da_loja(categorias_loja)
+        metricas = agregados.da_loja(loja)
+        total_rupturas = metricas["total"]
+        rupturas_tratadas = metricas["tratadas"]
+        divergencias = agregados.divergencias_por_loja.get(loja, [])
         
         lista_divergencias_html = "<li>Nenhuma divergência apontada.</li>"
-        if not divergencias.empty:
-            lista_divergencias_html = "".join([f"<li>{row.produto} (Cód: {row.codigo_produto})</li>" for _, row in divergencias.iterrows()])
+        if divergencias:
+            lista_divergencias_html = "".join([f"<li>{produto} (Cód: {codigo})</li>" for produto, codigo in divergencias])
         
         corpo_email = f'<html><body><h2>Relatório de Rupturas - {loja}</h2><p>Olá, {nome_gerente},</p><p>Segue o resumo das rupturas identificadas em sua loja:</p><ul><li><b>Total de Rupturas Identificadas:</b> {total_rupturas}</li><li><b>Rupturas com Tratativa:</b> {rupturas_tratadas}</li></ul><hr><h3>Produtos com Tratativa "Verificar Estoque (Divergência)":</h3><ul>{lista_divergencias_html}</ul><hr><p>O relatório completo, com todas as rupturas separadas por categoria, está em anexo.</p><p>Atenciosamente,<br>Equipe Comercial</p></body></html>'
         
         nome_arquivo = criar_nome_arquivo_loja(loja)
         caminho_completo_arquivo = os.path.join(pasta_destino, nome_arquivo)
         
-        with pd.ExcelWriter(caminho_completo_arquivo, engine='openpyxl') as writer:
-            colunas_relatorio = ["timestamp", "nome_solicitante", "categoria", "produto", "tempo_ruptura", "tratativa"]
-            colunas_rename = {"timestamp": "Data Solicitação", "nome_solicitante": "Solicitante", "categoria": "Categoria", "produto": "Produto", "tempo_ruptura": "Tempo de Ruptura", "tratativa": "Tratativa"}
-            
-            for categoria in categorias_validas:
-                df_categoria = df_loja[df_loja["categoria"] == categoria]
-                df_final = df_categoria[colunas_relatorio].rename(columns=colunas_rename)
-                df_final.to_excel(writer, sheet_name=sanitizar_nome_arquivo(str(categoria))[:31], index=False)
-        
-        print(f"Arquivo Excel '{caminho_completo_arquivo}' gerado.")
-        formatar_excel(caminho_completo_arquivo)
-        enviar_email_func(creds, destinatario, f"Relatório de Rupturas - {loja}", corpo_email, caminho_completo_arquivo)
+        abas = [(sanitizar_nome_arquivo(str(categoria))[:31], df_relatorio.iloc[categorias_loja[categoria]]) for categoria in categorias_validas]
+        # Só as rupturas tratadas são marcadas como enviadas; as pendentes voltam no próximo relatório
+        linhas = ingestao.linhas_de_origem(df, posicoes_loja[tratada[posicoes_loja]]) if tem_linhas else None
+        artefatos.append(Artefato("gerente", loja, caminho_completo_arquivo, [destinatario], f"Relatório de Rupturas - {loja}", corpo_email, abas=abas, linhas=linhas))
+
+    return artefatos
 
 # --- FUNÇÃO DE RELATÓRIO DOS COMPRADORES (COM SAUDAÇÃO E CORPO ATUALIZADOS) ---
 
+@instrumentacao.medir("gerar_relatorios_compradores")
 def gerar_relatorios_compradores(creds, df, pasta_destino, enviar_email_func):
+    _construir_e_enviar(creds, planejar_relatorios_compradores(df, pasta_destino), enviar_email_func)
+
+@instrumentacao.medir("planejar_relatorios_compradores")
+def planejar_relatorios_compradores(df, pasta_destino, agregados=None):
+    """
+    Planeja um relatório por (categoria, comprador), com uma aba por loja. O comprador de cada
+    linha vem da tabela de roteamento; as linhas sem comprador são listadas e ficam de fora.
+    """
     print("\n--- INICIANDO GERAÇÃO DE ALERTAS PARA COMPRADORES ---")
-    df_pedidos = df[df["tratativa"] == "Será feito pedido"].copy()
-    if df_pedidos.empty:
+    artefatos = []
+    df = ingestao.normalizar_rupturas(df)
+    posicoes_pedido = np.flatnonzero(df["sera_feito_pedido"].to_numpy())
+    if not len(posicoes_pedido):
         print("Nenhuma ruptura com tratativa 'Será feito pedido' encontrada.")
-        return
+        return artefatos
 
-    pedidos_por_categoria = df_pedidos.groupby('categoria')
+    if agregados is None:
+        agregados = agregar(df)
+    df_pedidos = df.iloc[posicoes_pedido]
+    rotas = rotear_compradores(df_pedidos)
+    sem_comprador = relatorio_sem_comprador(df_pedidos, rotas)
+    if not sem_comprador.empty:
+        print(f"AVISO: {sem_comprador['quantidade'].sum()} pedidos sem comprador definido não serão enviados:")
+        for linha in sem_comprador.itertuples(index=False):
+            print(f"  - {linha.loja} / {linha.categoria}: {linha.quantidade} ({linha.motivo})")
 
-    for categoria, df_categoria in pedidos_por_categoria:
-        print(f"\nProcessando categoria para compradores: {categoria}...")
-        primeira_linha = df_categoria.iloc[0]
-        num_loja_exemplo = get_numero_loja(primeira_linha['loja'])
-        email_comprador = None
-        if not num_loja_exemplo: continue
+    # Um único agrupamento por (categoria, comprador, loja) sobre as linhas roteadas
+    roteadas = rotas["comprador"].notna().to_numpy()
+    posicoes_roteadas = posicoes_pedido[roteadas]
+    chaves = pd.DataFrame({"categoria": df_pedidos["categoria"].to_numpy()[roteadas],
+                           "comprador": rotas["comprador"].to_numpy()[roteadas],
+                           "loja": df_pedidos["loja"].to_numpy()[roteadas]})
+    grupos = chaves.groupby(["categoria", "comprador", "loja"], sort=False, observed=True).indices
+    regioes_roteadas = rotas["regiao"].to_numpy()[roteadas]
 
-        if num_loja_exemplo in config.LOJAS_PB:
-            email_comprador = config.COMPRADORES_PB_EMAILS.get(categoria)
-        elif num_loja_exemplo in config.LOJAS_RN1 or num_loja_exemplo in config.LOJAS_RN2:
-            if categoria == "Bebidas":
-                email_comprador = config.COMPRADORES_RN_BEBIDAS.get("RN1") if num_loja_exemplo in config.LOJAS_RN1 else config.COMPRADORES_RN_BEBIDAS.get("RN2")
-            else:
-                email_comprador = config.COMPRADORES_RN_EMAILS.get(categoria)
+    pedidos = {}
+    for (categoria, email_comprador, loja), indices in grupos.items():
+        pedidos.setdefault((categoria, email_comprador), {})[loja] = posicoes_roteadas[indices]
+    compradores_da_categoria = {}
+    for categoria, email_comprador in pedidos:
+        compradores_da_categoria[categoria] = compradores_da_categoria.get(categoria, 0) + 1
 
-        if not email_comprador:
-            print(f"Nenhum comprador encontrado para a categoria '{categoria}'. Pulando.")
-            continue
+    colunas_relatorio = ["codigo_produto", "produto", "nome_solicitante", "timestamp"]
+    colunas_rename = {"codigo_produto": "Código", "produto": "Produto", "nome_solicitante": "Solicitante", "timestamp": "Data Solicitação"}
+    colunas_relatorio, colunas_rename = _com_colunas_consolidacao(df, colunas_relatorio, colunas_rename)
+    # O código vai para a planilha como texto, como na planilha de origem
+    df_relatorio = df[colunas_relatorio].astype({"codigo_produto": "string"}).rename(columns=colunas_rename)
+
+    for categoria, email_comprador in sorted(pedidos):
+        pedidos_por_loja = pedidos[(categoria, email_comprador)]
+        print(f"\nProcessando categoria para compradores: {categoria} ({email_comprador})...")
 
         destinatario = config.EMAIL_TESTE if config.MODO_TESTE else email_comprador
         
         # *** NOVA LÓGICA: Extrai o primeiro nome do comprador para a saudação ***
         nome_comprador = formatar_nome_de_email(email_comprador, apenas_primeiro_nome=True)
+
+        # Categoria dividida entre compradores: o nome do arquivo leva as regiões de cada um
+        chave, sufixo = categoria, ""
+        if compradores_da_categoria[categoria] > 1:
+            indices = np.concatenate([grupos[(categoria, email_comprador, loja)] for loja in pedidos_por_loja])
+            nomes_regioes = "-".join(sorted(set(regioes_roteadas[indices])))
+            chave, sufixo = f"{categoria} ({nomes_regioes})", f"_{nomes_regioes}"
         
-        nome_arquivo = f"Relatorio_Compras_{sanitizar_nome_arquivo(categoria)}.xlsx"
+        nome_arquivo = f"Relatorio_Compras_{sanitizar_nome_arquivo(categoria)}{sufixo}.xlsx"
         caminho_completo_arquivo = os.path.join(pasta_destino, nome_arquivo)
 
-        with pd.ExcelWriter(caminho_completo_arquivo, engine='openpyxl') as writer:
-            pedidos_por_loja = df_categoria.groupby('loja')
-            for loja, df_loja in pedidos_por_loja:
-                colunas_relatorio = ["codigo_produto", "produto", "nome_solicitante", "timestamp"]
-                colunas_rename = {"codigo_produto": "Código", "produto": "Produto", "nome_solicitante": "Solicitante", "timestamp": "Data Solicitação"}
-                df_loja_final = df_loja[colunas_relatorio].rename(columns=colunas_rename)
-                df_loja_final.to_excel(writer, sheet_name=sanitizar_nome_arquivo(loja)[:31], index=False)
-        
-        print(f"Arquivo Excel '{caminho_completo_arquivo}' gerado para o comprador de '{categoria}'.")
-        formatar_excel(caminho_completo_arquivo)
+        abas = [(sanitizar_nome_arquivo(loja)[:31], df_relatorio.iloc[pedidos_por_loja[loja]]) for loja in sorted(pedidos_por_loja)]
 
         # *** ATUALIZADO: Corpo do e-mail com saudação personalizada e nome da categoria ***
-        corpo_email = f'<html><body><h2>Alerta de Pedido de Compra - Categoria: {categoria}</h2><p>Olá, {nome_comprador},</p><p>Segue em anexo a lista de produtos da categoria <b>{categoria}</b> que precisam de pedido de compra, separados por loja.</p><br><p>Atenciosamente,<br>Equipe Comercial</p></body></html>'
+        total_pedidos, total_lojas = agregados.do_comprador(email_comprador, categoria)
+        corpo_email = f'<html><body><h2>Alerta de Pedido de Compra - Categoria: {categoria}</h2><p>Olá, {nome_comprador},</p><p>Segue em anexo a lista de produtos da categoria <b>{categoria}</b> que precisam de pedido de compra, separados por loja.</p><p><b>{total_pedidos}</b> produto(s) em {total_lojas} loja(s).</p><br><p>Atenciosamente,<br>Equipe Comercial</p></body></html>'
         
-        enviar_email_func(creds, destinatario, f"Alerta de Compra - {categoria}", corpo_email, caminho_completo_arquivo)
+        artefatos.append(Artefato("comprador", chave, caminho_completo_arquivo, [destinatario], f"Alerta de Compra - {categoria}", corpo_email, abas=abas))
+
+    return artefatos
 
-def gerar_relatorio_gerencial_pdf(df, pasta_destino, data_inicio, data_fim):
+@instrumentacao.medir("planejar_relatorio_gerencial")
+def planejar_relatorio_gerencial(df, pasta_destino, data_inicio, data_fim, agregados=None):
+    """
+    Planeja o PDF gerencial e o e-mail para a lista gerencial. Retorna uma lista vazia se não houver dados.
+    O artefato leva só os agregados da rodada e o histórico das execuções anteriores, não as linhas.
+    Com `agregados` (ex.: o consolidado das regiões), `df` pode ser None. Com uma região ativa,
+    o PDF é o da região e o nome dela vai no assunto.
+    """
+    if agregados is None:
+        if df.empty:
+            return []
+        agregados = agregar(df, data_inicio, data_fim)
+    if not agregados.total:
+        return []
+    agregados.periodo = (data_inicio, data_fim)
+    agregados.historico = agregacoes.carregar_historico(periodo_atual=agregados.periodo)
+    regiao = regioes.atual()
+    sufixo = f" ({regiao.nome})" if regiao is not None and regiao.nome else ""
+    assunto = f"Relatório Gerencial de Rupturas{sufixo} - {data_inicio.strftime('%d/%m')} a {data_fim.strftime('%d/%m')}"
+    corpo_html = f"""
+    <html>
+        <body>
+            <p>Prezado(a),</p>
+            <p>Segue em anexo o relatório gerencial consolidado de rupturas, referente ao período de {data_inicio.strftime('%d/%m/%Y')} a {data_fim.strftime('%d/%m/%Y')}.</p>
+            <br>
+            <p>Atenciosamente,<br>Equipe Comercial</p>
+        </body>
+    </html>
+    """
+    destinatarios = [config.EMAIL_TESTE] if config.MODO_TESTE else list(regioes.valor("GERENCIAL_EMAILS"))
+    nome_arquivo = f"Relatorio_Gerencial_{data_inicio.strftime('%Y%m%d')}_{data_fim.strftime('%Y%m%d')}.pdf"
+    return [Artefato("gerencial", nome_arquivo, os.path.join(pasta_destino, nome_arquivo), destinatarios, assunto, corpo_html,
+                     dados=agregados, periodo=(data_inicio, data_fim))]
+
+@instrumentacao.medir("gerar_relatorio_gerencial_pdf")
+def gerar_relatorio_gerencial_pdf(df, pasta_destino, data_inicio, data_fim, agregados=None):
     print("\n--- INICIANDO GERAÇÃO DO RELATÓRIO GERENCIAL PDF ---")
-    if df.empty:
+    if agregados is None and (df is None or df.empty):
         print("DataFrame vazio. Não é possível gerar o relatório gerencial.")
         return
 
-    # 1. Agregação de Dados
-    total_solicitacoes = len(df)
-    
-    # --- INÍCIO DA CORREÇÃO ---
-    # Converte strings vazias para nulo, depois preenche.
-    df['tratativa'] = df['tratativa'].replace('', pd.NA)
-    df["tratativa"] = df["tratativa"].fillna("Sem Tratativa")
-    # --- FIM DA CORREÇÃO ---
-    
-    # Análise por Loja
-    solicitacoes_por_loja = df.groupby('loja').size().reset_index(name='total')
-    tratativas_por_loja = df[df['tratativa'] != 'Sem Tratativa'].groupby('loja').size().reset_index(name='tratadas')
-    
-    # Juntando os dados de loja
-    df_lojas = pd.merge(solicitacoes_por_loja, tratativas_por_loja, on='loja', how='left').fillna(0)
-    df_lojas['tratadas'] = df_lojas['tratadas'].astype(int)
-    
-    # Análise por tipo de Tratativa
-    resumo_tratativas = df['tratativa'].value_counts().reset_index()
-    resumo_tratativas.columns = ['tratativa', 'quantidade']
+    # 1. Agregação de Dados (um único agrupamento; o planejador já manda os agregados prontos)
+    if agregados is None:
+        agregados = agregar(df, data_inicio, data_fim)
+    total_solicitacoes = agregados.total
+    df_lojas = agregados.por_loja
+    resumo_tratativas = agregados.por_tratativa
 
     # 2. Geração do PDF
     # (O restante da função de gerar o PDF continua o mesmo)
+    from fpdf import FPDF
     pdf = FPDF()
     pdf.add_page()
     pdf.set_font("Arial", "B", 16)
@@ -234,10 +600,10 @@ def gerar_relatorio_gerencial_pdf(df, pasta_destino, data_inicio, data_fim):
     pdf.cell(40, 8, "Solicitações", 1, 0, "C")
     pdf.cell(40, 8, "Tratadas", 1, 1, "C")
     pdf.set_font("Arial", "", 10)
-    for index, row in df_lojas.iterrows():
-        pdf.cell(80, 8, row['loja'], 1)
-        pdf.cell(40, 8, str(row['total']), 1, 0, "C")
-        pdf.cell(40, 8, str(row['tratadas']), 1, 1, "C")
+    for loja, total, tratadas in zip(df_lojas['loja'], df_lojas['total'], df_lojas['tratadas']):
+        pdf.cell(80, 8, loja, 1)
+        pdf.cell(40, 8, str(total), 1, 0, "C")
+        pdf.cell(40, 8, str(tratadas), 1, 1, "C")
     pdf.ln(10)
     
     pdf.set_font("Arial", "B", 12)
@@ -246,13 +612,31 @@ def gerar_relatorio_gerencial_pdf(df, pasta_destino, data_inicio, data_fim):
     pdf.cell(120, 8, "Tratativa", 1, 0, "C")
     pdf.cell(40, 8, "Quantidade", 1, 1, "C")
     pdf.set_font("Arial", "", 10)
-    for index, row in resumo_tratativas.iterrows():
-        pdf.cell(120, 8, row['tratativa'], 1)
-        pdf.cell(40, 8, str(row['quantidade']), 1, 1, "C")
+    for tratativa, quantidade in zip(resumo_tratativas['tratativa'], resumo_tratativas['quantidade']):
+        pdf.cell(120, 8, tratativa, 1)
+        pdf.cell(40, 8, str(quantidade), 1, 1, "C")
+
+    # Evolução: execuções anteriores gravadas pelo motor de agregação
+    if agregados.historico:
+        pdf.ln(10)
+        pdf.set_font("Arial", "B", 12)
+        pdf.cell(0, 10, "Evolução das Últimas Execuções:", 0, 1)
+        pdf.set_font("Arial", "B", 10)
+        pdf.cell(80, 8, "Período", 1, 0, "C")
+        pdf.cell(40, 8, "Solicitações", 1, 0, "C")
+        pdf.cell(40, 8, "% Tratadas", 1, 1, "C")
+        pdf.set_font("Arial", "", 10)
+        for registro in agregados.historico:
+            inicio, fim = (datetime.fromisoformat(data).strftime('%d/%m/%Y') if data else "?" for data in registro["periodo"])
+            percentual = 100 * registro["tratadas"] / registro["total"] if registro["total"] else 0
+            pdf.cell(80, 8, f"{inicio} a {fim}", 1)
+            pdf.cell(40, 8, str(registro["total"]), 1, 0, "C")
+            pdf.cell(40, 8, f"{percentual:.0f}%", 1, 1, "C")
     
     nome_arquivo = f"Relatorio_Gerencial_{data_inicio.strftime('%Y%m%d')}_{data_fim.strftime('%Y%m%d')}.pdf"
     caminho_completo = os.path.join(pasta_destino, nome_arquivo)
     pdf.output(caminho_completo)
+    instrumentacao.anotar(bytes_anexos=os.path.getsize(caminho_completo))
     print(f"Relatório Gerencial PDF '{caminho_completo}' gerado com sucesso.")
     
     return caminho_completo
\ No newline at end of file
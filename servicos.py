@@ -0,0 +1,97 @@
+# servicos.py
+
+import threading
+import time
+import config
+
+# --- CLIENTES DAS APIS DO GOOGLE ---
+# Um cliente por API e por conjunto de credenciais, criado na primeira chamada e reaproveitado
+# nas seguintes (no modo daemon, em todas as rodadas). Os clientes são montados com o documento
+# de descoberta que acompanha o googleapiclient (static_discovery), sem buscá-lo na rede, e o
+# googleapiclient só é importado quando o primeiro cliente é criado.
+#
+# Todas as chamadas de uma API passam pelo mesmo orçamento de requisições por minuto, não importa
+# de qual thread (ou região) venham, para que o processamento em paralelo não estoure a cota do Google.
+LIMITES_POR_MINUTO = getattr(config, "LIMITE_REQUISICOES_POR_MINUTO", {"sheets": 60, "gmail": 150})
+
+_clientes = {}
+_limites = {}
+_classes_requisicao = {}
+_trava = threading.Lock()
+
+
+class LimiteRequisicoes:
+    """Balde de fichas: até `por_minuto` requisições por minuto, com rajadas de até `por_minuto`."""
+
+    def __init__(self, por_minuto):
+        self.por_minuto = por_minuto
+        self._fichas = float(por_minuto)
+        self._ultima = time.monotonic()
+        self._trava = threading.Lock()
+
+    def aguardar(self):
+        """Consome uma ficha, esperando a reposição quando o orçamento do minuto acabou."""
+        while True:
+            with self._trava:
+                agora = time.monotonic()
+                self._fichas = min(self.por_minuto, self._fichas + (agora - self._ultima) * self.por_minuto / 60)
+                self._ultima = agora
+                if self._fichas >= 1:
+                    self._fichas -= 1
+                    return
+                espera = (1 - self._fichas) * 60 / self.por_minuto
+            time.sleep(espera)
+
+
+def limite(api):
+    """Orçamento compartilhado da `api` (None quando a API não tem limite configurado)."""
+    por_minuto = LIMITES_POR_MINUTO.get(api)
+    if not por_minuto:
+        return None
+    with _trava:
+        if api not in _limites:
+            _limites[api] = LimiteRequisicoes(por_minuto)
+        return _limites[api]
+
+
+def _classe_requisicao(api):
+    """Subclasse de HttpRequest que passa pelo orçamento da `api` antes de cada execução."""
+    with _trava:
+        if api not in _classes_requisicao:
+            from googleapiclient.http import HttpRequest
+
+            class RequisicaoLimitada(HttpRequest):
+                def execute(self, *args, **kwargs):
+                    orcamento = limite(api)
+                    if orcamento is not None:
+                        orcamento.aguardar()
+                    return super().execute(*args, **kwargs)
+
+            _classes_requisicao[api] = RequisicaoLimitada
+        return _classes_requisicao[api]
+
+
+def construir_cliente(api, versao, creds):
+    """Constrói o cliente da API a partir do documento de descoberta embutido no googleapiclient."""
+    from googleapiclient.discovery import build
+    return build(api, versao, credentials=creds, static_discovery=True, cache_discovery=False,
+                 requestBuilder=_classe_requisicao(api))
+
+
+def servico(api, versao, creds, por_thread=False):
+    """
+    Cliente da `api` para estas credenciais. Com `por_thread`, cada thread recebe o seu próprio
+    cliente (necessário para usar a API em paralelo, pois o httplib2 não é thread-safe).
+    """
+    chave = (api, versao, id(creds), threading.get_ident() if por_thread else None)
+    entrada = _clientes.get(chave)
+    # O id pode ser reutilizado por outras credenciais depois que as antigas forem liberadas
+    if entrada is None or entrada[0] is not creds:
+        entrada = _clientes[chave] = (creds, construir_cliente(api, versao, creds))
+    return entrada[1]
+
+
+def limpar():
+    """Descarta os clientes criados e os orçamentos (ex.: ao trocar de credenciais ou nos benchmarks)."""
+    _clientes.clear()
+    _limites.clear()
@@ -0,0 +1,27 @@
+# tests/conftest.py
+
+import os
+import sys
+
+import pytest
+
+# Os módulos do projeto ficam na raiz do repositório e importam `config`, que não é versionado:
+# os testes usam o mesmo config sintético dos benchmarks (nenhum e-mail real é usado)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import dados_sinteticos  # noqa: E402
+
+dados_sinteticos.instalar_config(6, 3, ".cache_planilha")
+
+
+@pytest.fixture(autouse=True)
+def pasta_temporaria(tmp_path, monkeypatch):
+    """Cada teste roda numa pasta vazia: cache da planilha, diário e relatórios não vazam entre testes."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def erro_http(status):
+    import httplib2
+    from googleapiclient.errors import HttpError
+    return HttpError(httplib2.Response({"status": status}), b"erro")
@@ -0,0 +1,114 @@
+# tests/test_agregacoes.py
+
+import json
+import os
+from datetime import datetime
+
+import agregacoes
+import ingestao
+from benchmarks.dados_sinteticos import CABECALHO
+
+
+def linha(loja, categoria, tratativa=""):
+    return ["01/10/2025 08:00:00", "x@exemplo.com", "Ana", loja, categoria, "123", "Produto", "1 a 3 dias", "", "", "", tratativa, ""]
+
+
+def montar(linhas):
+    header = list(CABECALHO)
+    return ingestao.montar_dataframe(header, ingestao.linhas_para_colunas(header, linhas))
+
+
+def gravar_execucao(inicio, fim, total, gerado_em=None):
+    """Grava no histórico os agregados de uma execução do período (inicio, fim), datas 'AAAA-MM-DD'."""
+    os.makedirs(agregacoes.PASTA_AGREGADOS, exist_ok=True)
+    gerado_em = gerado_em or f"{fim}T10:00:00"
+    nome = f"agregados_{gerado_em.replace('-', '').replace(':', '').replace('T', '_')}.json"
+    with open(os.path.join(agregacoes.PASTA_AGREGADOS, nome), "w", encoding="utf-8") as arquivo:
+        json.dump({"gerado_em": gerado_em, "periodo": [f"{inicio}T10:00:00", f"{fim}T10:00:00"], "total": total}, arquivo)
+
+
+def periodos(historico):
+    return [tuple(data[:10] for data in registro["periodo"]) for registro in historico]
+
+
+def test_calcular_agregados_em_um_unico_agrupamento():
+    df = montar([
+        linha("01 - Loja 1", "Bebidas", "Será feito pedido"),
+        linha("01 - Loja 1", "Bebidas", "Verificar Estoque (Divergência)"),
+        linha("01 - Loja 1", "Mercearia"),
+        linha("02 - Loja 2", "Bebidas", "Será feito pedido"),
+    ])
+
+    agregados = agregacoes.calcular_agregados(df)
+
+    assert agregados.total == 4
+    assert agregados.da_loja("01 - Loja 1") == {"total": 3, "tratadas": 2, "divergencias": 1, "pedidos": 1}
+    assert agregados.da_loja("03 - Loja 3") == {"total": 0, "tratadas": 0, "divergencias": 0, "pedidos": 0}
+    por_categoria = agregados.por_categoria.set_index("categoria")
+    assert por_categoria.loc["Bebidas", "pedidos"] == 2 and por_categoria.loc["Mercearia", "total"] == 1
+    assert dict(zip(agregados.por_tratativa["tratativa"], agregados.por_tratativa["quantidade"])) == {
+        "Será feito pedido": 2, "Verificar Estoque (Divergência)": 1, ingestao.SEM_TRATATIVA: 1}
+    assert agregados.divergencias_por_loja == {"01 - Loja 1": [("Produto", 123)]}
+
+
+def test_combinar_soma_as_regioes():
+    a = agregacoes.calcular_agregados(montar([linha("01 - Loja 1", "Bebidas", "Será feito pedido")]))
+    b = agregacoes.calcular_agregados(montar([linha("02 - Loja 2", "Bebidas"), linha("02 - Loja 2", "Mercearia")]))
+
+    consolidado = agregacoes.combinar([a, None, b])
+
+    assert consolidado.total == 3
+    assert consolidado.por_loja["loja"].tolist() == ["01 - Loja 1", "02 - Loja 2"]
+    assert consolidado.por_categoria.set_index("categoria").loc["Bebidas", "total"] == 2
+    assert agregacoes.combinar([None]) is None
+
+
+def test_historico_mantem_janelas_semanais_consecutivas():
+    # Execuções semanais "últimos 7 dias": cada janela começa no dia em que a anterior terminou
+    gravar_execucao("2025-01-06", "2025-01-13", 10)
+    gravar_execucao("2025-01-13", "2025-01-20", 20)
+    gravar_execucao("2025-01-20", "2025-01-27", 30)
+    atual = (datetime(2025, 1, 27, 10), datetime(2025, 2, 3, 10))
+
+    historico = agregacoes.carregar_historico(periodo_atual=atual)
+
+    assert periodos(historico) == [("2025-01-06", "2025-01-13"), ("2025-01-13", "2025-01-20"), ("2025-01-20", "2025-01-27")]
+    assert [registro["total"] for registro in historico] == [10, 20, 30]
+
+
+def test_historico_deixa_de_fora_o_periodo_atual_e_as_janelas_sobrepostas():
+    gravar_execucao("2025-01-06", "2025-01-13", 10)
+    gravar_execucao("2025-01-13", "2025-01-20", 20)
+    # Execução manual de um mês inteiro: sobrepõe-se às semanais e fica de fora
+    gravar_execucao("2024-12-27", "2025-01-27", 99, gerado_em="2025-01-27T09:00:00")
+    # Primeira execução do período atual (a de agora é a segunda)
+    gravar_execucao("2025-01-20", "2025-01-27", 30)
+    atual = (datetime(2025, 1, 20, 10), datetime(2025, 1, 27, 11))
+
+    historico = agregacoes.carregar_historico(periodo_atual=atual)
+
+    assert periodos(historico) == [("2025-01-06", "2025-01-13"), ("2025-01-13", "2025-01-20")]
+
+
+def test_historico_conta_uma_vez_cada_periodo_e_respeita_o_limite():
+    gravar_execucao("2025-01-06", "2025-01-13", 10)
+    gravar_execucao("2025-01-06", "2025-01-13", 11, gerado_em="2025-01-13T18:00:00")
+    gravar_execucao("2025-01-13", "2025-01-20", 20)
+    gravar_execucao("2025-01-20", "2025-01-27", 30)
+
+    historico = agregacoes.carregar_historico()
+    assert [registro["total"] for registro in historico] == [11, 20, 30]
+
+    assert [registro["total"] for registro in agregacoes.carregar_historico(limite=2)] == [20, 30]
+
+
+def test_salvar_e_carregar_historico():
+    agregados = agregacoes.calcular_agregados(montar([linha("01 - Loja 1", "Bebidas", "Será feito pedido")]),
+                                              periodo=(datetime(2025, 1, 6, 10), datetime(2025, 1, 13, 10)))
+
+    agregacoes.salvar(agregados)
+    historico = agregacoes.carregar_historico(periodo_atual=(datetime(2025, 1, 13, 10), datetime(2025, 1, 20, 10)))
+
+    assert periodos(historico) == [("2025-01-06", "2025-01-13")]
+    assert historico[0]["total"] == 1 and historico[0]["tratadas"] == 1
+    assert historico[0]["por_loja"][0]["loja"] == "01 - Loja 1"
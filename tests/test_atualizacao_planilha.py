@@ -0,0 +1,156 @@
+# tests/test_atualizacao_planilha.py
+
+import threading
+
+import pytest
+from googleapiclient.errors import HttpError
+
+import atualizacao_planilha
+import diario_envios
+from benchmarks.dados_sinteticos import CABECALHO
+from benchmarks.falsos import PlanilhaFalsa
+from conftest import erro_http
+
+
+def planilha_vazia(num_linhas):
+    linhas = [list(CABECALHO)] + [[f"01/10/2025 10:{indice % 60:02d}:00"] + [""] * 13 for indice in range(num_linhas)]
+    return PlanilhaFalsa(linhas)
+
+
+def status_da_planilha(planilha):
+    return {numero: linha[12] for numero, linha in enumerate(planilha.linhas[1:], 2) if len(linha) > 12 and linha[12]}
+
+
+class PlanilhaComFalha(PlanilhaFalsa):
+    """Falha com HTTP 500 no batchUpdate de número `falhar_em` (a partir de 1)."""
+
+    def __init__(self, linhas, falhar_em):
+        super().__init__(linhas)
+        self.falhar_em = falhar_em
+        self.atualizacoes = 0
+
+    def batchUpdate(self, spreadsheetId, body):
+        self.atualizacoes += 1
+        if self.atualizacoes == self.falhar_em:
+            raise erro_http(500)
+        return super().batchUpdate(spreadsheetId, body)
+
+
+def test_agrupar_intervalos_junta_linhas_consecutivas_com_o_mesmo_status():
+    status = {5: "A", 2: "A", 3: "A", 4: "B", 7: "A", 8: "A"}
+    assert atualizacao_planilha.agrupar_intervalos(status) == [(2, 3, "A"), (4, 4, "B"), (5, 5, "A"), (7, 8, "A")]
+
+
+def test_dividir_em_lotes_quebra_bloco_que_atravessa_o_limite():
+    blocos = [(2, 4, "A"), (10, 16, "B"), (20, 20, "A")]
+    lotes = atualizacao_planilha.dividir_em_lotes(blocos, max_celulas=5)
+
+    assert lotes == [
+        [(2, 4, "A"), (10, 11, "B")],
+        [(12, 16, "B")],
+        [(20, 20, "A")],
+    ]
+    # Nenhum lote passa do limite e nenhuma linha se perde ou se repete
+    assert all(sum(fim - inicio + 1 for inicio, fim, _ in lote) <= 5 for lote in lotes)
+    linhas = [linha for lote in lotes for inicio, fim, _ in lote for linha in range(inicio, fim + 1)]
+    assert linhas == [2, 3, 4] + list(range(10, 17)) + [20]
+
+
+def test_dividir_em_lotes_bloco_maior_que_varios_lotes():
+    lotes = atualizacao_planilha.dividir_em_lotes([(2, 13, "A")], max_celulas=4)
+    assert lotes == [[(2, 5, "A")], [(6, 9, "A")], [(10, 13, "A")]]
+
+
+def test_escrever_status_grava_intervalos_contiguos():
+    planilha = planilha_vazia(10)
+    status = {linha: "Enviado em 01/10" for linha in (2, 3, 4, 7, 8)}
+
+    total = atualizacao_planilha.escrever_status(planilha, status, "M")
+
+    assert total == 5
+    assert status_da_planilha(planilha) == status
+    assert planilha.chamadas == [("batchUpdate", 2)]
+
+
+def test_falha_no_meio_registra_o_que_foi_gravado_e_a_retomada_grava_so_o_resto():
+    planilha = PlanilhaComFalha(planilha_vazia(12).linhas, falhar_em=2)
+    diario = diario_envios.DiarioEnvios()
+    status = {linha: "Enviado em 01/10" for linha in range(2, 12)}
+    diario.registrar_enviadas({linha: f"2025-10-01T10:{linha:02d}:00" for linha in status}, "Enviado em 01/10")
+
+    with pytest.raises(HttpError):
+        atualizacao_planilha.escrever_status(planilha, status, "M", diario, max_celulas=4)
+
+    # Só o primeiro lote (linhas 2-5) chegou à planilha e saiu do diário
+    assert sorted(status_da_planilha(planilha)) == [2, 3, 4, 5]
+    pendentes = diario.pendentes()
+    assert sorted(pendentes) == list(range(6, 12))
+
+    # Uma nova execução (diário relido do disco) marca só as linhas pendentes
+    diario = diario_envios.DiarioEnvios()
+    diario.compactar()
+    pendentes = diario.pendentes()
+    total = atualizacao_planilha.escrever_status(planilha, {linha: info["status"] for linha, info in pendentes.items()},
+                                                 "M", diario, max_celulas=4)
+
+    assert total == 6
+    assert status_da_planilha(planilha) == status
+    assert diario.pendentes() == {}
+
+
+def test_diario_ignora_ultima_linha_truncada():
+    diario = diario_envios.DiarioEnvios()
+    diario.registrar_enviadas({2: "2025-10-01T10:00:00", 3: "2025-10-01T10:10:00"}, "Enviado")
+    diario.registrar_marcadas([2])
+    with open(diario.caminho, "a", encoding="utf-8") as arquivo:
+        arquivo.write('{"evento": "marcadas", "linhas": [3')
+
+    assert diario_envios.DiarioEnvios().pendentes() == {3: {"status": "Enviado", "timestamp": "2025-10-01T10:10:00"}}
+
+
+
+class LockComRegistroConcorrente:
+    """Lock do diário que, ao ser liberado pela primeira vez, deixa outra thread registrar um envio."""
+
+    def __init__(self, diario, linhas):
+        self._lock = threading.Lock()
+        self.diario = diario
+        self.linhas = linhas
+
+    def __enter__(self):
+        self._lock.acquire()
+
+    def __exit__(self, *exc):
+        self._lock.release()
+        if self.linhas:
+            linhas, self.linhas = self.linhas, None
+            registro = threading.Thread(target=self.diario.registrar_enviadas, args=(linhas, "Enviado"))
+            registro.start()
+            registro.join()
+
+
+def test_registro_feito_durante_a_compactacao_nao_se_perde():
+    diario = diario_envios.DiarioEnvios()
+    diario.registrar_enviadas({2: "2025-10-01T10:00:00"}, "Enviado")
+    # Um envio (callback de outra thread) é registrado assim que a compactação solta o lock pela primeira vez
+    diario._lock = LockComRegistroConcorrente(diario, {3: "2025-10-01T10:10:00"})
+
+    diario.compactar()
+
+    assert sorted(diario.pendentes()) == [2, 3]
+
+
+def test_despachadas_do_daemon_sobrevivem_a_compactacao_ate_a_linha_ser_marcada():
+    diario = diario_envios.DiarioEnvios()
+    diario.registrar_despachadas({2: "Sem Tratativa", 3: "Sem Tratativa", 4: "Será feito pedido"})
+    diario.registrar_despachadas({3: "Será feito pedido"})
+
+    assert diario_envios.DiarioEnvios().despachadas() == {(2, "Sem Tratativa"), (3, "Sem Tratativa"),
+                                                          (3, "Será feito pedido"), (4, "Será feito pedido")}
+
+    # A execução normal marca a linha 3: ela sai do registro do daemon; as demais ficam
+    diario.registrar_marcadas([3])
+    diario.compactar()
+
+    assert diario_envios.DiarioEnvios().despachadas() == {(2, "Sem Tratativa"), (4, "Será feito pedido")}
+    assert diario.pendentes() == {}
@@ -0,0 +1,109 @@
+# tests/test_consolidacao.py
+
+import ingestao
+from benchmarks.dados_sinteticos import CABECALHO
+
+
+def linha(carimbo, nome, loja, categoria, codigo, tratativa="", produto="Produto"):
+    return [carimbo, "x@exemplo.com", nome, loja, categoria, codigo, produto, "1 a 3 dias", "", "", "", tratativa, ""]
+
+
+def montar(linhas, normalizar=True):
+    header = list(CABECALHO)
+    df = ingestao.montar_dataframe(header, ingestao.linhas_para_colunas(header, linhas))
+    return ingestao.normalizar_rupturas(df) if normalizar else df
+
+
+def test_chave_normaliza_zeros_a_esquerda_caixa_e_espacos():
+    df = montar([
+        linha("01/10/2025 08:00:00", "Ana", "01 - Loja 1", "Bebidas", "00123"),
+        linha("01/10/2025 09:00:00", "Bruno", " 01 - LOJA 1 ", "bebidas ", "123"),
+        linha("01/10/2025 10:00:00", "Carla", "01 - Loja 1", "Bebidas", "124"),
+    ])
+
+    consolidado = ingestao.consolidar_repetidas(df)
+
+    assert len(consolidado) == 2
+    assert consolidado["quantidade_solicitacoes"].tolist() == [2, 1]
+    assert consolidado["linhas_origem"].tolist() == [[2, 3], [4]]
+
+
+def test_linhas_sem_loja_ou_sem_codigo_nao_sao_consolidadas():
+    df = montar([
+        linha("01/10/2025 08:00:00", "Ana", "01 - Loja 1", "Bebidas", ""),
+        linha("01/10/2025 09:00:00", "Bruno", "01 - Loja 1", "Bebidas", ""),
+        linha("01/10/2025 10:00:00", "Carla", "", "Bebidas", "500"),
+        linha("01/10/2025 11:00:00", "Davi", "", "Bebidas", "500"),
+    ])
+
+    consolidado = ingestao.consolidar_repetidas(df)
+
+    # Sem repetições consolidáveis, o DataFrame volta como está
+    assert consolidado is df
+
+
+def test_registro_consolidado_leva_datas_solicitantes_e_a_tratativa_preenchida_mais_recente():
+    df = montar([
+        linha("01/10/2025 08:00:00", "Ana", "01 - Loja 1", "Bebidas", "123", tratativa="Será feito pedido"),
+        linha("03/10/2025 08:00:00", "Ana", "01 - Loja 1", "Bebidas", "123", tratativa="Verificar Estoque (Divergência)"),
+        linha("02/10/2025 08:00:00", "Bruno", "01 - Loja 1", "Bebidas", "123"),
+        linha("04/10/2025 08:00:00", "Carla", "01 - Loja 1", "Bebidas", "123", produto="Produto novo"),
+    ])
+
+    registro = ingestao.consolidar_repetidas(df).iloc[0]
+
+    assert str(registro["timestamp"]) == "2025-10-01 08:00:00"
+    assert str(registro["ultimo_timestamp"]) == "2025-10-04 08:00:00"
+    assert registro["quantidade_solicitacoes"] == 4
+    assert registro["nome_solicitante"] == "Ana, Bruno, Carla"
+    # A última solicitação veio sem tratativa: vale a preenchida mais recente
+    assert registro["tratativa"] == "Verificar Estoque (Divergência)"
+    assert registro["tratada"] and registro["divergencia"] and not registro["sera_feito_pedido"]
+    # As demais colunas vêm da solicitação mais recente; 'original_index' é a primeira
+    assert registro["produto"] == "Produto novo"
+    assert registro["original_index"] == 2
+    assert sorted(registro["linhas_origem"]) == [2, 3, 4, 5]
+
+
+def test_linhas_de_origem_expande_as_linhas_consolidadas_para_a_marcacao():
+    df = montar([
+        linha("01/10/2025 08:00:00", "Ana", "01 - Loja 1", "Bebidas", "123"),
+        linha("01/10/2025 09:00:00", "Bruno", "02 - Loja 2", "Bebidas", "200", tratativa="Será feito pedido"),
+        linha("01/10/2025 10:00:00", "Carla", "01 - Loja 1", "Bebidas", "123", tratativa="Será feito pedido"),
+        linha("01/10/2025 11:00:00", "Davi", "03 - Loja 3", "Bebidas", "300"),
+    ])
+
+    consolidado = ingestao.consolidar_repetidas(df)
+
+    # A primeira solicitação não tinha tratativa, mas a do grupo tem: as duas linhas são marcadas
+    assert sorted(ingestao.linhas_de_origem(consolidado, consolidado["tratada"].to_numpy())) == [2, 3, 4]
+    assert sorted(ingestao.linhas_de_origem(consolidado)) == [2, 3, 4, 5]
+    # Sem consolidação, vale o 'original_index' de cada linha
+    assert ingestao.linhas_de_origem(df, df["tratada"].to_numpy()) == [3, 4]
+
+
+def test_consolidacao_sem_normalizacao_previa():
+    df = montar([
+        linha("01/10/2025 08:00:00", "Ana", "01 - Loja 1", "Bebidas", "123", tratativa="Será feito pedido"),
+        linha("01/10/2025 09:00:00", "Bruno", "01 - Loja 1", "Bebidas", "123"),
+    ], normalizar=False)
+
+    consolidado = ingestao.consolidar_repetidas(df)
+
+    assert len(consolidado) == 1
+    assert consolidado["tratativa"].iloc[0] == "Será feito pedido"
+    assert "tratada" not in consolidado.columns
+
+
+def test_ordem_da_planilha_mantida_com_linhas_sem_codigo():
+    df = montar([
+        linha("01/10/2025 08:00:00", "Ana", "01 - Loja 1", "Bebidas", "123"),
+        linha("01/10/2025 09:00:00", "Bruno", "01 - Loja 1", "Bebidas", ""),
+        linha("01/10/2025 10:00:00", "Carla", "01 - Loja 1", "Bebidas", "123"),
+        linha("01/10/2025 11:00:00", "Davi", "02 - Loja 2", "Bebidas", "200"),
+    ])
+
+    consolidado = ingestao.consolidar_repetidas(df)
+
+    assert consolidado["original_index"].tolist() == [2, 3, 5]
+    assert consolidado["linhas_origem"].tolist() == [[2, 4], [3], [5]]
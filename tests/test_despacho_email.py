@@ -0,0 +1,126 @@
+# tests/test_despacho_email.py
+
+import threading
+import time
+from email.header import decode_header, make_header
+
+import despacho_email
+from conftest import erro_http
+
+
+def despachante(transporte, max_tentativas=4):
+    return despacho_email.DespachanteEmail(transporte, max_workers=2, max_tentativas=max_tentativas, espera_base=0)
+
+
+def test_repete_em_429_e_5xx_ate_enviar():
+    transporte = despacho_email.TransporteFalso(erros=[erro_http(429), erro_http(503)])
+
+    with despachante(transporte) as envios:
+        resultado = envios.enviar(None, "ana@exemplo.com", "Assunto", "<p>Olá</p>").result()
+
+    assert resultado.sucesso
+    assert resultado.tentativas == 3
+    assert resultado.erro is None
+    assert resultado.id_mensagem == "falso-1"
+    assert len(transporte.enviadas) == 1
+
+
+def test_desiste_na_primeira_tentativa_em_erro_4xx():
+    transporte = despacho_email.TransporteFalso(erros=[erro_http(400)])
+
+    with despachante(transporte) as envios:
+        resultado = envios.enviar(None, "ana@exemplo.com", "Assunto", "<p>Olá</p>").result()
+
+    assert not resultado.sucesso
+    assert resultado.tentativas == 1
+    assert resultado.erro
+    assert transporte.enviadas == []
+
+
+def test_desiste_quando_as_tentativas_acabam():
+    transporte = despacho_email.TransporteFalso(erros=[erro_http(500)] * 5)
+
+    with despachante(transporte, max_tentativas=3) as envios:
+        resultado = envios.enviar(None, "ana@exemplo.com", "Assunto", "<p>Olá</p>").result()
+
+    assert not resultado.sucesso
+    assert resultado.tentativas == 3
+    assert resultado.erro
+    # O transporte ainda guardava erros: nada foi enviado além das três tentativas
+    assert len(transporte.erros) == 2
+    assert transporte.enviadas == []
+
+
+def test_aguardar_retorna_um_resultado_por_destinatario_na_ordem_dos_pedidos(tmp_path):
+    anexo = tmp_path / "relatorio.xlsx"
+    anexo.write_bytes(b"conteudo do anexo")
+    transporte = despacho_email.TransporteFalso(erros=[erro_http(400)])
+    destinatarios = ["ana@exemplo.com", "bruno@exemplo.com", "carla@exemplo.com"]
+
+    envios = despachante(transporte)
+    for para in destinatarios:
+        envios.enviar(None, para, f"Relatório {para}", "<p>Olá</p>", str(anexo))
+    resultados = envios.encerrar()
+
+    assert [r.destinatario for r in resultados] == destinatarios
+    assert all(r.anexo == str(anexo) for r in resultados)
+    # O único erro (4xx) derruba exatamente um envio, sem nova tentativa
+    assert sorted(r.sucesso for r in resultados) == [False, True, True]
+    assert sum(r.tentativas for r in resultados) == 3
+    assert sorted(r.id_mensagem for r in resultados if r.sucesso) == ["falso-1", "falso-2"]
+
+    enviados = {m["To"]: m for m in transporte.enviadas}
+    for r in resultados:
+        if r.sucesso:
+            assert str(make_header(decode_header(enviados[r.destinatario]["Subject"]))) == f"Relatório {r.destinatario}"
+            assert [p.get_filename() for p in enviados[r.destinatario].walk() if p.get_filename()] == ["relatorio.xlsx"]
+        else:
+            assert r.destinatario not in enviados
+
+
+class TransporteLento(despacho_email.TransporteFalso):
+    """Só aceita os envios depois que `liberar` for sinalizado."""
+
+    def __init__(self):
+        super().__init__()
+        self.liberar = threading.Event()
+
+    def enviar(self, arquivo):
+        self.liberar.wait(timeout=5)
+        return super().enviar(arquivo)
+
+
+def test_lotes_no_mesmo_despachante_esperam_so_os_seus_envios():
+    transporte = TransporteLento()
+    with despachante(transporte) as envios:
+        lote_a = despacho_email.LoteEnvios(envios)
+        lote_b = despacho_email.LoteEnvios(envios)
+        for para in ("ana@exemplo.com", "bruno@exemplo.com"):
+            lote_a.enviar(None, para, "Região A", "<p>Olá</p>")
+        lote_b.enviar(None, "carla@exemplo.com", "Região B", "<p>Olá</p>")
+        transporte.liberar.set()
+
+        resultados_b = lote_b.aguardar()
+        resultados_a = lote_a.aguardar()
+
+        assert [r.destinatario for r in resultados_a] == ["ana@exemplo.com", "bruno@exemplo.com"]
+        assert [r.destinatario for r in resultados_b] == ["carla@exemplo.com"]
+        assert envios.aguardar() == []
+
+
+def test_aguardar_retorna_depois_dos_callbacks_dos_envios():
+    transporte = TransporteLento()
+    registrados = []
+
+    def registrar_no_diario(futuro):
+        time.sleep(0.1)
+        registrados.append(futuro.result().destinatario)
+
+    with despachante(transporte) as envios:
+        futuro = envios.enviar(None, "ana@exemplo.com", "Assunto", "<p>Olá</p>")
+        futuro.add_done_callback(registrar_no_diario)
+        transporte.liberar.set()
+
+        envios.aguardar([futuro])
+
+        assert registrados == ["ana@exemplo.com"]